@@ -1,12 +1,14 @@
 from PySide6.QtWidgets import QMainWindow
 
-from model.alchemy.session import OneTimeSessionProvider
+from model.alchemy.install import install
+from model.alchemy.session import ThreadAffineSessionProvider
 
 from controllers import PSWithViewMixin
 from controllers.player import PSPlayerController
 from controllers.songs import PSSongsController
 
 from services.song import PSSongService
+from services.song.write import PSSongWriteService
 from indexers.song import SongsIndexer
 
 
@@ -24,10 +26,18 @@ class PSFrontEndProblems(QMainWindow, PSWithViewMixin):
         self.set_styles()
 
         # services
-        session_provider = OneTimeSessionProvider("db.db")
-        songs_index = SongsIndexer()
+        self.session_provider = ThreadAffineSessionProvider("db.db")
+        install(self.session_provider.engine)
+        # songs of a few pages around the visible one are kept for scrolling back
+        songs_index = SongsIndexer(retain=500)
 
-        self.song_service = PSSongService(session_provider, songs_index)
+        self.song_service = PSSongService(self.session_provider, songs_index)
+        self.song_writer = PSSongWriteService(
+            self.session_provider,
+            songs_index,
+            self.song_service.executor
+        )
+        self.song_service.writer = self.song_writer
 
         # sub-controllers
         self.songs = PSSongsController(self.song_service)
@@ -44,4 +54,13 @@ class PSFrontEndProblems(QMainWindow, PSWithViewMixin):
         self.setWindowTitle("m ^_^ m")
         self.show()
 
+    def closeEvent(self, event):
+        # changes waiting in the queue are written before connections are closed
+        self.song_writer.drain()
+        # streams wait for the GUI thread to consume chunks, they are cancelled
+        # before the GUI thread is blocked
+        self.song_service.dispose()
+        self.song_service.executor.wait_for_done(5000)
+        self.session_provider.dispose()
+        super().closeEvent(event)
 
@@ -37,7 +37,8 @@ class PSSongsController(QObject, PSWithViewMixin):
                 duration=None
             ),
             self.got_song_list,
-            self.song_error
+            self.song_error,
+            supersede=True
         )
 
     def song_error(self, err):
@@ -47,6 +48,6 @@ class PSSongsController(QObject, PSWithViewMixin):
         print(type(entity))
         print(type(entity.artist))
 
-    def got_song_list(self, result):
+    def got_song_list(self, result, song_list):
         print(result)
-        print(len(result))
\ No newline at end of file
+        print(len(result), song_list.size)
\ No newline at end of file
@@ -1,10 +1,11 @@
 from os import path
-from typing import Optional
+from typing import Optional, Union
 
 from PySide6.QtCore import QObject, Signal
 
 from controllers import PSWithViewMixin
 from model.view_models.song import PSSongModel
+from model.view_models.compact import CompactViewModel, PSCompactModelAdapter
 
 
 class SongDetails(QObject, PSWithViewMixin):
@@ -17,7 +18,7 @@ class SongDetails(QObject, PSWithViewMixin):
         self.install_gui()
         self.set_styles()
 
-        self.__model: Optional[PSSongModel] = None
+        self.__model: Optional[Union[PSSongModel, PSCompactModelAdapter]] = None
         self.__model.updated.connect(self.update_view)
 
     @property
@@ -25,7 +26,9 @@ class SongDetails(QObject, PSWithViewMixin):
         return self.__model
 
     @model.setter
-    def model(self, value):
+    def model(self, value: Union[PSSongModel, CompactViewModel]):
+        if isinstance(value, CompactViewModel):
+            value = PSCompactModelAdapter(value)
         if self.__model is not None:
             self.__model.updated.disconnect(self.update_view)
 
@@ -1,12 +1,6 @@
-from random import randint, choice
-from sqlalchemy import create_engine
+from model.alchemy.install import sqlite_engine, install
 
-from model.alchemy.tables import *
 
+engine = sqlite_engine('db.db', echo=1)
 
-engine = create_engine(
-    f'sqlite:///db.db',
-    echo=1
-)
-
-Base.metadata.create_all(engine)
\ No newline at end of file
+install(engine)
@@ -1,13 +1,35 @@
 from abc import ABC, abstractmethod
-from typing import Any, TypeVar, Generic, Hashable, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import (
+    Any, Dict, TypeVar, Generic, Hashable, Iterable, List, Optional, Tuple
+)
 from weakref import WeakValueDictionary
 
+from utils.memory import approximate_size
+
 SourceType = TypeVar("SourceType")
 ResultType = TypeVar("ResultType")
 KeyType = TypeVar("KeyType", bound=Hashable)
 Default = TypeVar("Default")
 
 
+@dataclass(slots=True)
+class BulkAddResult(Generic[ResultType]):
+    """
+    Result of AbstractIndexer.add_many
+    fields:
+        objects: objects from the index in order of data source objects
+        created: number of objects created
+        updated: number of existing objects that were changed
+        unchanged: number of existing objects that already had the same values
+    """
+    objects: List[ResultType] = field(default_factory=list)
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
 class AbstractIndexer(ABC, Generic[KeyType, SourceType, ResultType]):
     """
     Abstract Generic Indexer object. Have already implemented dictionary-like behaviour:
@@ -34,14 +56,41 @@ class AbstractIndexer(ABC, Generic[KeyType, SourceType, ResultType]):
         update_object: function that when given a data source object and
             value from the index will update value from index to represent
             that data source object
+    may implement methods:
+        source_fields: values that fields of the object from the index should
+            have for a data source object, when implemented existing object is
+            updated only if some of them differ and only with those fields
+        update_fields: sets changed fields on the object from the index,
+            by default sets them as attributes
     implemented methods:
         exists: checks if there is an object in the index that corresponds to provided
             data source one
         get: dictionary-like method that returns an object by id or default if there is no such object
         add: adds an object to the index
+        add_many: adds objects to the index, returns them with counts
+            of created, updated and unchanged ones
+        source_size: approximate bytes of the object created from data source,
+            may be overridden for better estimation
+        release: drops strong references to retained objects
+
+    Index keeps objects only while they are used somewhere else. With retain or
+    retain_bytes set, recently added or got objects are also kept by the indexer
+    itself (least recently used are released first), so object that is dropped
+    and needed again soon, e.g. when list is scrolled back, is reused instead of
+    created again.
+        retain: maximum number of retained objects
+        retain_bytes: maximum approximate size of retained objects
+    properties:
+        retained_count: number of retained objects
+        retained_bytes: approximate size of retained objects
     """
-    def __init__(self):
+    def __init__(self, retain: Optional[int] = None, retain_bytes: Optional[int] = None):
         self.__index = WeakValueDictionary()
+        self.__retain = retain
+        self.__retain_bytes = retain_bytes
+        # object and its approximate size, least recently used first
+        self.__retained: OrderedDict[KeyType, Tuple[ResultType, int]] = OrderedDict()
+        self.__retained_bytes = 0
 
     @abstractmethod
     def obtain_id(self, obj: SourceType) -> KeyType: ...
@@ -53,20 +102,110 @@ class AbstractIndexer(ABC, Generic[KeyType, SourceType, ResultType]):
     def update_object(self, old_obj: ResultType, new_obj: SourceType) -> None:
         ...
 
+    @property
+    def retained_count(self) -> int:
+        return len(self.__retained)
+
+    @property
+    def retained_bytes(self) -> int:
+        return self.__retained_bytes
+
+    def source_fields(self, obj: SourceType) -> Optional[Dict[str, Any]]:
+        return None
+
+    def update_fields(self, old_obj: ResultType, changes: Dict[str, Any]) -> None:
+        for name, value in changes.items():
+            setattr(old_obj, name, value)
+
+    def source_size(self, obj: SourceType) -> int:
+        return approximate_size(obj)
+
     def exists(self, obj: SourceType) -> bool:
         return self.obtain_id(obj) in self.__index
 
     def __getitem__(self, item: KeyType) -> ResultType:
-        return self.__index[item]
+        result = self.__index[item]
+        self.__touch(item)
+        return result
 
     def get(self, item: KeyType, default: Optional[Default] = None) -> ResultType | Default | None:
-        return self.__index.get(item, default)
+        result = self.__index.get(item)
+        if result is None:
+            return default
+        self.__touch(item)
+        return result
 
     def add(self, item: SourceType) -> ResultType:
-        if self.exists(item):
-            result = self[self.obtain_id(item)]
-            self.update_object(result, item)
-        else:
-            result = self.create_object(item)
-            self.__index[self.obtain_id(item)] = result
+        result, _ = self.__add(item)
         return result
+
+    def add_many(self, items: Iterable[SourceType]) -> BulkAddResult[ResultType]:
+        """
+        Adds data source objects, e.g. a page of a list, existing objects
+        are compared with the data source ones and only changed are updated,
+        so adding the same page again does not touch objects at all
+        :param items: data source objects
+        :return: objects from the index with counts
+        """
+        result = BulkAddResult()
+        for item in items:
+            obj, status = self.__add(item)
+            result.objects.append(obj)
+            if status == "created":
+                result.created += 1
+            elif status == "updated":
+                result.updated += 1
+            else:
+                result.unchanged += 1
+        return result
+
+    def __add(self, item: SourceType) -> Tuple[ResultType, str]:
+        key = self.obtain_id(item)
+        result = self.__index.get(key)
+        if result is None:
+            result = self.create_object(item)
+            self.__index[key] = result
+            status = "created"
+        else:
+            status = self.__update(result, item)
+        self.__retain_object(key, result, item)
+        return result, status
+
+    def __update(self, result: ResultType, item: SourceType) -> str:
+        fields = self.source_fields(item)
+        if fields is None:
+            self.update_object(result, item)
+            return "updated"
+        changes = {
+            name: value
+            for name, value in fields.items()
+            if getattr(result, name) != value
+        }
+        if not changes:
+            return "unchanged"
+        self.update_fields(result, changes)
+        return "updated"
+
+    def release(self) -> None:
+        self.__retained.clear()
+        self.__retained_bytes = 0
+
+    def __touch(self, key: KeyType) -> None:
+        if key in self.__retained:
+            self.__retained.move_to_end(key)
+
+    def __retain_object(self, key: KeyType, result: ResultType, item: SourceType) -> None:
+        if self.__retain is None and self.__retain_bytes is None:
+            return
+        size = self.source_size(item) if self.__retain_bytes is not None else 0
+        previous = self.__retained.pop(key, None)
+        if previous is not None:
+            self.__retained_bytes -= previous[1]
+        self.__retained[key] = (result, size)
+        self.__retained_bytes += size
+        while self.__retained and (
+            self.__retain is not None and len(self.__retained) > self.__retain
+            or self.__retain_bytes is not None and self.__retained_bytes > self.__retain_bytes
+        ):
+            _, (_, size) = self.__retained.popitem(last=False)
+            self.__retained_bytes -= size
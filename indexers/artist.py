@@ -11,5 +11,6 @@ class ArtistsIndexer(AbstractIndexer[int, SongDetailsTransport, PSSongModel]):
     def create_object(self, obj: SongDetailsTransport) -> PSSongModel:
         return PSSongModel(obj)
 
-    def update_object(self, obj: SongDetailsTransport, model: PSSongModel):
-        model.set_from_transport(obj)
+    def update_object(self, model: PSSongModel, obj: SongDetailsTransport):
+        with model.update():
+            model.set_from_transport(obj)
@@ -1,15 +1,72 @@
+from typing import Any, Dict, Optional
+
 from indexers import AbstractIndexer
 
-from model.view_models.song import PSSongModel
+from model.view_models import PSModelChangeCoalescer
+from model.view_models.compact import PSModelNotifier
+from model.view_models.song import PSSongModel, CompactSongModel
 from model.transport_items.db.basic import SongDetailsTransport
 
 
 class SongsIndexer(AbstractIndexer[int, SongDetailsTransport, PSSongModel]):
+    """
+    Index of song view models
+        coalescer: when set, models created by the indexer notify it about
+            their changes, so views can handle changes of a page at once
+    """
+    def __init__(
+        self,
+        coalescer: Optional[PSModelChangeCoalescer] = None,
+        retain: Optional[int] = None,
+        retain_bytes: Optional[int] = None
+    ):
+        super().__init__(retain, retain_bytes)
+        self.coalescer = coalescer
+
     def obtain_id(self, obj: SongDetailsTransport) -> int:
         return obj.id
 
     def create_object(self, obj: SongDetailsTransport) -> PSSongModel:
-        return PSSongModel(obj)
+        model = PSSongModel(obj)
+        model.coalescer = self.coalescer
+        return model
+
+    def update_object(self, model: PSSongModel, obj: SongDetailsTransport):
+        with model.update():
+            model.set_from_transport(obj)
+
+    def source_fields(self, obj: SongDetailsTransport) -> Dict[str, Any]:
+        return PSSongModel.transport_fields(obj)
+
+    def update_fields(self, model: PSSongModel, changes: Dict[str, Any]) -> None:
+        with model.update():
+            for name, value in changes.items():
+                setattr(model, name, value)
+
+
+class CompactSongsIndexer(AbstractIndexer[int, SongDetailsTransport, CompactSongModel]):
+    """
+    Index of compact song view models, for big collections of songs
+        notifier: shared by all models of the index, emits ids of changed songs
+    """
+    def __init__(self, retain: Optional[int] = None, retain_bytes: Optional[int] = None):
+        super().__init__(retain, retain_bytes)
+        self.notifier = PSModelNotifier()
+
+    def obtain_id(self, obj: SongDetailsTransport) -> int:
+        return obj.id
+
+    def create_object(self, obj: SongDetailsTransport) -> CompactSongModel:
+        return CompactSongModel(obj, self.notifier)
+
+    def update_object(self, model: CompactSongModel, obj: SongDetailsTransport):
+        with model.update():
+            model.set_from_transport(obj)
+
+    def source_fields(self, obj: SongDetailsTransport) -> Dict[str, Any]:
+        return PSSongModel.transport_fields(obj)
 
-    def update_object(self, obj: SongDetailsTransport, model: PSSongModel):
-        model.set_from_transport(obj)
+    def update_fields(self, model: CompactSongModel, changes: Dict[str, Any]) -> None:
+        with model.update():
+            for name, value in changes.items():
+                setattr(model, name, value)
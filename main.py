@@ -6,4 +6,11 @@ from controllers.main import PSFrontEndProblems
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     ex = PSFrontEndProblems()
-    sys.exit(app.exec())
+    if ex.song_service.is_async:
+        from PySide6 import QtAsyncio
+
+        # Qt event loop is driven through asyncio loop, so coroutine
+        # tasks run on the GUI thread along with Qt events
+        QtAsyncio.run(handle_sigint=True)
+    else:
+        sys.exit(app.exec())
@@ -0,0 +1,101 @@
+"""
+Asyncio session provider for SQLAlchemy.
+Coexists with providers from model.alchemy.session: sync providers are used
+by tasks running in worker threads, async providers by coroutine tasks
+multiplexed on the Qt event loop thread (see tasks.db.aio).
+Requires aiosqlite driver.
+
+Classes:
+    AbstractAsyncSessionProvider: Abstract class for async session provider
+    AsyncSessionProvider: Provider with long-lived async engine
+"""
+from typing import Optional, Type, Union
+from contextlib import asynccontextmanager
+from abc import ABC, abstractmethod
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from model.alchemy.install import sqlite_async_engine, EngineProfile
+
+
+class AbstractAsyncSessionProvider(ABC):
+    """
+    Abstract class of async session provider.
+    On call works as async context manager: yields a new AsyncSession,
+    commits it on success, rolls back on error and closes it afterwards,
+    error is raised further.
+    Every call gets its own session, so provider is safe to share between
+    concurrently running coroutines.
+
+    provider should implement the following methods:
+        create_session: creates and returns AsyncSession
+        event_target: class of sync sessions behind the provider
+            AsyncSessions, target for SQLAlchemy session events, so
+            listeners see only sessions of this provider
+    """
+
+    @abstractmethod
+    def create_session(self) -> AsyncSession: ...
+
+    @property
+    @abstractmethod
+    def event_target(self) -> Type[Session]: ...
+
+    @asynccontextmanager
+    async def __call__(self, *args, **kwargs):
+        session = self.create_session()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+class AsyncSessionProvider(AbstractAsyncSessionProvider):
+    """
+    Keeps one async engine for the whole life of the application,
+    every task gets a short-lived AsyncSession from it
+
+    fields:
+        engine: engine shared by all sessions of the provider
+        event_target: class of sync sessions of the provider
+    methods:
+        dispose: close pooled connections, should be awaited on
+            application exit
+    """
+    def __init__(
+        self,
+        file_name: str,
+        debug: Optional[bool] = False,
+        profile: Union[str, EngineProfile] = "interactive"
+    ):
+        if debug:
+            self.__engine = sqlite_async_engine(file_name, profile, echo=True)
+        else:
+            self.__engine = sqlite_async_engine(file_name, profile)
+        # own subclass, session events are not shared with other providers
+        self.__sync_session_class = type("AsyncProviderSession", (Session,), {})
+        self.__session_factory = async_sessionmaker(
+            self.__engine,
+            autoflush=True,
+            expire_on_commit=False,
+            sync_session_class=self.__sync_session_class
+        )
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self.__engine
+
+    @property
+    def event_target(self) -> Type[Session]:
+        return self.__sync_session_class
+
+    def create_session(self) -> AsyncSession:
+        return self.__session_factory()
+
+    async def dispose(self) -> None:
+        await self.__engine.dispose()
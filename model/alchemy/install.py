@@ -1,22 +1,223 @@
 """
 This module is used to install the tables in the database.
 
+Classes:
+    EngineProfile: Set of SQLite pragmas and logging options for an engine
+Items:
+    ENGINE_PROFILES: Named engine profiles (interactive, bulk_load, readonly)
+    MIGRATIONS: Ordered schema migrations, position + 1 is schema version
+    SCHEMA_VERSION: Schema version of the current code
 Functions:
     sqlite_engine: Create a sqlite engine
-    install: Create tables in the database
+    sqlite_async_engine: Create an asyncio sqlite engine (requires aiosqlite)
+    install: Create tables in the database and bring them to SCHEMA_VERSION
+    schema_version: Read schema version recorded in the database
+    migrate: Apply migrations missing in the database
 """
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Union, Callable
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, Connection
 
 from model.alchemy.tables import *
 
 
-def sqlite_engine(file_name: str):
-    return create_engine(
+@dataclass(frozen=True, slots=True)
+class EngineProfile:
+    """
+    Set of SQLite pragmas applied to every new DBAPI connection of
+    an engine and logging options of the engine.
+    Any pragma set to None is left with SQLite default value.
+
+    fields:
+        journal_mode: journal mode (WAL lets readers work alongside writer)
+        synchronous: how often SQLite waits for data to reach the disk
+        cache_size: page cache size, negative value is size in KiB
+        mmap_size: bytes of the database file to access via memory mapping
+        temp_store: where temporary tables and indices are kept
+        query_only: forbid any changes to the database
+        echo: statement logging, False, True or "debug"
+    """
+    journal_mode: Optional[str] = "WAL"
+    synchronous: Optional[str] = "NORMAL"
+    cache_size: Optional[int] = -16_000
+    mmap_size: Optional[int] = 256 * 1024 * 1024
+    temp_store: Optional[str] = "MEMORY"
+    query_only: bool = False
+    echo: Union[bool, str] = False
+
+    def pragmas(self) -> List[str]:
+        """
+        :return: PRAGMA statements to execute on each new connection
+        """
+        values = {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+            "temp_store": self.temp_store,
+            "query_only": "ON" if self.query_only else None
+        }
+        return [
+            f"PRAGMA {name} = {value}"
+            for name, value in values.items()
+            if value is not None
+        ]
+
+
+ENGINE_PROFILES: Dict[str, EngineProfile] = {
+    # GUI reads and rare small writes
+    "interactive": EngineProfile(),
+    # mass inserts (mocking, imports): skip fsyncs, bigger cache
+    "bulk_load": EngineProfile(
+        synchronous="OFF",
+        cache_size=-256_000,
+        mmap_size=None
+    ),
+    # reads only, bigger memory map
+    "readonly": EngineProfile(
+        mmap_size=1024 * 1024 * 1024,
+        query_only=True
+    ),
+}
+
+
+def _apply_profile(engine: Engine, profile: EngineProfile) -> None:
+    """
+    Registers connect-event listener applying profile pragmas
+    :param Engine engine: engine to configure
+    :param EngineProfile profile: profile to apply
+    :return: None
+    """
+    pragmas = profile.pragmas()
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def sqlite_engine(
+    file_name: str,
+    profile: Union[str, EngineProfile] = "interactive",
+    **kwargs
+):
+    """
+    Create a sqlite engine for the database file
+    :param str file_name: path to the database file
+    :param str | EngineProfile profile: name of the profile from
+        ENGINE_PROFILES or profile itself
+    :param kwargs: extra keyword arguments passed to `create_engine`
+        (pool configuration etc.)
+    :return: Engine
+    """
+    if isinstance(profile, str):
+        profile = ENGINE_PROFILES[profile]
+    kwargs.setdefault("echo", profile.echo)
+    engine = create_engine(
         f'sqlite:///{file_name}',
-        echo=1
+        **kwargs
     )
+    _apply_profile(engine, profile)
+    return engine
+
+
+def _song_library_indexes(connection: Connection) -> None:
+    """
+    Migration 1: secondary indexes used by song list filters and sortings
+    """
+    names = {
+        "ix_songs_artist_id", "ix_songs_file_id", "ix_songs_name",
+        "ix_song_tags_tag_id", "ix_song_genres_genre_id",
+        "ix_song_files_duration"
+    }
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+    connection.exec_driver_sql("ANALYZE")
 
 
-def install(engine):
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    _song_library_indexes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection: Connection) -> int:
+    """
+    Schema version is kept in SQLite user_version header field
+    :param Connection connection: connection to the database
+    :return: int - version, 0 for databases never migrated
+    """
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine: Engine) -> int:
+    """
+    Applies migrations the database has not seen yet, tables and data
+    are kept in place. Missing tables are created first, so a fresh
+    database gets them along with indexes of the current code.
+    Each migration is applied in its own transaction together with
+    the version bump: pysqlite does not begin transactions before DDL
+    and PRAGMA statements, so the connection is switched to driver
+    autocommit and BEGIN / COMMIT are issued explicitly.
+    :param Engine engine: engine of the database to migrate
+    :return: int - schema version after migration
+    """
     Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        current = schema_version(connection)
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            connection.exec_driver_sql("BEGIN")
+            try:
+                MIGRATIONS[version - 1](connection)
+                connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+            except Exception:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+    return max(current, SCHEMA_VERSION)
+
+
+def sqlite_async_engine(
+    file_name: str,
+    profile: Union[str, EngineProfile] = "interactive",
+    **kwargs
+):
+    """
+    Create an asyncio sqlite engine (aiosqlite driver) for the database file,
+    profile pragmas are applied same way as for sqlite_engine
+    :param str file_name: path to the database file
+    :param str | EngineProfile profile: name of the profile from
+        ENGINE_PROFILES or profile itself
+    :param kwargs: extra keyword arguments passed to `create_async_engine`
+    :return: AsyncEngine
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if isinstance(profile, str):
+        profile = ENGINE_PROFILES[profile]
+    kwargs.setdefault("echo", profile.echo)
+    engine = create_async_engine(
+        f'sqlite+aiosqlite:///{file_name}',
+        **kwargs
+    )
+    _apply_profile(engine.sync_engine, profile)
+    return engine
+
+
+def install(engine: Engine) -> int:
+    """
+    Creates missing tables and applies missing migrations,
+    should be called on application start
+    :param Engine engine: engine of the database
+    :return: int - schema version of the database
+    """
+    return migrate(engine)
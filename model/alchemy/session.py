@@ -6,22 +6,33 @@ of it. Objects in this module designed to work with Qt (PySide6) application.
 Classes:
     AbstractSessionProvider: Abstract class for session provider
     OneTimeSessionProvider: Basic implementation of session provider
+    PooledSessionProvider: Session provider with long-lived engine and
+        bounded connection pool
+    ThreadAffineSessionProvider: Pooled session provider that keeps
+        separate session for each worker thread
+    PoolStats: Snapshot of the connection pool usage
 """
-from typing import Optional
+from time import perf_counter
+from threading import Lock, local
+from typing import Optional, Union
+from dataclasses import dataclass
 from contextlib import contextmanager
 from abc import ABC, abstractmethod
 
+from sqlalchemy import event
 from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm.session import Session
 
-from model.alchemy.install import sqlite_engine
+from model.alchemy.install import sqlite_engine, EngineProfile
 
 
 class AbstractSessionProvider(ABC):
     """
     Abstract class of session provider.
-    On call works as context manager.
+    On call works as context manager: session is committed on success,
+    rolled back on error and closed afterwards, error is raised further.
 
     provider should implement the following methods:
         create_session: creates and returns
@@ -29,6 +40,10 @@ class AbstractSessionProvider(ABC):
             be used in a separate tread)
         close: close session
         error: rollback session on error
+        commit: commit session after successful task
+        event_target: sessionmaker of the provider sessions, target
+            for SQLAlchemy session events, so listeners see only
+            sessions of this provider
     """
 
     @abstractmethod
@@ -40,12 +55,21 @@ class AbstractSessionProvider(ABC):
     @abstractmethod
     def error(self) -> None: ...
 
+    @abstractmethod
+    def commit(self) -> None: ...
+
+    @property
+    @abstractmethod
+    def event_target(self) -> sessionmaker: ...
+
     @contextmanager
     def __call__(self, *args, **kwargs):
         try:
             yield self.create_session()
-        except Exception as e:
+            self.commit()
+        except Exception:
             self.error()
+            raise
         finally:
             self.close()
 
@@ -55,18 +79,32 @@ class OneTimeSessionProvider(AbstractSessionProvider):
     Barbaric way to create and drop all machinery around session
     on each request
     """
-    def __init__(self, file_name: str, debug: Optional[bool] = False):
+    def __init__(
+        self,
+        file_name: str,
+        debug: Optional[bool] = False,
+        profile: Union[str, EngineProfile] = "interactive"
+    ):
         self.__connection: Optional[Connection] = None
         self.__session: Optional[Session] = None
         self.__engine: Optional[Engine] = None
         self.__file_name = file_name
         self.__debug = debug
+        self.__profile = profile
+        self.__session_factory = sessionmaker(autocommit=False, autoflush=True)
+
+    @property
+    def event_target(self) -> sessionmaker:
+        return self.__session_factory
 
     def create_session(self) -> Session:
-        self.__engine = sqlite_engine(self.__file_name)
+        if self.__debug:
+            self.__engine = sqlite_engine(self.__file_name, self.__profile, echo=True)
+        else:
+            self.__engine = sqlite_engine(self.__file_name, self.__profile)
         self.__connection = self.__engine.connect()
         self.__session = scoped_session(
-            sessionmaker(autocommit=False, autoflush=True, bind=self.__engine)
+            lambda: self.__session_factory(bind=self.__engine)
         )
         return self.__session
 
@@ -81,3 +119,193 @@ class OneTimeSessionProvider(AbstractSessionProvider):
     def error(self) -> None:
         if self.__session is not None:
             self.__session.rollback()
+
+    def commit(self) -> None:
+        if self.__session is not None:
+            self.__session.commit()
+
+
+@dataclass(slots=True)
+class PoolStats:
+    """
+    Snapshot of connection pool usage
+        size: number of connections the pool keeps open
+        checked_out: number of connections currently in use
+        overflow: number of connections opened above pool size
+        connects: number of DBAPI connections opened during provider life
+        checkouts: number of connections taken from the pool
+        waits: number of checkouts that had to wait for a free connection
+        wait_time: total time spent waiting for a free connection, seconds
+    """
+    size: int
+    checked_out: int
+    overflow: int
+    connects: int
+    checkouts: int
+    waits: int
+    wait_time: float
+
+
+class PooledSessionProvider(AbstractSessionProvider):
+    """
+    Keeps one engine with a bounded connection pool for the whole life
+    of the application. Each task gets a short-lived session bound to
+    a connection checked out from the pool, on close connection is
+    returned to the pool instead of being thrown away. Session and
+    connection are kept per thread, so tasks running simultaneously
+    in worker threads may share the provider.
+
+    Engine pragmas and logging are taken from the engine profile
+    (see model.alchemy.install.ENGINE_PROFILES), debug forces
+    statement logging on.
+
+    fields:
+        engine: engine shared by all sessions of the provider
+        event_target: sessionmaker of the provider sessions
+        stats: PoolStats snapshot of the pool usage
+    methods:
+        dispose: close all pooled connections, should be called on
+            application exit
+    """
+    def __init__(
+        self,
+        file_name: str,
+        pool_size: int = 5,
+        max_overflow: int = 5,
+        pool_timeout: float = 30,
+        debug: Optional[bool] = False,
+        profile: Union[str, EngineProfile] = "interactive"
+    ):
+        # session and connection of the task running in the thread
+        self.__local = local()
+        self.__max_overflow = max_overflow
+        engine_options = dict(
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout
+        )
+        if debug:
+            engine_options["echo"] = True
+        self.__engine: Engine = sqlite_engine(file_name, profile, **engine_options)
+        self.__session_factory = sessionmaker(autocommit=False, autoflush=True)
+
+        self.__stats_lock = Lock()
+        self.__connects = 0
+        self.__checkouts = 0
+        self.__waits = 0
+        self.__wait_time = 0.0
+        event.listen(self.__engine.pool, "connect", self.__on_connect)
+        event.listen(self.__engine.pool, "checkout", self.__on_checkout)
+
+    @property
+    def engine(self) -> Engine:
+        return self.__engine
+
+    @property
+    def event_target(self) -> sessionmaker:
+        return self.__session_factory
+
+    @property
+    def stats(self) -> PoolStats:
+        pool = self.__engine.pool
+        with self.__stats_lock:
+            return PoolStats(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                connects=self.__connects,
+                checkouts=self.__checkouts,
+                waits=self.__waits,
+                wait_time=self.__wait_time
+            )
+
+    def __on_connect(self, dbapi_connection, connection_record) -> None:
+        with self.__stats_lock:
+            self.__connects += 1
+
+    def __on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self.__stats_lock:
+            self.__checkouts += 1
+
+    def __exhausted(self) -> bool:
+        pool = self.__engine.pool
+        return pool.checkedout() >= pool.size() + self.__max_overflow
+
+    def _checkout_connection(self) -> Connection:
+        """
+        Takes connection from the pool, counts wait if the pool
+        was exhausted at the moment of the checkout
+        :return: Connection
+        """
+        waits = self.__exhausted()
+        started = perf_counter()
+        connection = self.__engine.connect()
+        if waits:
+            with self.__stats_lock:
+                self.__waits += 1
+                self.__wait_time += perf_counter() - started
+        return connection
+
+    def create_session(self) -> Session:
+        self.__local.connection = self._checkout_connection()
+        self.__local.session = self.__session_factory(bind=self.__local.connection)
+        return self.__local.session
+
+    def close(self) -> None:
+        session = getattr(self.__local, "session", None)
+        if session is not None:
+            session.close()
+            self.__local.session = None
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+
+    def error(self) -> None:
+        session = getattr(self.__local, "session", None)
+        if session is not None:
+            session.rollback()
+
+    def commit(self) -> None:
+        session = getattr(self.__local, "session", None)
+        if session is not None:
+            session.commit()
+
+    def dispose(self) -> None:
+        self.close()
+        self.__engine.dispose()
+
+
+class ThreadAffineSessionProvider(PooledSessionProvider):
+    """
+    Pooled session provider that keeps sessions in a scoped_session
+    registry. Every worker thread gets its own session (thread-local
+    registry) bound to its own pooled connection, so commit, rollback
+    and close of one task never touch session of another one.
+    Session is removed from the registry on close, so next task executed
+    by the same worker thread starts with a fresh session.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__local = local()
+        self.__registry = scoped_session(self.event_target)
+
+    def create_session(self) -> Session:
+        self.__local.connection = self._checkout_connection()
+        return self.__registry(bind=self.__local.connection)
+
+    def close(self) -> None:
+        self.__registry.remove()
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+
+    def error(self) -> None:
+        if self.__registry.registry.has():
+            self.__registry.rollback()
+
+    def commit(self) -> None:
+        if self.__registry.registry.has():
+            self.__registry.commit()
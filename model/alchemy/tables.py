@@ -1,10 +1,12 @@
 """
 This module contains the SQLAlchemy table definitions for the database schema.
+Secondary indexes are declared next to the tables, existing databases get them
+with migrations from model.alchemy.install.
 """
 from __future__ import annotations
 from typing import List
 
-from sqlalchemy import Column, Integer, String, Boolean, Text, Table, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Text, Table, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from model.alchemy import Base
@@ -14,14 +16,18 @@ song_genres = Table(
     "song_genres",
     Base.metadata,
     Column("song_id", Integer, ForeignKey("songs.id"), primary_key=True),
-    Column("genre_id", Integer, ForeignKey("genres.id"), primary_key=True)
+    Column("genre_id", Integer, ForeignKey("genres.id"), primary_key=True),
+    # primary key covers song -> genres, this one covers genre -> songs
+    Index("ix_song_genres_genre_id", "genre_id", "song_id")
 )
 
 
 song_tags = Table(
     "song_tags", Base.metadata,
     Column("song_id", Integer, ForeignKey("songs.id"), primary_key=True),
-    Column("tag_id", Integer, ForeignKey("tags.id"), primary_key=True)
+    Column("tag_id", Integer, ForeignKey("tags.id"), primary_key=True),
+    # primary key covers song -> tags, this one covers tag -> songs
+    Index("ix_song_tags_tag_id", "tag_id", "song_id")
 )
 
 
@@ -51,6 +57,9 @@ class Genre(Base):
 
 class SongFile(Base):
     __tablename__ = "song_files"
+    __table_args__ = (
+        Index("ix_song_files_duration", "duration"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     duration: Mapped[int] = mapped_column()
 
@@ -62,6 +71,11 @@ class SongFile(Base):
 
 class Song(Base):
     __tablename__ = "songs"
+    __table_args__ = (
+        Index("ix_songs_artist_id", "Artist"),
+        Index("ix_songs_file_id", "SongFile"),
+        Index("ix_songs_name", "name"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(nullable=False)
     liked: Mapped[bool] = mapped_column(default=False)
@@ -4,7 +4,11 @@ of database entities.
 Classes:
     SongsListFilters: Filters for song listing
     SongsListSorting: Sorting for song listing
-    SongListTransport: Transport item for song listing
+        filters and sortings are immutable, so they can be used as cache keys
+    SongListTransport: Transport item for song listing, `after` is an
+        opaque cursor to get the next page with keyset pagination
+        (None if there are no more items), `size_estimated` is set when
+        size is only a lower bound of the songs count
 """
 from typing import Optional
 from dataclasses import dataclass
@@ -15,7 +19,7 @@ from model.transport_items.db import (
 )
 
 
-@dataclass(slots=True)
+@dataclass(slots=True, frozen=True)
 class SongsListFilters(AbstractDBFilters):
     tag_id: Optional[int]
     genre_id: Optional[int]
@@ -23,7 +27,7 @@ class SongsListFilters(AbstractDBFilters):
     liked: Optional[bool]
 
 
-@dataclass(slots=True)
+@dataclass(slots=True, frozen=True)
 class SongsListSorting(AbstractDBSorting):
     name: Optional[DBSortingDirection]
     duration: Optional[DBSortingDirection]
@@ -33,4 +37,6 @@ class SongsListSorting(AbstractDBSorting):
 class SongListTransport(AbstractDBTransportList):
     filters: SongsListFilters
     sortings: SongsListSorting
+    after: Optional[str] = None
+    size_estimated: bool = False
 
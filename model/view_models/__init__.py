@@ -7,37 +7,43 @@ db model and then generates new view item - to not create circular updates
 Classes:
     ViewModelField: Descriptor for view model fields
     PSViewModel: Base class for view models
+    PSModelChangeCoalescer: Collects changed view models and notifies
+        about them once per event loop iteration
 Submodules:
     link - view model for id-name pair entities
-    song - view model for song entity
+    song - view models for song entity
+    compact - view models without QObject for big collections
 """
 from contextlib import contextmanager
+from typing import Dict, FrozenSet, List, Optional, Set
 
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, QTimer, Signal
+
+_MISSING = object()
 
 
 class ViewModelField:
     """
     Descriptor for view model fields
+    Assigning value equal to the current one changes nothing and emits nothing
     """
     def __set_name__(self, owner, name):
         if not issubclass(owner, PSViewModel):
             raise TypeError("ViewModelField must be used only with view models")
         self.__public_name = name
         self.__private_name = f"_{owner.__name__}__{name}"
-        self.__awaits_update_name = f"_PSViewModel__awaits_update"
-        self.__was_updated_name = f"_PSViewModel__was_updated"
-        self.__updated_signal_name = "updated"
 
     def __get__(self, instance, owner):
+        if instance is None:
+            return self
         return getattr(instance, self.__private_name)
 
     def __set__(self, instance, value):
+        current = getattr(instance, self.__private_name, _MISSING)
+        if current is value or current is not _MISSING and current == value:
+            return
         setattr(instance, self.__private_name, value)
-        if not getattr(instance, self.__awaits_update_name):
-            getattr(instance, self.__updated_signal_name).emit()
-        else:
-            setattr(instance, self.__was_updated_name, True)
+        instance._field_changed(self.__public_name)
 
 
 class PSViewModel(QObject):
@@ -48,33 +54,111 @@ class PSViewModel(QObject):
         updated: emitted when the view model was updated
         error: emitted when an error occurred during the update
 
+    Fields:
+        coalescer: PSModelChangeCoalescer that is notified about changes
+            of the model along with the updated signal, None by default
+
+    Properties:
+        dirty_fields: names of fields changed since clear_dirty,
+            fields set in silent update are not counted
+
     Methods:
         update: context manager that allows to emit updated signal
             on the exit from the context and only if the view model was updated.
             That is useful to update many fields at once and emit the signal only once.
             Also, it allows to pass silent=True to suppress the signal emission at all.
+        clear_dirty: forget changed fields, called by coalescer after notification
     """
     updated = Signal()
     error = Signal(Exception)
 
+    coalescer: Optional["PSModelChangeCoalescer"] = None
+
     def __init__(self):
         super().__init__()
         self.__awaits_update = False
         self.__was_updated = False
+        self.__silent = False
+        self.__dirty: Set[str] = set()
+
+    @property
+    def dirty_fields(self) -> FrozenSet[str]:
+        return frozenset(self.__dirty)
+
+    def clear_dirty(self) -> None:
+        self.__dirty.clear()
 
     @contextmanager
     def update(self, silent: bool = False):
         try:
             self.__was_updated = False
             self.__awaits_update = True
+            self.__silent = silent
             yield self
         except Exception as e:
             self.error.emit(e)
         finally:
             self.__awaits_update = False
+            self.__silent = False
             if self.__was_updated and not silent:
-                self.updated.emit()
+                self.__notify()
+
+    def _field_changed(self, name: str) -> None:
+        """
+        Called by ViewModelField when value of the field is changed
+        """
+        if self.__silent:
+            return
+        self.__dirty.add(name)
+        if not self.__awaits_update:
+            self.__notify()
+        else:
+            self.__was_updated = True
 
+    def __notify(self) -> None:
+        self.updated.emit()
+        if self.coalescer is not None:
+            self.coalescer.mark(self)
 
 
+class PSModelChangeCoalescer(QObject):
+    """
+    Collects view models changed during an iteration of the event loop
+    and emits them at once on the next one, so a view refreshed with
+    a whole page of models repaints once instead of once per model.
+    Models are passed in order of their first change, their dirty_fields
+    tell what was changed and are cleared after the signal.
+    Should be used from the GUI thread.
+
+    Signals:
+        models_changed: List[PSViewModel] - models changed since the last signal
+
+    Properties:
+        pending_count: number of models waiting for the signal
+    Methods:
+        mark: remember changed model
+        flush: emit collected models now
+    """
+    models_changed = Signal(list)
 
+    def __init__(self):
+        super().__init__()
+        self.__models: Dict[PSViewModel, None] = {}
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__models)
+
+    def mark(self, model: PSViewModel) -> None:
+        if not self.__models:
+            QTimer.singleShot(0, self.flush)
+        self.__models[model] = None
+
+    def flush(self) -> None:
+        models: List[PSViewModel] = list(self.__models)
+        self.__models = {}
+        if not models:
+            return
+        self.models_changed.emit(models)
+        for model in models:
+            model.clear_dirty()
@@ -0,0 +1,168 @@
+"""
+Compact view models for big collections. Compact view model is a plain
+object with __slots__, it has no QObject and no signals of its own:
+changes are reported by ids to a notifier shared by all models of an
+indexer, which emits them in batches once per event loop iteration.
+
+Classes:
+    CompactField: Descriptor for compact view model fields
+    CompactViewModel: Base class for compact view models
+    PSModelNotifier: Shared notifier that emits ids of changed models
+    PSCompactModelAdapter: QObject with updated signal for a single
+        compact model, for views written for PSViewModel
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+_MISSING = object()
+
+
+class CompactField:
+    """
+    Descriptor for compact view model fields, value is stored in the slot
+    named as the field with leading underscore, owner should declare it.
+    Assigning value equal to the current one changes nothing
+    """
+    def __set_name__(self, owner, name):
+        if not issubclass(owner, CompactViewModel):
+            raise TypeError("CompactField must be used only with compact view models")
+        self.__public_name = name
+        self.__slot_name = f"_{name}"
+        if self.__slot_name not in owner.__dict__.get("__slots__", ()):
+            raise TypeError(f"{owner.__name__} should declare slot {self.__slot_name}")
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance, self.__slot_name)
+
+    def __set__(self, instance, value):
+        current = getattr(instance, self.__slot_name, _MISSING)
+        if current is value or current is not _MISSING and current == value:
+            return
+        setattr(instance, self.__slot_name, value)
+        instance._field_changed()
+
+
+class CompactViewModel:
+    """
+    Base class for compact view models, subclasses should declare
+    __slots__ for their fields (see CompactField)
+
+    Fields:
+        id: identifier reported to the notifier
+        notifier: PSModelNotifier or None
+
+    Methods:
+        update: context manager, changes made in it are reported once on exit,
+            silent=True does not report them at all
+    """
+    __slots__ = ("id", "notifier", "_awaits_update", "_was_updated", "_silent", "__weakref__")
+
+    def __init__(self, id: Any, notifier: Optional["PSModelNotifier"] = None):
+        self.id = id
+        self.notifier = notifier
+        self._awaits_update = False
+        self._was_updated = False
+        self._silent = False
+
+    @contextmanager
+    def update(self, silent: bool = False):
+        try:
+            self._was_updated = False
+            self._awaits_update = True
+            self._silent = silent
+            yield self
+        finally:
+            self._awaits_update = False
+            self._silent = False
+            if self._was_updated and not silent:
+                self.__notify()
+
+    def _field_changed(self) -> None:
+        """
+        Called by CompactField when value of the field is changed
+        """
+        if self._silent:
+            return
+        if self._awaits_update:
+            self._was_updated = True
+        else:
+            self.__notify()
+
+    def __notify(self) -> None:
+        if self.notifier is not None:
+            self.notifier.mark(self.id)
+
+
+class PSModelNotifier(QObject):
+    """
+    Collects ids of compact models changed during an iteration of the event
+    loop and emits them at once on the next one. Should be used from
+    the GUI thread.
+
+    Signals:
+        changed: List - ids of models changed since the last signal
+
+    Properties:
+        pending_count: number of ids waiting for the signal
+    Methods:
+        mark: remember id of changed model
+        flush: emit collected ids now
+    """
+    changed = Signal(list)
+
+    def __init__(self):
+        super().__init__()
+        self.__ids: Dict[Any, None] = {}
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__ids)
+
+    def mark(self, id: Any) -> None:
+        if not self.__ids:
+            QTimer.singleShot(0, self.flush)
+        self.__ids[id] = None
+
+    def flush(self) -> None:
+        ids: List[Any] = list(self.__ids)
+        self.__ids = {}
+        if ids:
+            self.changed.emit(ids)
+
+
+class PSCompactModelAdapter(QObject):
+    """
+    Wraps a single compact model for views that use a PSViewModel: fields are
+    read from the model and updated is emitted when the notifier reports it.
+    Adapter keeps the model alive
+
+    Signals:
+        updated: emitted when the model was changed
+
+    Properties:
+        model: wrapped compact model
+    """
+    updated = Signal()
+
+    def __init__(self, model: CompactViewModel):
+        super().__init__()
+        self.__model = model
+        if model.notifier is not None:
+            model.notifier.changed.connect(self.__changed)
+
+    @property
+    def model(self) -> CompactViewModel:
+        return self.__model
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.__model, name)
+
+    def __changed(self, ids: List[Any]) -> None:
+        if self.__model.id in ids:
+            self.updated.emit()
@@ -10,7 +10,7 @@ class PSLinkModel(PSViewModel):
     """
 
     id: int
-    name: ViewModelField()
+    name = ViewModelField()
 
     def __init__(self, link_item: LinkItemTransport):
         super().__init__()
@@ -1,6 +1,7 @@
-from typing import List, Iterable, Tuple
+from typing import Any, Dict, List, Iterable, Optional, Tuple
 
 from model.view_models import PSViewModel, ViewModelField
+from model.view_models.compact import CompactViewModel, CompactField, PSModelNotifier
 from model.transport_items.db.basic import (
     SongDetailsTransport, GenreTransport, TagTransport
 )
@@ -11,22 +12,68 @@ class PSSongModel(PSViewModel):
     View model for song entity
     """
 
-    liked: ViewModelField()
+    id: int
 
-    artist: ViewModelField()
+    name = ViewModelField()
 
-    duration: ViewModelField()
+    liked = ViewModelField()
+
+    artist = ViewModelField()
+
+    duration = ViewModelField()
 
     def __init__(self, song: SongDetailsTransport):
         super().__init__()
         with self.update(silent=True):
             self.set_from_transport(song)
 
+    @staticmethod
+    def transport_fields(song: SongDetailsTransport) -> Dict[str, Any]:
+        """
+        Values of fields for transport item, id is not included
+        :param song: Song transport item
+        """
+        return {
+            "name": song.name,
+            "liked": song.liked,
+            "artist": song.artist.name,
+            "duration": song.file.duration,
+        }
+
+    def set_from_transport(self, song: SongDetailsTransport):
+        """
+        Sets data from transport item
+        :param song: Song transport item
+        """
+        self.id = song.id
+        for name, value in self.transport_fields(song).items():
+            setattr(self, name, value)
+
+
+class CompactSongModel(CompactViewModel):
+    """
+    Compact view model for song entity, has the same fields as PSSongModel
+    """
+    __slots__ = ("_name", "_liked", "_artist", "_duration")
+
+    name = CompactField()
+
+    liked = CompactField()
+
+    artist = CompactField()
+
+    duration = CompactField()
+
+    def __init__(self, song: SongDetailsTransport, notifier: Optional[PSModelNotifier] = None):
+        super().__init__(song.id, notifier)
+        with self.update(silent=True):
+            self.set_from_transport(song)
+
     def set_from_transport(self, song: SongDetailsTransport):
         """
         Sets data from transport item
         :param song: Song transport item
         """
-        self.liked = song.liked
-        self.artist = song.artist.name
-        self.duration = song.file.duration
+        self.id = song.id
+        for name, value in PSSongModel.transport_fields(song).items():
+            setattr(self, name, value)
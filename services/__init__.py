@@ -1,9 +1,32 @@
-from typing import Callable
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Callable, Optional, Union, Hashable, Dict, List, Tuple, Iterable
 
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, Qt
 
 from model.alchemy.session import AbstractSessionProvider
-from tasks.db import PSTask, PSDBTask
+from model.alchemy.async_session import AbstractAsyncSessionProvider
+from tasks import PSTaskCancelled
+from tasks.db import PSDBTask
+from tasks.executor import PSTaskExecutor, PSAsyncTaskExecutor
+from tasks.scheduler import TaskLane
+from tasks.metrics import TaskStage
+
+SessionProvider = Union[AbstractSessionProvider, AbstractAsyncSessionProvider]
+Executor = Union[PSTaskExecutor, PSAsyncTaskExecutor]
+
+
+@dataclass(slots=True)
+class InFlightRequest:
+    """
+    Task that is submitted and has not delivered its result yet
+    fields:
+        task: running task
+        callbacks: pairs of success and error callbacks of all callers
+            that requested the same data, by handles of the callers
+    """
+    task: PSDBTask
+    callbacks: Dict[str, Tuple[Callable, Callable[[Exception], None]]] = field(default_factory=dict)
 
 
 class PSService(QObject):
@@ -17,8 +40,226 @@ class PSDbService(PSService):
     Base class for services that work with database
 
     Fields:
-        session_provider: AbstractSessionProvider - provider for database session
+        session_provider: AbstractSessionProvider or AbstractAsyncSessionProvider -
+            provider for database session
+        executor: PSTaskExecutor or PSAsyncTaskExecutor - runs service tasks
+            off the GUI thread, by default matches the session provider
+    Properties:
+        is_async: service uses coroutine tasks
+        in_flight_count: number of distinct requests that are running
+    Methods:
+        coalesce: submits task unless the same request is already running,
+            in that case caller's callbacks are attached to the running one
+        track: registers requests served by one task
+        attach: attaches callbacks to the running request
+        new_handle: handle for a caller that is attached later
+        running: task serving the running request
+        cancel: detaches caller by its handle, task is cancelled
+            when it has no callers left
+        cancel_task: cancels task for all its callers
+        cancel_all: cancels every running task
+
+    Every caller gets its own handle, so one of the callers sharing
+    a task can drop its request without affecting the others.
     """
-    def __init__(self, session_provider: AbstractSessionProvider):
+    def __init__(
+        self,
+        session_provider: SessionProvider,
+        executor: Optional[Executor] = None
+    ):
         super().__init__()
         self.session_provider = session_provider
+        if executor is None:
+            executor = PSAsyncTaskExecutor() if self.is_async else PSTaskExecutor()
+        self.executor = executor
+        self.__in_flight: Dict[Hashable, InFlightRequest] = {}
+        # key of the request every attached caller waits for
+        self.__handles: Dict[str, Hashable] = {}
+        self.__handle_numbers = count()
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self.session_provider, AbstractAsyncSessionProvider)
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self.__in_flight)
+
+    def coalesce(
+        self,
+        key: Hashable,
+        create_task: Callable[[], PSDBTask],
+        process: Callable[..., Tuple],
+        callback: Callable,
+        error_callback: Callable[[Exception], None],
+        lane: TaskLane = TaskLane.INTERACTIVE
+    ) -> str:
+        """
+        Submits a task for the request identified by key. If a request with
+        the same key is still running, no task is created, callbacks are
+        attached to the running one and get the same result.
+        Result is delivered in the GUI thread and is processed once
+        for all the callers.
+
+        :param key: identity of the request, e.g. entity and its id
+        :param create_task: factory of the task for the request
+        :param process: maps arguments of task success signal to
+            arguments of the callbacks
+        :param callback: success callback
+        :param error_callback: error callback
+        :param lane: lane the task is queued in by the executor
+        :return: handle of the caller, to cancel the request
+        """
+        handle = self.attach(key, callback, error_callback)
+        if handle is None:
+            task = create_task()
+            self.track(task, [key], lambda *result: {key: process(*result)})
+            handle = self.attach(key, callback, error_callback)
+            self.executor.submit(task, lane)
+        return handle
+
+    def track(
+        self,
+        task: PSDBTask,
+        keys: Iterable[Hashable],
+        split: Callable[..., Dict[Hashable, Union[Tuple, Exception]]]
+    ) -> None:
+        """
+        Registers running requests served by one task, e.g. one query
+        for many entities, each requested separately. Task should be
+        submitted by the caller.
+
+        :param task: task serving the requests
+        :param keys: identities of the requests
+        :param split: maps arguments of task success signal to arguments
+            of the callbacks for every key, or to an exception for callers
+            of the key. Key missing in the result fails with KeyError
+        """
+        keys = list(keys)
+        for key in keys:
+            self.__in_flight[key] = InFlightRequest(task)
+        task.success().connect(
+            lambda *result: self.__deliver(keys, task, split, result),
+            Qt.ConnectionType.QueuedConnection
+        )
+        task.error_occurred.connect(
+            lambda error: self.__fail(keys, task, error),
+            Qt.ConnectionType.QueuedConnection
+        )
+
+    def attach(
+        self,
+        key: Hashable,
+        callback: Callable,
+        error_callback: Callable[[Exception], None],
+        handle: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Attaches callbacks to the running request
+        :param handle: handle given to the caller earlier (see new_handle),
+            None to make a new one
+        :return: handle of the caller or None if there is no such request
+        """
+        request = self.__in_flight.get(key)
+        if request is None:
+            return None
+        if handle is None:
+            handle = self.new_handle()
+        request.callbacks[handle] = (callback, error_callback)
+        self.__handles[handle] = key
+        return handle
+
+    def new_handle(self) -> str:
+        return f"request-{next(self.__handle_numbers)}"
+
+    def running(self, key: Hashable) -> Optional[PSDBTask]:
+        """
+        :return: task serving the running request or None
+        """
+        request = self.__in_flight.get(key)
+        return request.task if request is not None else None
+
+    def cancel(self, handle: str) -> bool:
+        """
+        Drops request of one caller, its callbacks are never called.
+        When no caller waits for the task any more, the task is cancelled
+        and query that is executed at the moment is interrupted
+        :param handle: handle returned to the caller by the service
+        :return: False if there is no such running request
+        """
+        key = self.__handles.pop(handle, None)
+        if key is None:
+            return False
+        request = self.__in_flight[key]
+        del request.callbacks[handle]
+        if not request.callbacks:
+            del self.__in_flight[key]
+            if not any(other.task is request.task for other in self.__in_flight.values()):
+                request.task.cancel()
+        return True
+
+    def cancel_task(self, task_id: str) -> bool:
+        """
+        Cancels task for all the requests it serves, callers that still
+        wait for it get PSTaskCancelled
+        :param task_id: id of the task
+        :return: False if there is no such running task
+        """
+        keys = [key for key, request in self.__in_flight.items() if request.task.id == task_id]
+        if not keys:
+            return False
+        requests = [self.__in_flight.pop(key) for key in keys]
+        requests[0].task.cancel()
+        error = PSTaskCancelled(task_id)
+        for request in requests:
+            for handle, (_, error_callback) in request.callbacks.items():
+                del self.__handles[handle]
+                error_callback(error)
+        return True
+
+    def cancel_all(self) -> None:
+        """
+        Cancels every running task, callbacks of their callers are never
+        called, e.g. on application exit before executor is waited for
+        """
+        tasks = {request.task.id: request.task for request in self.__in_flight.values()}
+        self.__in_flight.clear()
+        self.__handles.clear()
+        for task in tasks.values():
+            task.cancel()
+
+    def __pop_requests(self, keys: List[Hashable], task: PSDBTask) -> Dict[Hashable, InFlightRequest]:
+        # result could be queued before the task was cancelled,
+        # by then the key could be taken by a new request
+        requests = {
+            key: self.__in_flight.pop(key)
+            for key in keys
+            if key in self.__in_flight and self.__in_flight[key].task is task
+        }
+        for request in requests.values():
+            for handle in request.callbacks:
+                del self.__handles[handle]
+        return requests
+
+    def __deliver(self, keys: List[Hashable], task: PSDBTask, split: Callable, result: Tuple) -> None:
+        requests = self.__pop_requests(keys, task)
+        if not requests:
+            return
+        task.timeline.mark(TaskStage.DELIVERED)
+        results = split(*result)
+        task.timeline.mark(TaskStage.VIEW_MODEL_UPDATED)
+        for key, request in requests.items():
+            result = results.get(key, KeyError(key))
+            for callback, error_callback in request.callbacks.values():
+                if isinstance(result, Exception):
+                    error_callback(result)
+                else:
+                    callback(*result)
+
+    def __fail(self, keys: List[Hashable], task: PSDBTask, error: Exception) -> None:
+        requests = self.__pop_requests(keys, task)
+        if requests:
+            task.timeline.mark(TaskStage.DELIVERED)
+        for request in requests.values():
+            for _, error_callback in request.callbacks.values():
+                error_callback(error)
@@ -1,4 +1,5 @@
-from typing import List, Tuple, Dict
+import json
+from typing import List, Tuple, Dict, Optional
 
 from model.alchemy.tables import Song, SongFile, Artist, Tag, Genre
 from model.transport_items.db.basic import (
@@ -8,6 +9,23 @@ from model.transport_items.db.basic import (
 from model.transport_items.db.lists import SongListTransport, SongsListSorting, SongsListFilters
 
 SongListQueryRow = Tuple[Song, Artist, SongFile, Tag, Genre]
+# song id, name, liked, artist id, artist name, file id, duration,
+# tag id, tag name, genre id, genre name
+SongListPlainRow = Tuple[
+    int, str, bool,
+    Optional[int], Optional[str],
+    Optional[int], Optional[int],
+    Optional[int], Optional[str],
+    Optional[int], Optional[str]
+]
+# song id, name, liked, artist id, artist name, file id, duration,
+# json array of tags, json array of genres
+SongListJsonRow = Tuple[
+    int, str, bool,
+    Optional[int], Optional[str],
+    Optional[int], Optional[int],
+    str, str
+]
 
 
 def _song_list_item(
@@ -120,3 +138,128 @@ def song_list_to_transport(
         sortings=sortings
     )
 
+
+def song_rows_to_transport(
+    rows: List[SongListPlainRow],
+    page: int,
+    page_size: int,
+    size: int,
+    filters: SongsListFilters,
+    sortings: SongsListSorting
+) -> SongListTransport:
+    """
+    Tuple based variant of song_list_to_transport: rows are plain column
+    values, rows of the same song must follow each other
+    """
+    result = []
+    current = None
+    tags = {}
+    genres = {}
+
+    for row in rows:
+        if current is None or current[0] != row[0]:
+            if current is not None:
+                result.append(_song_plain_item(current, tags, genres))
+            current = row
+            tags = {}
+            genres = {}
+        if row[7] is not None:
+            tags[row[7]] = row[8]
+        if row[9] is not None:
+            genres[row[9]] = row[10]
+
+    if current is not None:
+        result.append(_song_plain_item(current, tags, genres))
+    return SongListTransport(
+        items=result,
+        page=page,
+        page_size=page_size,
+        size=size,
+        filters=filters,
+        sortings=sortings
+    )
+
+
+def _song_plain_item(
+    row: SongListPlainRow,
+    tags: Dict[int, str],
+    genres: Dict[int, str]
+) -> SongDetailsTransport:
+    """
+    Internal use only function to convert song columns of a plain row
+    and collected tags and genres to a transport item
+    """
+    id, name, liked, artist_id, artist_name, file_id, duration = row[:7]
+    return SongDetailsTransport(
+        id=id,
+        name=name,
+        liked=liked,
+        artist=ArtistTransport(
+            id=artist_id,
+            name=artist_name
+        ) if artist_id is not None else None,
+        genres=[
+            GenreTransport(id=genre_id, name=genre_name)
+            for genre_id, genre_name in genres.items()
+        ],
+        tags=[
+            TagTransport(id=tag_id, name=tag_name)
+            for tag_id, tag_name in tags.items()
+        ],
+        file=SongFileTransport(
+            id=file_id,
+            duration=duration
+        ) if file_id is not None else None
+    )
+
+
+def song_json_row_to_transport(row: SongListJsonRow) -> SongDetailsTransport:
+    """
+    Converts a row with pre-aggregated tags and genres to a transport item
+
+    :param row: SongListJsonRow
+    :return: Song transport item
+    """
+    id, name, liked, artist_id, artist_name, file_id, duration, tags, genres = row
+    return SongDetailsTransport(
+        id=id,
+        name=name,
+        liked=liked,
+        artist=ArtistTransport(
+            id=artist_id,
+            name=artist_name
+        ) if artist_id is not None else None,
+        genres=[
+            GenreTransport(id=genre["id"], name=genre["name"])
+            for genre in json.loads(genres)
+        ],
+        tags=[
+            TagTransport(id=tag["id"], name=tag["name"])
+            for tag in json.loads(tags)
+        ],
+        file=SongFileTransport(
+            id=file_id,
+            duration=duration
+        ) if file_id is not None else None
+    )
+
+
+def song_json_list_to_transport(
+    rows: List[SongListJsonRow],
+    page: int,
+    page_size: int,
+    size: int,
+    filters: SongsListFilters,
+    sortings: SongsListSorting
+) -> SongListTransport:
+    """
+    Same as song_list_to_transport for rows with one row per song
+    """
+    return SongListTransport(
+        items=[song_json_row_to_transport(row) for row in rows],
+        page=page,
+        page_size=page_size,
+        size=size,
+        filters=filters,
+        sortings=sortings
+    )
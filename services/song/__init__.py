@@ -1,19 +1,29 @@
-from typing import List, Callable
+from typing import List, Callable, Optional, Dict, Tuple, Union
 import string
 
-from model.alchemy.session import AbstractSessionProvider
+from PySide6.QtCore import Qt, QTimer
 
-from model.transport_items.db.lists import SongsListFilters, SongsListSorting
+from model.transport_items.db.lists import (
+    SongsListFilters, SongsListSorting, SongListTransport
+)
 from model.transport_items.db.basic import SongDetailsTransport
 from model.view_models.song import PSSongModel
 
-from services import PSDbService
+from services import PSDbService, SessionProvider, Executor
+from tasks.db import PSDBTask
+from tasks.scheduler import TaskLane
 from indexers.song import SongsIndexer
-from services.song.tasks.single import PSObtainSong
-from services.song.tasks.list import PSObtainSongList
+from services.song.tasks.many import PSObtainSongs
+from services.song.tasks.list import PSObtainSongList, SongListStrategy
+from services.song.tasks.aio import PSAsyncObtainSongList, PSAsyncObtainSongs
+from services.song.cache import SongCountCache, SongPageCache, PageKey
+from services.song.write import PSSongWriteService
 
 from utils.random import random_string_prepare
 
+# chunks of a streamed list emitted and not yet handled in the GUI thread
+_PENDING_CHUNKS = 4
+
 
 class PSSongService(PSDbService):
     """
@@ -26,24 +36,70 @@ class PSSongService(PSDbService):
 
     Fields:
         :session_provider: Session provider
+        :executor: Executor that runs tasks in worker threads, results are
+            delivered to callbacks in the GUI thread with queued signals.
+            With async session provider coroutine tasks are used and run
+            on the asyncio loop of the GUI thread
         :indexer: Indexer for songs
+        :count_cache: Cache of songs count per filters, invalidated on ORM writes
+            of the session provider
+        :count_limit: Songs are counted only up to this number, bigger lists
+            get size_estimated flag. None to always count precisely
+        :list_strategy: How list queries are executed (see SongListStrategy)
+        :prefetch_depth: Number of pages around the obtained one that are
+            prefetched in background lane, 0 disables prefetching
+        :page_cache: Recently obtained and prefetched pages, invalidated
+            on ORM writes, reports hit rate and memory
+        :writer: Write service, songs obtained while their changes
+            are not written yet get the changed values
         :generate_task_id: Callable[[], str] - function to generate task id,
-            basically we do not use task ids, current implementation uses callbacks
-            to handle the results, but I want to keep things as less opinionated as possible
-            so it is possible to use task objects and therefore ids later
+            results are handled with callbacks, get_ methods return handles
+            only to cancel requests
     Methods:
         :get_by_id: Obtains a song by its id
+        :get_by_ids: Obtains songs by their ids
         :get_list: Obtains a list of songs
+        :stream_list: Obtains a list of songs by chunks
+        :cancel: Cancels request by its handle
+        :dispose: Cancels running requests, stops tracking writes by own caches
         :process_single: Mapper from SongDetailsTransport to PSSongModel
         :process_list: Handler for songs list obtained
     """
     def __init__(
         self,
-        session_provider: AbstractSessionProvider,
-        indexer: SongsIndexer
+        session_provider: SessionProvider,
+        indexer: SongsIndexer,
+        executor: Optional[Executor] = None,
+        count_cache: Optional[SongCountCache] = None,
+        count_limit: Optional[int] = None,
+        list_strategy: SongListStrategy = SongListStrategy.SEPARATE,
+        prefetch_depth: int = 0,
+        page_cache: Optional[SongPageCache] = None,
+        writer: Optional[PSSongWriteService] = None
     ):
-        super().__init__(session_provider)
+        super().__init__(session_provider, executor)
         self.indexer = indexer
+        # caches created here track writes of this provider only
+        self.__watching: List[Union[SongCountCache, SongPageCache]] = []
+        if count_cache is None:
+            count_cache = SongCountCache()
+            count_cache.watch(session_provider.event_target)
+            self.__watching.append(count_cache)
+        self.count_cache = count_cache
+        self.count_limit = count_limit
+        self.list_strategy = list_strategy
+        self.prefetch_depth = prefetch_depth
+        if page_cache is None:
+            page_cache = SongPageCache()
+            page_cache.watch(session_provider.event_target)
+            self.__watching.append(page_cache)
+        self.page_cache = page_cache
+        self.writer = writer
+        self.__superseding: Optional[str] = None
+        self.__batch_id: Optional[str] = None
+        # handle, song id and callbacks of callers waiting for the batch
+        self.__batch: List[Tuple[str, int, Callable, Callable]] = []
+        self.__prefetching: Dict[PageKey, PSDBTask] = {}
         self.generate_task_id = random_string_prepare(
             32,
             string.ascii_letters + string.digits
@@ -54,30 +110,111 @@ class PSSongService(PSDbService):
         id: int,
         callback: Callable[[PSSongModel], None],
         error_callback: Callable[[Exception], None]
-    ) -> None:
+    ) -> str:
         """
         Obtains a song by its id
-        Song is never returned, it is used in the provided callback
+        Song is never returned, it is used in the provided callback.
+        While the song is being obtained, repeated requests for the same id
+        do not run a new query, they get the result of the running one.
+        Songs requested during one iteration of the event loop are obtained
+        with one query on the next iteration, each caller still gets
+        its own song.
 
         :param id: Song id
         :param callback: Success Callback function
         :param error_callback: Error callback function
-        :return: None
+        :return: handle of the request, can be used to cancel it,
+            songs batched with this one are still obtained
+        """
+        handle = self.attach(("song", id), callback, error_callback)
+        if handle is not None:
+            return handle
+        if self.__batch_id is None:
+            self.__batch_id = self.generate_task_id()
+            QTimer.singleShot(0, self.__submit_batch)
+        handle = self.new_handle()
+        self.__batch.append((handle, id, callback, error_callback))
+        return handle
 
-        :emits song_obtained: SongDetailsTransport - obtained song
-        :emits error_occurred: Exception - error
+    def get_by_ids(
+        self,
+        ids: List[int],
+        callback: Callable[[List[PSSongModel]], None],
+        error_callback: Callable[[Exception], None]
+    ) -> str:
         """
-        task = PSObtainSong(
-            self.generate_task_id(),
-            self.session_provider,
-            id
-        )
-        task.song_obtained.connect(
-            lambda song: callback(self.process_single(song))
+        Obtains songs by their ids with one query
+        Songs are passed to the callback in order of ids, songs that
+        were not found are skipped
+
+        :param ids: Song ids
+        :param callback: Success Callback function
+        :param error_callback: Error callback function
+        :return: handle of the request, can be used to cancel it
+        """
+        ids = list(ids)
+        return self.coalesce(
+            ("songs", tuple(ids)),
+            lambda: self.__songs_task(self.generate_task_id(), ids),
+            lambda songs: ([self.process_single(song) for song in songs],),
+            callback,
+            error_callback
         )
 
-        task.error_occurred.connect(error_callback)
-        task.run()
+    def cancel(self, handle: str) -> bool:
+        # request could wait for the batch to be submitted
+        batch = [request for request in self.__batch if request[0] != handle]
+        if len(batch) != len(self.__batch):
+            self.__batch = batch
+            return True
+        return super().cancel(handle)
+
+    def dispose(self) -> None:
+        """
+        Cancels running requests, so streams waiting for their chunks to be
+        consumed stop, and stops tracking writes by caches created by
+        the service. Should be called on application exit before
+        executor is waited for
+        """
+        self.__batch = []
+        self.__prefetching.clear()
+        self.cancel_all()
+        while self.__watching:
+            self.__watching.pop().unwatch(self.session_provider.event_target)
+
+    def __songs_task(self, task_id: str, ids: List[int]) -> PSDBTask:
+        task_class = PSAsyncObtainSongs if self.is_async else PSObtainSongs
+        return task_class(task_id, self.session_provider, ids)
+
+    def __submit_batch(self) -> None:
+        task_id, batch = self.__batch_id, self.__batch
+        self.__batch_id, self.__batch = None, []
+        if not batch:
+            return
+        # song could be requested by another task since it was batched
+        ids = [
+            id for id in dict.fromkeys(id for _, id, _, _ in batch)
+            if self.running(("song", id)) is None
+        ]
+        task = None
+        if ids:
+            task = self.__songs_task(task_id, ids)
+            self.track(
+                task,
+                [("song", id) for id in ids],
+                lambda songs: self.__split_songs(ids, songs)
+            )
+        for handle, id, callback, error_callback in batch:
+            self.attach(("song", id), callback, error_callback, handle)
+        if task is not None:
+            self.executor.submit(task)
+
+    def __split_songs(self, ids: List[int], songs: List[SongDetailsTransport]):
+        found = {song.id: (self.process_single(song),) for song in songs}
+        return {
+            ("song", id): found.get(id) or IndexError(f"Song with id `{id}` was not found")
+            for id in ids
+        }
 
     def process_single(self, song: SongDetailsTransport) -> PSSongModel:
         """
@@ -85,6 +222,8 @@ class PSSongService(PSDbService):
         :param song: Song
         :return: PSSongModel
         """
+        if self.writer is not None:
+            song = self.writer.overlay(song)
         return self.indexer.add(song)
 
     def get_list(
@@ -93,33 +232,231 @@ class PSSongService(PSDbService):
         page_size: int,
         filters: SongsListFilters,
         sortings: SongsListSorting,
-        callback: Callable[[List[PSSongModel]], None],
-        error_callback: Callable[[Exception], None]
-    ):
+        callback: Callable[[List[PSSongModel], SongListTransport], None],
+        error_callback: Callable[[Exception], None],
+        after: Optional[str] = None,
+        supersede: bool = False
+    ) -> Optional[str]:
         """
         Obtains a list of songs
+        Pages are selected either by page number or, when `after` cursor
+        is provided, with keyset pagination which costs the same for any page.
+        Cursor for the next page is `after` field of the transport passed
+        to the callback.
+        Identical requests made while the list is being obtained share
+        the running query.
+        Superseding request cancels the previous superseding one if it is
+        still running, so only the latest list the user looks at is obtained.
+        Query of the cancelled request is interrupted only if no other
+        caller shares it.
+        Obtained pages are cached, with prefetch_depth set pages around
+        the obtained one are prefetched in background. Cached page is
+        delivered without a query, page that is being prefetched is
+        delivered when the prefetch is over, prefetch is moved to the
+        interactive lane if it is not started yet.
+
         :param page: Page number
         :param page_size: Page size
         :param filters: Filters
         :param sortings: Sortings
-        :param callback: Success callback function
+        :param callback: Success callback function, receives song models and
+            transport with total size and cursor of the next page
         :param error_callback: Error callback function
+        :param after: Cursor of the previous page
+        :param supersede: Cancel previous superseding request
+        :return: handle of the request, can be used to cancel it,
+            None if the page was cached
         """
-        task = PSObtainSongList(
+        key = (page, page_size, filters, sortings, after)
+        song_list = self.page_cache.get(key)
+        if song_list is not None:
+            if supersede:
+                self.__supersede(None)
+            QTimer.singleShot(
+                0,
+                lambda: callback(*self.__list_obtained(key, song_list))
+            )
+            return None
+
+        prefetch = self.__prefetching.pop(key, None)
+        if prefetch is not None:
+            # caller joins the prefetch, it is not left waiting behind background tasks
+            self.executor.promote(prefetch, TaskLane.INTERACTIVE)
+        generation = self.page_cache.generation
+        handle = self.coalesce(
+            ("list", *key),
+            lambda: self.__list_task(key),
+            lambda song_list: self.__list_obtained(key, song_list, generation),
+            callback,
+            error_callback
+        )
+        if supersede:
+            self.__supersede(handle)
+        return handle
+
+    def stream_list(
+        self,
+        page: int,
+        page_size: int,
+        filters: SongsListFilters,
+        sortings: SongsListSorting,
+        chunk_callback: Callable[[List[PSSongModel]], None],
+        callback: Callable[[SongListTransport], None],
+        error_callback: Callable[[Exception], None],
+        after: Optional[str] = None,
+        chunk_size: int = 100,
+        supersede: bool = False
+    ) -> str:
+        """
+        Obtains a list of songs by chunks, for big pages e.g. "show all".
+        Songs are passed to chunk_callback as soon as chunk_size of them are
+        read, so the first ones can be shown while the rest is loading.
+        The worker reads ahead at most a few chunks of what is handled
+        in the GUI thread, so memory does not grow with the page size.
+        Streamed lists are neither shared with other requests nor cached.
+
+        :param page: Page number
+        :param page_size: Page size
+        :param filters: Filters
+        :param sortings: Sortings
+        :param chunk_callback: Receives song models of every chunk, in order
+        :param callback: Called after the last chunk, receives transport
+            without items with total size and cursor of the next page
+        :param error_callback: Error callback function
+        :param after: Cursor of the previous page
+        :param chunk_size: Number of songs in a chunk
+        :param supersede: Cancel previous superseding request
+        :return: handle of the request, can be used to cancel it
+        """
+        task_class = PSAsyncObtainSongList if self.is_async else PSObtainSongList
+        task = task_class(
             self.generate_task_id(),
             self.session_provider,
             page,
             page_size,
             filters,
-            sortings
+            sortings,
+            after,
+            self.count_cache,
+            self.count_limit,
+            self.list_strategy,
+            chunk_size,
+            # async task emits chunks on the thread that handles them
+            None if self.is_async else _PENDING_CHUNKS
+        )
+        key = ("stream", task.id)
+        task.chunk_obtained.connect(
+            lambda chunk: self.__chunk_obtained(key, task, chunk, chunk_callback),
+            Qt.ConnectionType.QueuedConnection
         )
+        handle = self.coalesce(key, lambda: task, lambda song_list: (song_list,), callback, error_callback)
+        if supersede:
+            self.__supersede(handle)
+        return handle
+
+    def __chunk_obtained(
+        self,
+        key: Tuple,
+        task: PSDBTask,
+        chunk: List[SongDetailsTransport],
+        chunk_callback: Callable[[List[PSSongModel]], None]
+    ) -> None:
+        try:
+            if self.running(key) is task:
+                chunk_callback(self.process_list(chunk))
+        finally:
+            task.chunk_consumed()
+
+    def __supersede(self, handle: Optional[str]) -> None:
+        if self.__superseding is not None and self.__superseding != handle:
+            self.cancel(self.__superseding)
+        self.__superseding = handle
 
-        task.song_list_obtained.connect(
-            lambda song_list: callback(self.process_list(song_list))
+    def __list_task(self, key: PageKey) -> PSDBTask:
+        page, page_size, filters, sortings, after = key
+        task_class = PSAsyncObtainSongList if self.is_async else PSObtainSongList
+        return task_class(
+            self.generate_task_id(),
+            self.session_provider,
+            page,
+            page_size,
+            filters,
+            sortings,
+            after,
+            self.count_cache,
+            self.count_limit,
+            self.list_strategy
         )
-        task.error_occurred.connect(error_callback)
 
-        task.run()
+    def __list_obtained(
+        self,
+        key: PageKey,
+        song_list: SongListTransport,
+        generation: Optional[int] = None
+    ):
+        if generation is not None:
+            self.page_cache.set(key, song_list, generation)
+        self.__prefetch_around(key, song_list, self.prefetch_depth)
+        return self.process_list(song_list.items), song_list
+
+    def __prefetch_around(self, key: PageKey, song_list: SongListTransport, depth: int) -> None:
+        """
+        Prefetches pages following the obtained one and, for pages selected
+        by number, preceding ones. Following pages are selected the same way
+        as the obtained one: by number or by cursor, in the latter case they
+        are prefetched one after another
+        """
+        if depth <= 0:
+            return
+        page, page_size, filters, sortings, after = key
+        if after is None:
+            for shift in range(1, depth + 1):
+                if page - shift >= 0:
+                    self.__prefetch((page - shift, page_size, filters, sortings, None), 0)
+                if (page + shift) * page_size < song_list.size:
+                    self.__prefetch((page + shift, page_size, filters, sortings, None), 0)
+        elif song_list.after is not None:
+            self.__prefetch((page + 1, page_size, filters, sortings, song_list.after), depth - 1)
+
+    def __prefetch(self, key: PageKey, depth: int) -> None:
+        generation = self.page_cache.generation
+        if self.running(("list", *key)) is not None or self.page_cache.contains(key):
+            return
+        task = self.__list_task(key)
+        # prefetch is tracked as a list request, so get_list joins it
+        self.__prefetching[key] = task
+        self.track(
+            task,
+            [("list", *key)],
+            lambda song_list: self.__prefetched(key, task, song_list, generation, depth)
+        )
+        task.error_occurred.connect(
+            lambda error: self.__forget_prefetch(key, task),
+            Qt.ConnectionType.QueuedConnection
+        )
+        self.executor.submit(task, TaskLane.BACKGROUND)
+
+    def __prefetched(
+        self,
+        key: PageKey,
+        task: PSDBTask,
+        song_list: SongListTransport,
+        generation: int,
+        depth: int
+    ) -> Dict:
+        if not self.__forget_prefetch(key, task):
+            # page was requested while prefetched, it is obtained as requested one
+            return {("list", *key): self.__list_obtained(key, song_list, generation)}
+        self.page_cache.set(key, song_list, generation)
+        self.__prefetch_around(key, song_list, depth)
+        # nobody asked for the page yet, view models are not needed
+        return {}
+
+    def __forget_prefetch(self, key: PageKey, task: PSDBTask) -> bool:
+        if self.__prefetching.get(key) is not task:
+            return False
+        del self.__prefetching[key]
+        return True
 
     def process_list(self, songs: List[SongDetailsTransport]) -> List[PSSongModel]:
         """
@@ -127,8 +464,7 @@ class PSSongService(PSDbService):
         :param songs: List of songs
         :return:
         """
-        return [
-            self.indexer.add(song)
-            for song in songs
-        ]
+        if self.writer is not None:
+            songs = self.writer.overlay_list(songs)
+        return self.indexer.add_many(songs).objects
 
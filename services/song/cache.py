@@ -0,0 +1,370 @@
+"""
+Caches used by song service
+Classes:
+    SongCountCache: total number of songs per filters combination
+    SongPageCache: pages of songs obtained recently or ahead of time
+Items:
+    PageKey: identity of a page request
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from model.alchemy.tables import Song, Tag, Genre
+from model.transport_items.db.lists import (
+    SongsListFilters, SongsListSorting, SongListTransport
+)
+from utils.memory import approximate_size
+
+# filter dimension affected by change of Song attribute
+SONG_ATTRIBUTE_DIMENSIONS = {
+    "liked": "liked",
+    "artist": "artist_id",
+    "artist_id": "artist_id",
+    "tags": "tag_id",
+    "genres": "genre_id",
+}
+ALL_DIMENSIONS = "*"
+
+# page, page size, filters, sortings, cursor of the previous page
+PageKey = Tuple[int, int, SongsListFilters, SongsListSorting, Optional[str]]
+
+
+class SongCountCache:
+    """
+    Thread-safe LRU cache of songs count by SongsListFilters.
+    Count is the same for any page and sorting, so it is obtained once
+    and reused until songs, tags or genres are changed.
+
+    Cache is kept consistent with ORM writes when watching sessions:
+    changes found on flush are applied on commit and dropped on rollback.
+    Inserting or deleting songs invalidates every entry, changing song
+    fields invalidates only entries filtered by the changed dimension
+    (e.g. changing `liked` does not affect entries with liked=None).
+
+    Every invalidation increases generation. Reader that obtained generation
+    before starting its transaction passes it to set, so count read from
+    a snapshot older than the last invalidation is not stored.
+
+    Properties:
+        generation: number of invalidations so far
+    Methods:
+        get: cached (count, is_estimate) or None
+        set: store count for filters
+        invalidate: drop all entries or entries filtered by a dimension
+        watch: start tracking ORM changes of sessions
+        unwatch: stop tracking ORM changes of one or all watched targets
+    """
+    def __init__(self, max_size: int = 256):
+        self.__max_size = max_size
+        self.__lock = Lock()
+        self.__counts: OrderedDict[SongsListFilters, Tuple[int, bool]] = OrderedDict()
+        self.__info_key = ("song_count_cache", id(self))
+        self.__watched: List = []
+        self.__generation = 0
+
+    def __len__(self) -> int:
+        return len(self.__counts)
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    def get(self, filters: SongsListFilters) -> Optional[Tuple[int, bool]]:
+        with self.__lock:
+            result = self.__counts.get(filters)
+            if result is not None:
+                self.__counts.move_to_end(filters)
+            return result
+
+    def set(
+        self,
+        filters: SongsListFilters,
+        count: int,
+        estimate: bool = False,
+        generation: Optional[int] = None
+    ) -> None:
+        with self.__lock:
+            if generation is not None and generation != self.__generation:
+                return
+            self.__counts[filters] = (count, estimate)
+            self.__counts.move_to_end(filters)
+            while len(self.__counts) > self.__max_size:
+                self.__counts.popitem(last=False)
+
+    def invalidate(self, dimension: Optional[str] = None) -> None:
+        """
+        :param dimension: name of SongsListFilters field, entries where
+            this filter is set are dropped. None drops everything
+        """
+        with self.__lock:
+            self.__generation += 1
+            if dimension is None or dimension == ALL_DIMENSIONS:
+                self.__counts.clear()
+                return
+            for filters in [
+                filters for filters in self.__counts
+                if getattr(filters, dimension) is not None
+            ]:
+                del self.__counts[filters]
+
+    def watch(self, target) -> None:
+        """
+        Track changes made with ORM sessions
+        :param target: sessionmaker or session to track, e.g. event_target
+            of the session provider
+        """
+        event.listen(target, "after_flush", self.__collect)
+        event.listen(target, "after_commit", self.__apply)
+        event.listen(target, "after_rollback", self.__discard)
+        self.__watched.append(target)
+
+    def unwatch(self, target=None) -> None:
+        """
+        Stop tracking changes
+        :param target: one of the watched targets, None to stop tracking all of them
+        """
+        for watched in [target] if target is not None else self.__watched[:]:
+            event.remove(watched, "after_flush", self.__collect)
+            event.remove(watched, "after_commit", self.__apply)
+            event.remove(watched, "after_rollback", self.__discard)
+            self.__watched.remove(watched)
+
+    def __collect(self, session: Session, flush_context) -> None:
+        dimensions: Set[str] = session.info.setdefault(self.__info_key, set())
+        for obj in session.new:
+            if isinstance(obj, Song):
+                dimensions.add(ALL_DIMENSIONS)
+        for obj in session.deleted:
+            if isinstance(obj, Song):
+                dimensions.add(ALL_DIMENSIONS)
+            elif isinstance(obj, Tag):
+                dimensions.add("tag_id")
+            elif isinstance(obj, Genre):
+                dimensions.add("genre_id")
+        for obj in session.dirty:
+            if not isinstance(obj, Song):
+                continue
+            attrs = inspect(obj).attrs
+            for attribute, dimension in SONG_ATTRIBUTE_DIMENSIONS.items():
+                if attrs[attribute].history.has_changes():
+                    dimensions.add(dimension)
+
+    def __apply(self, session: Session) -> None:
+        dimensions = session.info.pop(self.__info_key, set())
+        if ALL_DIMENSIONS in dimensions:
+            self.invalidate()
+            return
+        for dimension in dimensions:
+            self.invalidate(dimension)
+
+    def __discard(self, session: Session) -> None:
+        session.info.pop(self.__info_key, None)
+
+
+class SongPageCache:
+    """
+    Thread-safe LRU cache of song list pages, used by the song service for
+    pages obtained and prefetched around the one the user looks at,
+    so going back to a page costs no query.
+    Entries expire after ttl seconds, if it is set, measured by clock
+    (time.monotonic by default).
+
+    Cache is kept consistent with ORM writes when watching sessions, same
+    as SongCountCache: on commit pages that contain changed songs are
+    dropped, as well as pages filtered or sorted by a changed field.
+    Inserting or deleting songs or changing related entities drops
+    every page. Every invalidation increases generation, page read by
+    a task started before it is not stored.
+
+    Properties:
+        generation: number of invalidations so far
+        hits: number of get calls that found the page
+        misses: number of get calls that did not
+        hit_rate: share of get calls that found the page
+        memory: approximate number of bytes taken by cached pages
+    Methods:
+        get: cached page or None, counts hits and misses
+        set: store a page
+        contains: page is cached, does not affect counters
+        invalidate: drop all pages or pages filtered by a dimension
+        invalidate_song: drop pages containing the song
+        invalidate_sorting: drop pages sorted by the field
+        clear: drop all pages
+        watch: start tracking ORM changes of sessions
+        unwatch: stop tracking ORM changes of one or all watched targets
+    """
+    def __init__(
+        self,
+        max_size: int = 16,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = monotonic
+    ):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__lock = Lock()
+        # page, moment it was stored, approximate size
+        self.__pages: OrderedDict[PageKey, Tuple[SongListTransport, float, int]] = OrderedDict()
+        self.__info_key = ("song_page_cache", id(self))
+        self.__watched: List = []
+        self.__generation = 0
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__pages)
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.__hits + self.__misses
+        return self.__hits / requests if requests else 0.0
+
+    @property
+    def memory(self) -> int:
+        with self.__lock:
+            return sum(size for _, _, size in self.__pages.values())
+
+    def get(self, key: PageKey) -> Optional[SongListTransport]:
+        with self.__lock:
+            page = self.__lookup(key)
+            if page is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+            return page
+
+    def contains(self, key: PageKey) -> bool:
+        with self.__lock:
+            return self.__lookup(key) is not None
+
+    def set(
+        self,
+        key: PageKey,
+        page: SongListTransport,
+        generation: Optional[int] = None
+    ) -> None:
+        size = approximate_size(page)
+        with self.__lock:
+            if generation is not None and generation != self.__generation:
+                return
+            self.__pages[key] = (page, self.__clock(), size)
+            self.__pages.move_to_end(key)
+            while len(self.__pages) > self.__max_size:
+                self.__pages.popitem(last=False)
+
+    def invalidate(self, dimension: Optional[str] = None) -> None:
+        """
+        :param dimension: name of SongsListFilters field, pages where
+            this filter is set are dropped. None drops everything
+        """
+        if dimension is None or dimension == ALL_DIMENSIONS:
+            self.__drop(lambda key, page: True)
+        else:
+            self.__drop(lambda key, page: getattr(key[2], dimension) is not None)
+
+    def invalidate_song(self, id: int) -> None:
+        self.__drop(lambda key, page: any(item.id == id for item in page.items))
+
+    def invalidate_sorting(self, field: str) -> None:
+        """
+        :param field: name of SongsListSorting field
+        """
+        self.__drop(lambda key, page: getattr(key[3], field) is not None)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def watch(self, target) -> None:
+        """
+        Track changes made with ORM sessions
+        :param target: sessionmaker or session to track, e.g. event_target
+            of the session provider
+        """
+        event.listen(target, "after_flush", self.__collect)
+        event.listen(target, "after_commit", self.__apply)
+        event.listen(target, "after_rollback", self.__discard)
+        self.__watched.append(target)
+
+    def unwatch(self, target=None) -> None:
+        """
+        Stop tracking changes
+        :param target: one of the watched targets, None to stop tracking all of them
+        """
+        for watched in [target] if target is not None else self.__watched[:]:
+            event.remove(watched, "after_flush", self.__collect)
+            event.remove(watched, "after_commit", self.__apply)
+            event.remove(watched, "after_rollback", self.__discard)
+            self.__watched.remove(watched)
+
+    def __lookup(self, key: PageKey) -> Optional[SongListTransport]:
+        entry = self.__pages.get(key)
+        if entry is None:
+            return None
+        page, stored, _ = entry
+        if self.__ttl is not None and self.__clock() - stored > self.__ttl:
+            del self.__pages[key]
+            return None
+        self.__pages.move_to_end(key)
+        return page
+
+    def __drop(self, condition: Callable[[PageKey, SongListTransport], bool]) -> None:
+        with self.__lock:
+            self.__generation += 1
+            for key in [
+                key for key, (page, _, _) in self.__pages.items()
+                if condition(key, page)
+            ]:
+                del self.__pages[key]
+
+    def __collect(self, session: Session, flush_context) -> None:
+        changes: Dict[str, Set] = session.info.setdefault(
+            self.__info_key, {"songs": set(), "dimensions": set(), "sortings": set()}
+        )
+        if session.deleted or any(isinstance(obj, Song) for obj in session.new):
+            changes["dimensions"].add(ALL_DIMENSIONS)
+        for obj in session.dirty:
+            if not isinstance(obj, Song):
+                # names of artists, tags, genres or durations are shown on pages
+                changes["dimensions"].add(ALL_DIMENSIONS)
+                continue
+            attrs = inspect(obj).attrs
+            changes["songs"].add(obj.id)
+            for attribute, dimension in SONG_ATTRIBUTE_DIMENSIONS.items():
+                if attrs[attribute].history.has_changes():
+                    changes["dimensions"].add(dimension)
+            if attrs["name"].history.has_changes():
+                changes["sortings"].add("name")
+
+    def __apply(self, session: Session) -> None:
+        changes = session.info.pop(self.__info_key, None)
+        if changes is None:
+            return
+        if ALL_DIMENSIONS in changes["dimensions"]:
+            self.invalidate()
+            return
+        for id in changes["songs"]:
+            self.invalidate_song(id)
+        for dimension in changes["dimensions"]:
+            self.invalidate(dimension)
+        for field in changes["sortings"]:
+            self.invalidate_sorting(field)
+
+    def __discard(self, session: Session) -> None:
+        session.info.pop(self.__info_key, None)
@@ -0,0 +1,94 @@
+"""
+Coroutine variants of song tasks. Queries are the same as in sync tasks,
+they are executed with AsyncSession.run_sync, so the event loop is not blocked
+while SQLite works and the results are identical.
+
+classes:
+    PSAsyncObtainSongList - coroutine variant of PSObtainSongList
+    PSAsyncObtainSongs - coroutine variant of PSObtainSongs
+    PSAsyncUpdateSongs - coroutine variant of PSUpdateSongs
+"""
+from typing import List
+
+from PySide6.QtCore import Signal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from model.alchemy.async_session import AbstractAsyncSessionProvider
+from model.transport_items.db.basic import SongDetailsTransport
+from model.transport_items.db.lists import SongListTransport
+from tasks.db.aio import PSAsyncDBTask
+from services.song.tasks.list import PSObtainSongList
+from services.song.tasks.many import PSObtainSongs
+from services.song.tasks.update import PSUpdateSongs
+
+
+class PSAsyncObtainSongList(PSAsyncDBTask):
+    """
+    Obtains a list of songs
+        signal song_list_obtained: SongListTransport
+        signal chunk_obtained: List[SongDetailsTransport] - in streaming mode
+    Constructor arguments after session provider are the same as for PSObtainSongList,
+    chunks are emitted on the loop thread, so max_pending_chunks should not be set
+    """
+    song_list_obtained = Signal(SongListTransport)
+    chunk_obtained = Signal(list)
+
+    def __init__(self, id: str, session_provider: AbstractAsyncSessionProvider, *args, **kwargs):
+        super().__init__(id, session_provider)
+        self.sync_task = PSObtainSongList(id, None, *args, **kwargs)
+        self.sync_task.timeline = self.timeline
+        self.sync_task.chunk_obtained.connect(self.chunk_obtained.emit)
+
+    def success(self) -> Signal:
+        return self.song_list_obtained
+
+    def cancel(self) -> None:
+        # streaming checks the sync task between chunks
+        self.sync_task.cancel()
+        super().cancel()
+
+    def chunk_consumed(self) -> None:
+        self.sync_task.chunk_consumed()
+
+    async def query(self, session: AsyncSession) -> SongListTransport:
+        return await session.run_sync(self.sync_task.query)
+
+
+class PSAsyncObtainSongs(PSAsyncDBTask):
+    """
+    Obtains songs by list of ids
+        signal songs_obtained: List[SongDetailsTransport]
+    Constructor arguments after session provider are the same as for PSObtainSongs
+    """
+    songs_obtained = Signal(list)
+
+    def __init__(self, id: str, session_provider: AbstractAsyncSessionProvider, *args, **kwargs):
+        super().__init__(id, session_provider)
+        self.sync_task = PSObtainSongs(id, None, *args, **kwargs)
+        self.sync_task.timeline = self.timeline
+
+    def success(self) -> Signal:
+        return self.songs_obtained
+
+    async def query(self, session: AsyncSession) -> List[SongDetailsTransport]:
+        return await session.run_sync(self.sync_task.query)
+
+
+class PSAsyncUpdateSongs(PSAsyncDBTask):
+    """
+    Applies changes of songs in one transaction
+        signal songs_updated: List[int]
+    Constructor arguments after session provider are the same as for PSUpdateSongs
+    """
+    songs_updated = Signal(list)
+
+    def __init__(self, id: str, session_provider: AbstractAsyncSessionProvider, *args, **kwargs):
+        super().__init__(id, session_provider)
+        self.sync_task = PSUpdateSongs(id, None, *args, **kwargs)
+        self.sync_task.timeline = self.timeline
+
+    def success(self) -> Signal:
+        return self.songs_updated
+
+    async def query(self, session: AsyncSession) -> List[int]:
+        return await session.run_sync(self.sync_task.query)
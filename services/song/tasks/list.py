@@ -1,18 +1,43 @@
+from enum import Enum
+from threading import Semaphore
+from typing import Optional, List, Tuple
+
 from PySide6.QtCore import Signal
-from sqlalchemy.sql import select, func, Selectable
+from sqlalchemy.sql import select, func, null
 from sqlalchemy.orm import Session
 
 from model.alchemy.session import AbstractSessionProvider
-from model.alchemy.tables import (
-    Song, Artist, Genre, SongFile, Tag
-)
+from model.alchemy.tables import Song
 
 from model.transport_items.db.lists import (
-    DBSortingDirection,
     SongsListSorting, SongsListFilters, SongListTransport
 )
+from tasks import PSTaskCancelled
 from tasks.db import PSDBTask
-from services.adapters.db_to_trans_lists import song_list_to_transport
+from tasks.metrics import TaskStage
+from services.adapters.db_to_trans_lists import (
+    song_list_to_transport, song_json_list_to_transport, song_rows_to_transport,
+    song_json_row_to_transport, SongListQueryRow
+)
+from services.song.cache import SongCountCache
+from services.song.tasks.queries import SongListQueryBuilder
+from utils.cursor import decode_cursor
+
+
+class SongListStrategy(Enum):
+    """
+    How list query is executed
+        SEPARATE: page ids, count and page entities are separate statements
+        FUSED: single statement with CTE of page ids and window count
+        JSON: one row per song with tags and genres aggregated by SQLite
+            into json arrays, count is a separate statement
+        CORE: same statements as SEPARATE, but page rows are plain Core
+            tuples, no ORM objects or identity map bookkeeping
+    """
+    SEPARATE = "separate"
+    FUSED = "fused"
+    JSON = "json"
+    CORE = "core"
 
 
 class PSObtainSongList(PSDBTask):
@@ -20,6 +45,8 @@ class PSObtainSongList(PSDBTask):
     Task to obtain a list of songs
         signals:
             song_list_obtained: Signal to emit the obtained song list
+            chunk_obtained: Signal to emit a list of SongDetailsTransport
+                of the page, only in streaming mode
             error: Signal to emit an error
         fields:
             :str id: task id
@@ -27,14 +54,39 @@ class PSObtainSongList(PSDBTask):
             :int page_size: number of items per page
             :SongsListFilters filters: filters to apply to the list
             :SongsListSorting sortings: sortings to apply to the list
+            :Optional[str] after: cursor of the previous page, when set
+                keyset pagination is used and page is not used to skip rows
+            :Optional[SongCountCache] count_cache: cache of songs count,
+                count query is skipped when filters are found in it
+            :Optional[int] count_limit: songs are counted only up to the limit,
+                bigger results are reported with size_estimated set
+            :SongListStrategy strategy: how the query is executed
+            :Optional[int] chunk_size: enables streaming mode, rows are fetched
+                from the cursor and emitted with chunk_obtained by this number,
+                song_list_obtained gets the list without items
+            :Optional[int] max_pending_chunks: streaming waits while this number
+                of chunks is emitted and not consumed, None for no limit
+            :SongListQueryBuilder builder: builds selects for filters and sortings
 
-            All fields are required in the constructor
+            Fields after sortings are optional in the constructor
         methods:
             :Signal success(): service method defined to point on a signal to emit see
-            :SongListTransport : query to get the song list
-            :Selectable add_filters_and_sortings(Selectable query): adds filters and sortings to the query
+            :SongListTransport query(Session session): query to get the song list
+            :SongListTransport separate_query(Session session): three round trips query
+            :SongListTransport fused_query(Session session): single statement query
+            :SongListTransport json_query(Session session): query with tags and genres
+                aggregated in SQLite
+            :SongListTransport core_query(Session session): query of plain columns
+            :SongListTransport stream_query(Session session): query emitting
+                the page by chunks
+            :chunk_consumed(): receiver of a chunk is done with it
+            :cancel(): cancel the task, streaming waiting for the consumer stops
+            :SongListTransport transport(...): builds transport from page rows
+            :SongListTransport finish_transport(...): sets estimation flag and cursor
+            :Tuple[int, bool] count(Session session): songs count and whether it is estimated
     """
     song_list_obtained = Signal(SongListTransport)
+    chunk_obtained = Signal(list)
 
     def __init__(
         self,
@@ -43,13 +95,29 @@ class PSObtainSongList(PSDBTask):
         page: int,
         page_size: int,
         filters: SongsListFilters,
-        sortings: SongsListSorting
+        sortings: SongsListSorting,
+        after: Optional[str] = None,
+        count_cache: Optional[SongCountCache] = None,
+        count_limit: Optional[int] = None,
+        strategy: SongListStrategy = SongListStrategy.SEPARATE,
+        chunk_size: Optional[int] = None,
+        max_pending_chunks: Optional[int] = None
     ):
         super().__init__(id, session_provider)
         self.page = page
         self.page_size = page_size
         self.filters = filters
         self.sortings = sortings
+        self.after = after
+        self.count_cache = count_cache
+        self.count_limit = count_limit
+        self.count_generation: Optional[int] = None
+        self.strategy = strategy
+        self.chunk_size = chunk_size
+        self.__pending_chunks = (
+            Semaphore(max_pending_chunks) if max_pending_chunks is not None else None
+        )
+        self.builder = SongListQueryBuilder(filters, sortings)
 
     def success(self) -> Signal:
         """
@@ -59,51 +127,247 @@ class PSObtainSongList(PSDBTask):
 
     def query(self, session: Session) -> SongListTransport:
         """
-        Query to get the song list
+        Query to get the song list, runs with the selected strategy
+
+        :param session: session to execute the query
+        :return: SongListTransport
+        """
+        if self.count_cache is not None:
+            # taken before the transaction snapshot is created
+            self.count_generation = self.count_cache.generation
+        if self.chunk_size is not None:
+            return self.stream_query(session)
+        if self.strategy == SongListStrategy.FUSED:
+            return self.fused_query(session)
+        if self.strategy == SongListStrategy.JSON:
+            return self.json_query(session)
+        if self.strategy == SongListStrategy.CORE:
+            return self.core_query(session)
+        return self.separate_query(session)
+
+    def separate_query(self, session: Session) -> SongListTransport:
+        """
+        Obtains the list with three round trips: ids of the page,
+        songs count and entities of the page
 
         :param session: session to execute the query
         :return: SongListTransport
         """
-        count_query = select(func.count(Song.id.distinct())).\
-            select_from(Song).\
-            outerjoin(Song.artist).\
-            outerjoin(Song.file).\
-            outerjoin(Song.tags).\
-            outerjoin(Song.genres)
-        count_query = self.add_filters_and_sortings(count_query)
-
-        unique_song_ids = select(Song.id.distinct()).\
-            select_from(Song).\
-            outerjoin(Song.artist).\
-            outerjoin(Song.file).\
-            outerjoin(Song.tags).\
-            outerjoin(Song.genres)
-        unique_song_ids = self.add_filters_and_sortings(unique_song_ids). \
-            limit(self.page_size). \
-            offset(self.page_size * self.page)
-        unique_song_ids = {id[0] for id in session.execute(unique_song_ids).all()}
-
-        cnt = session.execute(count_query).scalar()
+        unique_song_ids = self.builder.page_ids(
+            self.page,
+            self.page_size,
+            decode_cursor(self.after) if self.after is not None else None
+        )
+        unique_song_ids = session.execute(unique_song_ids).scalars().all()
+
+        cnt, estimated = self.count(session)
         if not (cnt and unique_song_ids):
             entities = []
         else:
-            query = select(
-                Song,
-                Artist,
-                SongFile,
-                Tag,
-                Genre
-            ). \
-                outerjoin(Song.artist). \
-                outerjoin(Song.file). \
-                outerjoin(Song.tags). \
-                outerjoin(Song.genres). \
-                where(Song.id.in_(unique_song_ids))
-
+            query = self.builder.entities().where(Song.id.in_(unique_song_ids))
             entities = session.execute(query).all()
             entities = [entity.tuple() for entity in entities]
 
-        return song_list_to_transport(
+        return self.transport(entities, len(unique_song_ids), cnt, estimated)
+
+    def fused_query(self, session: Session) -> SongListTransport:
+        """
+        Obtains the list with a single statement: CTE selects ids of the page
+        along with total count (COUNT(*) OVER () is evaluated before LIMIT),
+        main select joins page entities to it.
+        When count is cached the window function is skipped. With count_limit
+        the window would count every song, so it is skipped as well and
+        capped count is queried separately, same as for an empty page
+
+        :param session: session to execute the query
+        :return: SongListTransport
+        """
+        cached = self.count_cache.get(self.filters) if self.count_cache is not None else None
+        windowed = cached is None and self.count_limit is None
+        keys = self.builder.sort_keys()
+
+        source = self.builder.filtered(*(
+            column.label(f"key_{i}") for i, (column, _) in enumerate(keys)
+        )).subquery()
+        if windowed:
+            # window is computed over all filtered songs before cursor and limit
+            source = select(source, func.count().over().label("total")).subquery()
+        key_columns = [source.c[f"key_{i}"] for i in range(len(keys))]
+
+        page = select(
+            key_columns[-1].label("id"),
+            source.c.total if windowed else null().label("total")
+        ).order_by(*self.builder.order_by(key_columns)).limit(self.page_size)
+        if self.after is not None:
+            page = page.where(
+                self.builder.keyset_condition(decode_cursor(self.after), key_columns)
+            )
+        else:
+            page = page.offset(self.page_size * self.page)
+        page = page.cte("page")
+
+        query = self.builder.entities(). \
+            add_columns(page.c.total). \
+            join(page, page.c.id == Song.id)
+        rows = session.execute(query).all()
+
+        if cached is not None:
+            cnt, estimated = cached
+        elif windowed and rows:
+            cnt, estimated = rows[0][5], False
+            if self.count_cache is not None:
+                self.count_cache.set(self.filters, cnt, estimated, self.count_generation)
+        else:
+            cnt, estimated = self.count(session)
+
+        entities = [tuple(row[:5]) for row in rows]
+        return self.transport(entities, len({row[0].id for row in rows}), cnt, estimated)
+
+    def json_query(self, session: Session) -> SongListTransport:
+        """
+        Obtains the list with one row per song: tags and genres are
+        aggregated with json_group_array, so there is no tags x genres
+        fan-out and no ORM entities are hydrated
+
+        :param session: session to execute the query
+        :return: SongListTransport
+        """
+        song_ids = self.builder.page_ids(
+            self.page,
+            self.page_size,
+            decode_cursor(self.after) if self.after is not None else None
+        )
+        rows = session.execute(self.builder.aggregated(song_ids)).all()
+        cnt, estimated = self.count(session)
+
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        result = song_json_list_to_transport(
+            rows,
+            self.page,
+            self.page_size,
+            cnt,
+            self.filters,
+            self.sortings
+        )
+        return self.finish_transport(result, len(rows), estimated)
+
+    def core_query(self, session: Session) -> SongListTransport:
+        """
+        Obtains the list as plain column tuples executed on the session
+        connection, bypassing ORM hydration for read only listing
+
+        :param session: session to execute the query
+        :return: SongListTransport
+        """
+        connection = session.connection()
+        song_ids = self.builder.page_ids(
+            self.page,
+            self.page_size,
+            decode_cursor(self.after) if self.after is not None else None
+        )
+        song_ids = connection.execute(song_ids).scalars().all()
+        cnt, estimated = self.count(session)
+        rows = []
+        if cnt and song_ids:
+            rows = connection.execute(
+                self.builder.rows().where(Song.id.in_(song_ids))
+            ).all()
+
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        result = song_rows_to_transport(
+            rows,
+            self.page,
+            self.page_size,
+            cnt,
+            self.filters,
+            self.sortings
+        )
+        return self.finish_transport(result, len(song_ids), estimated)
+
+    def stream_query(self, session: Session) -> SongListTransport:
+        """
+        Obtains the list with one row per song (as json_query) and emits it
+        by chunks while rows are fetched from the cursor, so the first songs
+        are shown before the rest is read and only a few chunks are kept in
+        memory at once. Streaming stops when the task is cancelled
+
+        :param session: session to execute the query
+        :return: SongListTransport without items
+        :raises PSTaskCancelled: task was cancelled between chunks
+        """
+        cnt, estimated = self.count(session)
+        song_ids = self.builder.page_ids(
+            self.page,
+            self.page_size,
+            decode_cursor(self.after) if self.after is not None else None
+        )
+        result = session.connection(). \
+            execution_options(yield_per=self.chunk_size). \
+            execute(self.builder.aggregated(song_ids))
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+
+        streamed, last = 0, None
+        with result:
+            for rows in result.partitions():
+                chunk = [song_json_row_to_transport(row) for row in rows]
+                self.__wait_for_consumer()
+                self.chunk_obtained.emit(chunk)
+                streamed += len(chunk)
+                last = chunk[-1]
+
+        song_list = SongListTransport(
+            items=[],
+            page=self.page,
+            page_size=self.page_size,
+            size=cnt,
+            filters=self.filters,
+            sortings=self.sortings,
+            size_estimated=estimated
+        )
+        if streamed == self.page_size:
+            song_list.after = self.builder.cursor_for(last)
+        return song_list
+
+    def chunk_consumed(self) -> None:
+        """
+        Lets streaming continue when max_pending_chunks is set,
+        should be called once for every received chunk
+        """
+        if self.__pending_chunks is not None:
+            self.__pending_chunks.release()
+
+    def cancel(self) -> None:
+        super().cancel()
+        # streaming waiting for the consumer wakes up and stops
+        self.chunk_consumed()
+
+    def __wait_for_consumer(self) -> None:
+        while True:
+            if self.cancelled:
+                raise PSTaskCancelled(self.id)
+            if self.__pending_chunks is None or self.__pending_chunks.acquire(timeout=0.05):
+                if self.cancelled:
+                    raise PSTaskCancelled(self.id)
+                return
+
+    def transport(
+        self,
+        entities: List[SongListQueryRow],
+        ids_count: int,
+        cnt: int,
+        estimated: bool
+    ) -> SongListTransport:
+        """
+        Builds transport from the page rows
+
+        :param entities: page rows ordered by list sortings
+        :param ids_count: number of distinct songs in the page
+        :param cnt: songs count
+        :param estimated: count is only a lower bound
+        :return: SongListTransport
+        """
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        result = song_list_to_transport(
             entities,
             self.page,
             self.page_size,
@@ -111,25 +375,40 @@ class PSObtainSongList(PSDBTask):
             self.filters,
             self.sortings
         )
+        return self.finish_transport(result, ids_count, estimated)
+
+    def finish_transport(
+        self,
+        result: SongListTransport,
+        ids_count: int,
+        estimated: bool
+    ) -> SongListTransport:
+        """
+        Sets count estimation flag and cursor of the next page
+        """
+        result.size_estimated = estimated
+        if ids_count == self.page_size:
+            result.after = self.builder.cursor_for(result.items[-1])
+        return result
+
+    def count(self, session: Session) -> Tuple[int, bool]:
+        """
+        Counts songs matching the filters, count from cache is used if
+        there is one. With count_limit counting stops after the limit
+
+        :param session: session to execute the query
+        :return: Tuple[int, bool] - count and whether it is only a lower bound
+        """
+        if self.count_cache is not None:
+            cached = self.count_cache.get(self.filters)
+            if cached is not None:
+                return cached
+
+        cnt = session.execute(self.builder.count(self.count_limit)).scalar()
 
-    def add_filters_and_sortings(self, query: Selectable):
-        if self.filters.artist_id is not None:
-            query = query.where(Song.artist_id == self.filters.artist_id)
-        if self.filters.genre_id is not None:
-            query = query.where(Genre.id == self.filters.genre_id)
-        if self.filters.tag_id is not None:
-            query = query.where(Tag.id == self.filters.tag_id)
-        if self.filters.liked is not None:
-            query = query.where(Song.liked == self.filters.liked)
-
-        if self.sortings.name is not None:
-            sort = SongFile.duration
-            if self.sortings.name != DBSortingDirection.ASC:
-                sort = sort.desc()
-            query = query.order_by(sort)
-        if self.sortings.duration is not None:
-            sort = SongFile.duration
-            if self.sortings.duration != DBSortingDirection.ASC:
-                sort = sort.desc()
-            query = query.order_by(sort)
-        return query
+        estimated = self.count_limit is not None and cnt > self.count_limit
+        if estimated:
+            cnt = self.count_limit
+        if self.count_cache is not None:
+            self.count_cache.set(self.filters, cnt, estimated, self.count_generation)
+        return cnt, estimated
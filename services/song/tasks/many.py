@@ -0,0 +1,55 @@
+"""
+Task that obtains many songs at once
+
+classes:
+    PSObtainSongs - obtains songs by list of ids
+"""
+from typing import List
+
+from PySide6.QtCore import Signal
+from sqlalchemy.sql import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from model.alchemy.session import AbstractSessionProvider
+from model.alchemy.tables import Song
+
+from tasks.db import PSDBTask
+from tasks.metrics import TaskStage
+from services.adapters.db_to_trans import song_db_to_trans
+
+
+class PSObtainSongs(PSDBTask):
+    """
+    Obtains songs from the database by their ids with one IN query,
+    tags and genres of all songs are loaded with one query per relation
+    instead of joins, so rows are not multiplied.
+    Songs are returned in order of requested ids, ids that were not found
+    are skipped
+        signal songs_obtained: List[SongDetailsTransport]
+    """
+    songs_obtained = Signal(list)
+
+    def __init__(self, id: str, session_provider: AbstractSessionProvider, song_ids: List[int]):
+        super().__init__(id, session_provider)
+        self.song_ids = song_ids
+
+    def success(self) -> Signal:
+        return self.songs_obtained
+
+    def query(self, session: Session) -> List:
+        query = select(Song).options(
+            joinedload(Song.artist),
+            joinedload(Song.file),
+            selectinload(Song.tags),
+            selectinload(Song.genres)
+        ).where(Song.id.in_(self.song_ids))
+        songs = {
+            song.id: song
+            for song in session.execute(query).scalars()
+        }
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        return [
+            song_db_to_trans(songs[song_id])
+            for song_id in dict.fromkeys(self.song_ids)
+            if song_id in songs
+        ]
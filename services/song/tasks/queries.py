@@ -0,0 +1,267 @@
+"""
+Query builder for song listings
+Classes:
+    SongListQueryBuilder: builds selects for a page of songs, songs count
+        and keyset pagination conditions for given filters and sortings
+"""
+from typing import Optional, List, Tuple, Any
+
+from sqlalchemy.sql import select, func, exists, and_, or_, false, Select
+from sqlalchemy.sql.elements import ColumnElement
+
+from model.alchemy.tables import Song, Artist, Genre, SongFile, Tag, song_tags, song_genres
+from model.transport_items.db.basic import SongDetailsTransport
+from model.transport_items.db.lists import (
+    DBSortingDirection, SongsListSorting, SongsListFilters
+)
+from utils.cursor import encode_cursor
+
+SortKey = Tuple[ColumnElement, bool]
+
+
+class SongListQueryBuilder:
+    """
+    Builds queries of song listing.
+    Only joins required by the active sortings are added: tag and genre
+    filters are EXISTS subqueries over association tables and artist and
+    liked filters are checked on songs table itself, so filtered selects
+    yield exactly one row per song and need no DISTINCT.
+
+    fields:
+        filters: SongsListFilters
+        sortings: SongsListSorting
+    methods:
+        filtered: select of provided columns from songs matching the filters
+        add_filters: adds filter conditions to a select from songs
+        count: select of songs count, optionally counting up to a limit
+        page_ids: select of song ids of the page, ordered by sortings
+        entities: select of the page songs with related entities
+        rows: same as entities but plain columns instead of ORM entities
+        aggregated: select of the page songs with one row per song,
+            tags and genres are aggregated into json arrays
+        sort_keys: columns the list is ordered by with descending flag,
+            Song.id is always the last one
+        order_by: order by clauses for sort keys
+        keyset_condition: condition selecting rows that follow the row
+            with provided sort key values
+        cursor_for: cursor pointing after the transport item
+    """
+    def __init__(self, filters: SongsListFilters, sortings: SongsListSorting):
+        self.filters = filters
+        self.sortings = sortings
+
+    def needs_file(self) -> bool:
+        return self.sortings.duration is not None
+
+    def filtered(self, *columns: ColumnElement) -> Select:
+        query = select(*columns).select_from(Song)
+        if self.needs_file():
+            query = query.outerjoin(Song.file)
+        return self.add_filters(query)
+
+    def add_filters(self, query: Select) -> Select:
+        if self.filters.artist_id is not None:
+            query = query.where(Song.artist_id == self.filters.artist_id)
+        if self.filters.genre_id is not None:
+            query = query.where(exists().where(
+                song_genres.c.song_id == Song.id,
+                song_genres.c.genre_id == self.filters.genre_id
+            ))
+        if self.filters.tag_id is not None:
+            query = query.where(exists().where(
+                song_tags.c.song_id == Song.id,
+                song_tags.c.tag_id == self.filters.tag_id
+            ))
+        if self.filters.liked is not None:
+            query = query.where(Song.liked == self.filters.liked)
+        return query
+
+    def count(self, limit: Optional[int] = None) -> Select:
+        """
+        :param limit: stop counting after limit + 1 songs
+        :return: select of songs count
+        """
+        if limit is None:
+            return self.add_filters(select(func.count()).select_from(Song))
+        song_ids = self.add_filters(select(Song.id)).limit(limit + 1)
+        return select(func.count()).select_from(song_ids.subquery())
+
+    def page_ids(
+        self,
+        page: int,
+        page_size: int,
+        after: Optional[List[Any]] = None
+    ) -> Select:
+        """
+        :param page: page number, used when after is not provided
+        :param page_size: number of songs in the page
+        :param after: sort key values of the previous page last song
+        :return: select of song ids of the page
+        """
+        query = self.filtered(Song.id).order_by(*self.order_by()).limit(page_size)
+        if after is not None:
+            return query.where(self.keyset_condition(after))
+        return query.offset(page_size * page)
+
+    def entities(self) -> Select:
+        """
+        :return: select of songs with artist, file, tags and genres.
+            There is a row per tag and genre combination of a song,
+            caller restricts it to the songs of the page
+        """
+        return self.with_relations(select(
+            Song,
+            Artist,
+            SongFile,
+            Tag,
+            Genre
+        ))
+
+    def rows(self) -> Select:
+        """
+        :return: Core select of songs, artist, file, tag and genre columns
+            with the same joins and order as entities. Executed on a connection
+            it produces plain tuples and no ORM objects
+        """
+        return self.with_relations(select(
+            Song.id,
+            Song.name,
+            Song.liked,
+            Artist.id,
+            Artist.name,
+            SongFile.id,
+            SongFile.duration,
+            Tag.id,
+            Tag.name,
+            Genre.id,
+            Genre.name
+        ).select_from(Song))
+
+    def with_relations(self, query: Select) -> Select:
+        """
+        Association tables are joined explicitly: relationship outer join
+        is rendered as a nested join, which SQLite materializes whole
+        """
+        return query. \
+            outerjoin(Song.artist). \
+            outerjoin(Song.file). \
+            outerjoin(song_tags, song_tags.c.song_id == Song.id). \
+            outerjoin(Tag, Tag.id == song_tags.c.tag_id). \
+            outerjoin(song_genres, song_genres.c.song_id == Song.id). \
+            outerjoin(Genre, Genre.id == song_genres.c.genre_id). \
+            order_by(*self.order_by())
+
+    def aggregated(self, song_ids: Select) -> Select:
+        """
+        :param song_ids: select of song ids to restrict the result to
+        :return: select of songs scalar columns, artist and file columns
+            and json arrays of {"id", "name"} objects for tags and genres.
+            There is exactly one row per song
+        """
+        tags = select(
+            func.json_group_array(func.json_object("id", Tag.id, "name", Tag.name))
+        ). \
+            select_from(song_tags). \
+            join(Tag, Tag.id == song_tags.c.tag_id). \
+            where(song_tags.c.song_id == Song.id). \
+            scalar_subquery()
+        genres = select(
+            func.json_group_array(func.json_object("id", Genre.id, "name", Genre.name))
+        ). \
+            select_from(song_genres). \
+            join(Genre, Genre.id == song_genres.c.genre_id). \
+            where(song_genres.c.song_id == Song.id). \
+            scalar_subquery()
+        return select(
+            Song.id,
+            Song.name,
+            Song.liked,
+            Artist.id,
+            Artist.name,
+            SongFile.id,
+            SongFile.duration,
+            tags,
+            genres
+        ). \
+            select_from(Song). \
+            outerjoin(Song.artist). \
+            outerjoin(Song.file). \
+            where(Song.id.in_(song_ids)). \
+            order_by(*self.order_by())
+
+    def sort_keys(self) -> List[SortKey]:
+        """
+        :return: sort columns with `descending` flag, Song.id is added
+            as the last key so the order is total and keyset pagination
+            never skips or repeats rows
+        """
+        keys = []
+        if self.sortings.name is not None:
+            keys.append((Song.name, self.sortings.name != DBSortingDirection.ASC))
+        if self.sortings.duration is not None:
+            keys.append((SongFile.duration, self.sortings.duration != DBSortingDirection.ASC))
+        keys.append((Song.id, False))
+        return keys
+
+    def order_by(self, columns: Optional[List[ColumnElement]] = None) -> List[ColumnElement]:
+        """
+        :param columns: columns to order by instead of sort key columns
+            (e.g. sort keys selected into a subquery)
+        """
+        keys = self.sort_keys()
+        if columns is not None:
+            keys = [(column, descending) for column, (_, descending) in zip(columns, keys)]
+        return [
+            column.desc() if descending else column
+            for column, descending in keys
+        ]
+
+    def keyset_condition(
+        self,
+        values: List[Any],
+        columns: Optional[List[ColumnElement]] = None
+    ) -> ColumnElement:
+        """
+        Condition for rows that go after the row with provided sort key values
+        in the list order. SQLite puts NULLs first in ascending order, so
+        NULL values are handled explicitly.
+
+        :param values: sort key values of the last row of the previous page
+        :param columns: columns to compare instead of sort key columns
+            (e.g. sort keys selected into a subquery)
+        :return: ColumnElement
+        """
+        keys = self.sort_keys()
+        if len(values) != len(keys):
+            raise ValueError("Cursor does not match list sortings")
+        if columns is not None:
+            keys = [(column, descending) for column, (_, descending) in zip(columns, keys)]
+
+        def equal(column, value):
+            return column.is_(None) if value is None else column == value
+
+        def follows(column, value, descending):
+            if descending:
+                return false() if value is None else or_(column < value, column.is_(None))
+            return column.is_not(None) if value is None else column > value
+
+        return or_(*(
+            and_(
+                *(equal(column, value) for (column, _), value in zip(keys[:i], values[:i])),
+                follows(keys[i][0], values[i], keys[i][1])
+            )
+            for i in range(len(keys))
+        ))
+
+    def cursor_for(self, item: SongDetailsTransport) -> str:
+        """
+        :param item: last item of the page
+        :return: cursor to obtain the items following the provided one
+        """
+        values = []
+        if self.sortings.name is not None:
+            values.append(item.name)
+        if self.sortings.duration is not None:
+            values.append(item.file.duration if item.file is not None else None)
+        values.append(item.id)
+        return encode_cursor(values)
@@ -0,0 +1,57 @@
+"""
+Task that writes changes of songs
+
+classes:
+    PSUpdateSongs - applies changes of many songs in one transaction
+items:
+    EDITABLE_FIELDS - song fields that can be changed
+"""
+from typing import Any, Dict, List
+
+from PySide6.QtCore import Signal
+from sqlalchemy.sql import select
+from sqlalchemy.orm import Session
+
+from model.alchemy.session import AbstractSessionProvider
+from model.alchemy.tables import Song
+
+from tasks.db import PSDBTask
+from tasks.metrics import TaskStage
+
+EDITABLE_FIELDS = ("name", "liked")
+
+
+class PSUpdateSongs(PSDBTask):
+    """
+    Applies changes of songs in one transaction. Songs are changed through
+    ORM, so session listeners (e.g. SongCountCache) see what was changed.
+    Transaction is committed inside query, so the write is part of the
+    query stage of the timeline. Commit error is raised from query,
+    session provider rolls the transaction back and the error reaches
+    error_occurred, same as any other error of the query
+        signal songs_updated: List[int] - ids of songs that were found and updated
+    """
+    songs_updated = Signal(list)
+
+    def __init__(
+        self,
+        id: str,
+        session_provider: AbstractSessionProvider,
+        changes: Dict[int, Dict[str, Any]]
+    ):
+        super().__init__(id, session_provider)
+        self.changes = changes
+
+    def success(self) -> Signal:
+        return self.songs_updated
+
+    def query(self, session: Session) -> List[int]:
+        songs = session.execute(
+            select(Song).where(Song.id.in_(list(self.changes)))
+        ).scalars().all()
+        for song in songs:
+            for field, value in self.changes[song.id].items():
+                setattr(song, field, value)
+        session.commit()
+        self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        return [song.id for song in songs]
@@ -0,0 +1,247 @@
+"""
+Write path for songs
+
+Classes:
+    PSSongWriteService: applies changes of songs optimistically and
+        writes them behind in batches
+"""
+import string
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+from PySide6.QtCore import QCoreApplication, QEventLoop, QTimer, Signal
+
+from model.transport_items.db.basic import SongDetailsTransport
+from indexers.song import SongsIndexer
+
+from services import PSDbService, SessionProvider, Executor
+from tasks.scheduler import TaskLane
+from services.song.tasks.update import PSUpdateSongs, EDITABLE_FIELDS
+from services.song.tasks.aio import PSAsyncUpdateSongs
+
+from utils.random import random_string_prepare
+
+Changes = Dict[int, Dict[str, Any]]
+# value of a field that was changed before its view model was obtained
+_UNKNOWN = object()
+
+
+class PSSongWriteService(PSDbService):
+    """
+    Service for changing songs.
+    Changes are applied to view models from the indexer at once and queued,
+    queue is written in one transaction when flush_interval passes since
+    the first queued change or when max_batch songs are changed. Only one
+    batch is written at a time, changes made meanwhile wait for the next one.
+
+    Change that returns a field to the value the database will have
+    (e.g. liked toggled twice) is removed from the queue, so it costs nothing.
+    If a batch fails, view models get back values of the database,
+    unless they were changed again since.
+
+    Song service should get the write service (see PSSongService.writer),
+    then songs it obtains while changes are not written yet get queued values.
+    Count and page caches of the song service are invalidated by the write
+    transaction itself (see SongCountCache.watch and SongPageCache.watch).
+    Batches are written in the background lane, the write service should
+    get the executor of the song service, so reads the user waits for
+    are not queued behind writes.
+
+    Signals:
+        :emits flushed: List[int] - ids of songs written by a batch
+        :emits flush_failed: Exception - error of a batch, its changes
+            are reverted in view models
+
+    Fields:
+        :indexer: Indexer for songs
+        :flush_interval: milliseconds changes wait in the queue
+        :max_batch: number of changed songs that triggers flush at once
+    Properties:
+        :pending_count: number of songs with queued changes
+        :flushing: batch is being written
+    Methods:
+        :update: change fields of a song
+        :set_liked: like or unlike a song
+        :toggle_liked: switch like of a song that has a view model
+        :flush: write queued changes now
+        :drain: write everything queued and wait for it, on application exit
+        :overlay: transport item with queued and written changes applied
+        :overlay_list: overlay for list of transport items
+    """
+    flushed = Signal(list)
+    flush_failed = Signal(Exception)
+
+    def __init__(
+        self,
+        session_provider: SessionProvider,
+        indexer: SongsIndexer,
+        executor: Optional[Executor] = None,
+        flush_interval: int = 500,
+        max_batch: int = 100
+    ):
+        super().__init__(session_provider, executor)
+        self.indexer = indexer
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # values the database is known to have, for fields changed since
+        self.__confirmed: Changes = {}
+        self.__pending: Changes = {}
+        self.__flushing: Changes = {}
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.timeout.connect(self.flush)
+        self.generate_task_id = random_string_prepare(
+            32,
+            string.ascii_letters + string.digits
+        )
+
+    @property
+    def pending_count(self) -> int:
+        return len(self.__pending)
+
+    @property
+    def flushing(self) -> bool:
+        return bool(self.__flushing)
+
+    def update(self, id: int, **fields: Any) -> None:
+        """
+        Changes fields of a song
+        :param id: Song id
+        :param fields: values of EDITABLE_FIELDS
+        :raises ValueError: field can not be changed
+        """
+        unknown = set(fields) - set(EDITABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Song fields {sorted(unknown)} can not be changed")
+        model = self.indexer.get(id)
+        for field, value in fields.items():
+            confirmed = self.__confirmed.setdefault(id, {})
+            if field not in confirmed and model is not None:
+                confirmed[field] = getattr(model, field)
+            self.__queue(id, field, value)
+        if model is not None:
+            with model.update():
+                for field, value in fields.items():
+                    setattr(model, field, value)
+        self.__continue()
+
+    def set_liked(self, id: int, liked: bool) -> None:
+        self.update(id, liked=liked)
+
+    def toggle_liked(self, id: int) -> None:
+        """
+        Switches like of a song, song should have a view model in the indexer
+        :raises KeyError: there is no view model for the song
+        """
+        self.set_liked(id, not self.indexer[id].liked)
+
+    def flush(self) -> None:
+        """
+        Writes queued changes in one transaction, if no batch is written now
+        """
+        self.__timer.stop()
+        if self.__flushing or not self.__pending:
+            return
+        self.__flushing, self.__pending = self.__pending, {}
+        task_class = PSAsyncUpdateSongs if self.is_async else PSUpdateSongs
+        task = task_class(self.generate_task_id(), self.session_provider, self.__flushing)
+        self.coalesce(
+            ("update", task.id),
+            lambda: task,
+            lambda ids: (ids,),
+            self.__flushed,
+            self.__failed,
+            lane=TaskLane.BACKGROUND
+        )
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """
+        Writes all queued changes and waits until they are written, should
+        be called from the GUI thread on application exit, before the
+        executor is waited for. Events are processed meanwhile, so results
+        of the batch written now are delivered and changes queued after
+        it are written by the next batch
+        :param timeout: seconds to wait
+        :return: False if timeout was reached before everything was written
+        """
+        deadline = time.monotonic() + timeout
+        while self.__flushing or self.__pending:
+            if time.monotonic() > deadline:
+                return False
+            self.flush()
+            QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 50)
+            time.sleep(0.001)
+        return True
+
+    def overlay(self, song: SongDetailsTransport) -> SongDetailsTransport:
+        """
+        :param song: song obtained from the database
+        :return: song with changes that are not written yet,
+            song itself if there are no such changes
+        """
+        changes = {
+            **self.__flushing.get(song.id, {}),
+            **self.__pending.get(song.id, {})
+        }
+        if not changes:
+            return song
+        return replace(song, **changes)
+
+    def overlay_list(self, songs: List[SongDetailsTransport]) -> List[SongDetailsTransport]:
+        if not (self.__pending or self.__flushing):
+            return songs
+        return [self.overlay(song) for song in songs]
+
+    def __queue(self, id: int, field: str, value: Any) -> None:
+        expected = self.__flushing.get(id, {})
+        if field in expected:
+            written = expected[field]
+        else:
+            written = self.__confirmed[id].get(field, _UNKNOWN)
+        changes = self.__pending.setdefault(id, {})
+        if value == written:
+            changes.pop(field, None)
+            if not changes:
+                del self.__pending[id]
+                self.__forget(id)
+        else:
+            changes[field] = value
+
+    def __flushed(self, ids: List[int]) -> None:
+        batch, self.__flushing = self.__flushing, {}
+        for id, changes in batch.items():
+            self.__confirmed.setdefault(id, {}).update(changes)
+            self.__forget(id)
+        self.flushed.emit(ids)
+        self.__continue()
+
+    def __failed(self, error: Exception) -> None:
+        batch, self.__flushing = self.__flushing, {}
+        for id, changes in batch.items():
+            model = self.indexer.get(id)
+            pending = self.__pending.get(id, {})
+            confirmed = self.__confirmed.get(id, {})
+            reverted = {
+                field: confirmed[field]
+                for field in changes
+                if field not in pending and field in confirmed
+            }
+            if model is not None and reverted:
+                with model.update():
+                    for field, value in reverted.items():
+                        setattr(model, field, value)
+            self.__forget(id)
+        self.flush_failed.emit(error)
+        self.__continue()
+
+    def __forget(self, id: int) -> None:
+        # confirmed values are needed only while the song has changes queued
+        if id not in self.__pending and id not in self.__flushing:
+            self.__confirmed.pop(id, None)
+
+    def __continue(self) -> None:
+        if len(self.__pending) >= self.max_batch:
+            self.flush()
+        elif self.__pending and not self.__timer.isActive():
+            self.__timer.start(self.flush_interval)
@@ -3,27 +3,71 @@ Module for tasks, tasks are operations that are executed in separate thread
 
 classes:
     PSTask - abstract class for task
+    PSTaskCancelled - raised inside a task that was cancelled while running
 modules:
     db - tasks to work with database
+    executor - bounded pool of worker threads that runs tasks
+    scheduler - lanes that decide which queued task starts next
+    metrics - timelines of tasks and sinks they are recorded to
 """
-from PySide6.QtCore import QThread
+from PySide6.QtCore import QObject
 from PySide6.QtCore import Signal
 
+from tasks.metrics import TaskTimeline, TaskStage
 
-class PSTask(QThread):
+
+class PSTaskCancelled(Exception):
+    """
+    Task was cancelled before it completed
+    """
+
+
+class PSTask(QObject):
     """
-    Abstract class for task, subclass must implement method
-    signals: error_occurred(Exception) - emits Exception that occurred
+    Abstract class for task, subclass must implement run method.
+    Task is not a thread itself, it is executed by PSTaskExecutor
+    on one of the reusable worker threads
+    signals:
+        error_occurred(Exception) - emits Exception that occurred
+        finished(str) - emits task id when run is over
+            (both on success and on error)
 
     properties:
         id - id to identify particular task
+        cancelled - task was cancelled, its result is dropped
+        timeline - moments the task reached its stages (see tasks.metrics)
+    methods:
+        run - task body, executed in a worker thread
+        cancel - mark task as cancelled, may be called from any thread
     """
     error_occurred = Signal(Exception)
+    finished = Signal(str)
 
     def __init__(self, id: str):
         super().__init__()
         self.__id = id
+        self.__cancelled = False
+        self.__timeline = TaskTimeline(type(self).__name__, id)
+        self.__timeline.mark(TaskStage.CREATED)
 
     @property
     def id(self) -> str:
         return self.__id
+
+    @property
+    def timeline(self) -> TaskTimeline:
+        return self.__timeline
+
+    @timeline.setter
+    def timeline(self, value: TaskTimeline) -> None:
+        self.__timeline = value
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__cancelled
+
+    def cancel(self) -> None:
+        self.__cancelled = True
+
+    def run(self) -> None:
+        raise NotImplementedError("Run method was not implemented")
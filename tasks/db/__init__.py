@@ -1,11 +1,19 @@
 """
+Database tasks
+classes:
+    PSDBTask - abstract class for task that queries database in a worker thread
+modules:
+    aio - coroutine based database tasks
 """
-from typing import Any
+from threading import Lock
+from contextlib import contextmanager
+from typing import Any, Optional, Callable
 
 from PySide6.QtCore import Signal
 from sqlalchemy.orm.session import Session
 
-from tasks import PSTask
+from tasks import PSTask, PSTaskCancelled
+from tasks.metrics import TaskStage
 from model.alchemy.session import AbstractSessionProvider
 
 
@@ -21,7 +29,14 @@ class PSDBTask(PSTask):
             will be passed as separate arguments sequentially
 
     methods:
-        run: run QThread, this method should not be overridden
+        run: executed in a worker thread by PSTaskExecutor,
+            this method should not be overridden
+        emit_result: emits error or success signal with query result,
+            nothing is emitted for cancelled task
+        mark_adapted: marks end of the query on the timeline
+        cancel: cancel the task, query running in SQLite is interrupted
+        interruptible: context manager, while in it cancel interrupts
+            query using provided function
     """
     def __init__(
         self,
@@ -30,9 +45,8 @@ class PSDBTask(PSTask):
     ):
         super().__init__(id)
         self.session_provider = session_provider
-
-    def __del__(self):
-        self.session_provider.close()
+        self.__interrupt_lock = Lock()
+        self.__interrupt: Optional[Callable[[], Any]] = None
 
     def success(self) -> Signal:
         raise NotImplementedError("Successful signal was not set for the class")
@@ -41,22 +55,70 @@ class PSDBTask(PSTask):
         raise NotImplementedError("Query method was not implemented")
 
     def run(self):
+        if self.cancelled:
+            return
         result = None
         error = None
-        with self.session_provider() as session:
-            try:
-                result = self.query(session)
-            except Exception as e:
-                error = e
-                raise e
+        try:
+            # provider rolls back on error and raises it further,
+            # failed commit reaches error signal as well
+            with self.session_provider() as session:
+                connection = session.connection().connection.driver_connection
+                self.timeline.mark(TaskStage.SESSION_ACQUIRED)
+                with self.interruptible(connection.interrupt):
+                    result = self.query(session)
+                self.mark_adapted()
+        except Exception as e:
+            error = e
+        self.emit_result(result, error)
+
+    @contextmanager
+    def interruptible(self, interrupt: Callable[[], Any]):
+        """
+        Allows cancel to interrupt operations in the context.
+        Interrupt function is forgotten on exit, so it is never called
+        for connection that was returned to the pool and is used by
+        another task
+        :param interrupt: function that interrupts running query
+        :raises PSTaskCancelled: task was cancelled before the context
+        """
+        with self.__interrupt_lock:
+            if self.cancelled:
+                raise PSTaskCancelled(self.id)
+            self.__interrupt = interrupt
+        try:
+            yield
+        finally:
+            with self.__interrupt_lock:
+                self.__interrupt = None
+
+    def cancel(self) -> None:
+        with self.__interrupt_lock:
+            super().cancel()
+            if self.__interrupt is not None:
+                self.__interrupt()
+
+    def mark_adapted(self) -> None:
+        """
+        Marks end of the query on timeline. Query that builds transport
+        items from rows should mark QUERY_EXECUTED itself before that,
+        otherwise both stages are marked at once
+        """
+        if TaskStage.QUERY_EXECUTED not in self.timeline:
+            self.timeline.mark(TaskStage.QUERY_EXECUTED)
+        self.timeline.mark(TaskStage.ADAPTED)
 
+    def emit_result(self, result: Any, error: Optional[Exception]) -> None:
+        if self.cancelled:
+            return
         if error is not None:
+            self.timeline.outcome = "error"
             self.error_occurred.emit(error)
         else:
             success_signal = self.success()
             if result is None:
                 success_signal.emit()
-            if isinstance(result, tuple):
+            elif isinstance(result, tuple):
                 success_signal.emit(*result)
             else:
                 success_signal.emit(result)
@@ -0,0 +1,67 @@
+"""
+Coroutine based database tasks. Such tasks do not occupy a thread each,
+they are multiplexed on the thread of the asyncio loop integrated with Qt
+loop (see PySide6.QtAsyncio) and executed by PSAsyncTaskExecutor
+
+classes:
+    PSAsyncDBTask - abstract class for coroutine database task
+"""
+import asyncio
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tasks.db import PSDBTask
+from tasks.metrics import TaskStage
+from model.alchemy.async_session import AbstractAsyncSessionProvider
+
+
+class PSAsyncDBTask(PSDBTask):
+    """
+    Abstract class for coroutine DB task, subclass must implement
+    query coroutine and success method (see PSDBTask)
+
+    methods:
+        run_async: coroutine executed by PSAsyncTaskExecutor,
+            this method should not be overridden
+    """
+    def __init__(
+        self,
+        id: str,
+        session_provider: AbstractAsyncSessionProvider
+    ):
+        super().__init__(id, session_provider)
+        self.__driver = None
+
+    async def query(self, session: AsyncSession) -> Any:
+        raise NotImplementedError("Query coroutine was not implemented")
+
+    def run(self):
+        raise NotImplementedError("Async task should be run with PSAsyncTaskExecutor")
+
+    async def run_async(self):
+        if self.cancelled:
+            return
+        result = None
+        error = None
+        try:
+            async with self.session_provider() as session:
+                connection = await session.connection()
+                raw = await connection.get_raw_connection()
+                self.__driver = raw.driver_connection
+                self.timeline.mark(TaskStage.SESSION_ACQUIRED)
+                try:
+                    with self.interruptible(lambda: asyncio.ensure_future(self.__interrupt())):
+                        result = await self.query(session)
+                    self.mark_adapted()
+                finally:
+                    self.__driver = None
+        except Exception as e:
+            error = e
+        self.emit_result(result, error)
+
+    async def __interrupt(self):
+        # interruption is scheduled on the loop, by then query could be over
+        # and connection could serve another task
+        if self.__driver is not None:
+            await self.__driver.interrupt()
@@ -0,0 +1,219 @@
+"""
+Module contains executors that run tasks off the GUI thread.
+Both executors queue tasks in lanes (see tasks.scheduler), interactive
+tasks are started before background ones. Timelines of finished tasks
+are recorded to the metrics sink (see tasks.metrics) after their results
+are delivered.
+
+classes:
+    PSTaskExecutor - runs tasks on a bounded pool of reusable threads
+    PSAsyncTaskExecutor - runs coroutine tasks on asyncio loop
+"""
+import asyncio
+from typing import Optional, Dict, Set
+
+from PySide6.QtCore import QObject, QThreadPool, Qt
+
+from tasks import PSTask
+from tasks.scheduler import TaskLane, LaneLimits, LaneStats, LaneScheduler
+from tasks.metrics import TaskStage, get_sink
+
+
+class PSTaskExecutor(QObject):
+    """
+    Runs tasks on a bounded pool of worker threads. Threads are reused
+    between tasks, so there is no thread creation per request. Results
+    of the task are delivered with task signals, which are queued to the
+    thread the receivers live in (GUI thread for services and controllers).
+
+    Executor keeps a reference to the submitted task until the task is
+    finished, so the caller does not need to store it.
+    Tasks are queued by the executor and handed to the pool only when
+    there is a free thread and their lane is not at its limit.
+
+    properties:
+        max_concurrency: maximum number of tasks running simultaneously
+        active_count: number of tasks submitted and not finished yet
+        lane_stats: queue depth and wait times per lane
+    methods:
+        submit: schedule task for execution
+        promote: move queued task to another lane
+        wait_for_done: block until all submitted tasks are finished
+    """
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        lanes: Optional[Dict[TaskLane, LaneLimits]] = None
+    ):
+        super().__init__()
+        self.__pool = QThreadPool()
+        if max_concurrency is not None:
+            self.__pool.setMaxThreadCount(max_concurrency)
+        self.__scheduler = LaneScheduler(self.__pool.maxThreadCount(), lanes)
+        self.__tasks: Dict[str, PSTask] = {}
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.__pool.maxThreadCount()
+
+    @max_concurrency.setter
+    def max_concurrency(self, value: int) -> None:
+        self.__pool.setMaxThreadCount(value)
+        self.__scheduler.max_concurrency = value
+        self.__dispatch()
+
+    @property
+    def active_count(self) -> int:
+        return len(self.__tasks)
+
+    @property
+    def lane_stats(self) -> Dict[TaskLane, LaneStats]:
+        return self.__scheduler.stats()
+
+    def submit(self, task: PSTask, lane: TaskLane = TaskLane.INTERACTIVE) -> None:
+        """
+        Schedule task to be run in one of the worker threads
+        :param PSTask task: task to run
+        :param TaskLane lane: lane the task is queued in
+        :return: None
+        """
+        self.__tasks[task.id] = task
+        task.timeline.mark(TaskStage.SCHEDULED)
+        task.finished.connect(self.__release)
+        self.__scheduler.push(task, lane)
+        self.__dispatch()
+
+    def promote(self, task: PSTask, lane: TaskLane = TaskLane.INTERACTIVE) -> bool:
+        """
+        Moves task that is not started yet to another lane,
+        e.g. when the user waits for a task started in background
+        :return: False if the task is not queued
+        """
+        if not self.__scheduler.promote(task, lane):
+            return False
+        self.__dispatch()
+        return True
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        """
+        Blocks until all running and queued tasks are finished
+        :param int msecs: timeout in milliseconds, -1 to wait forever
+        :return: bool - False if timeout was reached
+        """
+        return self.__pool.waitForDone(msecs)
+
+    def __dispatch(self) -> None:
+        # called from worker threads too, so the next task is handed
+        # to the pool before the finished one leaves it (see wait_for_done)
+        while (scheduled := self.__scheduler.pop()) is not None:
+            task, lane = scheduled
+            self.__pool.start(lambda task=task, lane=lane: self.__run(task, lane))
+
+    def __run(self, task: PSTask, lane: TaskLane) -> None:
+        task.timeline.mark(TaskStage.STARTED)
+        try:
+            task.run()
+        finally:
+            self.__scheduler.done(lane)
+            task.finished.emit(task.id)
+            self.__dispatch()
+
+    def __release(self, task_id: str) -> None:
+        task = self.__tasks.pop(task_id, None)
+        if task is not None:
+            record(task)
+
+
+class PSAsyncTaskExecutor(QObject):
+    """
+    Runs coroutine tasks (tasks.db.aio.PSAsyncDBTask) on the asyncio event
+    loop of the current thread. To work along with Qt the loop should be
+    QtAsyncio loop, then tasks are multiplexed on the GUI thread and their
+    signals are delivered directly.
+
+    properties:
+        max_concurrency: maximum number of tasks awaiting their queries
+            simultaneously, the rest wait for their turn in lanes
+        active_count: number of tasks submitted and not finished yet
+        lane_stats: queue depth and wait times per lane
+    methods:
+        submit: schedule task for execution
+        promote: move queued task to another lane
+    """
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        lanes: Optional[Dict[TaskLane, LaneLimits]] = None
+    ):
+        super().__init__()
+        self.__scheduler = LaneScheduler(max_concurrency, lanes)
+        self.__tasks: Dict[str, PSTask] = {}
+        self.__running: Set[asyncio.Task] = set()
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.__scheduler.max_concurrency
+
+    @property
+    def active_count(self) -> int:
+        return len(self.__tasks)
+
+    @property
+    def lane_stats(self) -> Dict[TaskLane, LaneStats]:
+        return self.__scheduler.stats()
+
+    def submit(self, task: PSTask, lane: TaskLane = TaskLane.INTERACTIVE) -> None:
+        """
+        Schedule task coroutine on the event loop
+        :param PSAsyncDBTask task: task to run
+        :param TaskLane lane: lane the task is queued in
+        :return: None
+        """
+        # queued, so the task outlives delivery of its queued result signals
+        task.finished.connect(self.__release, Qt.ConnectionType.QueuedConnection)
+        self.__tasks[task.id] = task
+        task.timeline.mark(TaskStage.SCHEDULED)
+        self.__scheduler.push(task, lane)
+        self.__dispatch()
+
+    def promote(self, task: PSTask, lane: TaskLane = TaskLane.INTERACTIVE) -> bool:
+        """
+        Moves task that is not started yet to another lane,
+        e.g. when the user waits for a task started in background
+        :return: False if the task is not queued
+        """
+        if not self.__scheduler.promote(task, lane):
+            return False
+        self.__dispatch()
+        return True
+
+    def __dispatch(self) -> None:
+        loop = asyncio.get_event_loop()
+        while (scheduled := self.__scheduler.pop()) is not None:
+            future = loop.create_task(self.__run(*scheduled))
+            self.__running.add(future)
+            future.add_done_callback(self.__running.discard)
+
+    async def __run(self, task: PSTask, lane: TaskLane) -> None:
+        task.timeline.mark(TaskStage.STARTED)
+        try:
+            await task.run_async()
+        finally:
+            self.__scheduler.done(lane)
+            task.finished.emit(task.id)
+            self.__dispatch()
+
+    def __release(self, task_id: str) -> None:
+        task = self.__tasks.pop(task_id, None)
+        if task is not None:
+            record(task)
+
+
+def record(task: PSTask) -> None:
+    """
+    Records timeline of the finished task to the metrics sink,
+    called in the GUI thread after queued results are delivered
+    """
+    if task.cancelled:
+        task.timeline.outcome = "cancelled"
+    get_sink().record(task.timeline)
@@ -0,0 +1,210 @@
+"""
+Timing of tasks. Every task has a timeline of stages it passed, timelines
+of finished tasks are recorded by executors to the metrics sink.
+
+classes:
+    TaskStage - stages of a task, in order
+    TaskTimeline - moments a task reached its stages
+    MetricsSink - abstract receiver of timelines
+    InMemoryMetricsSink - keeps recent timelines per task class,
+        answers percentiles and exports JSON lines
+functions:
+    get_sink - sink timelines are recorded to
+    set_sink - replace the sink
+"""
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from math import ceil
+from threading import Lock
+from time import perf_counter
+from typing import Deque, Dict, Iterable, List, Optional, TextIO
+
+
+class TaskStage(Enum):
+    """
+    CREATED - task object is created
+    SCHEDULED - task is submitted to executor
+    STARTED - executor started the task
+    SESSION_ACQUIRED - database session and connection are obtained
+    QUERY_EXECUTED - database returned rows
+    ADAPTED - rows are converted to transport items
+    DELIVERED - result signal reached the GUI thread
+    VIEW_MODEL_UPDATED - view models are created or updated from the result
+    """
+    CREATED = "created"
+    SCHEDULED = "scheduled"
+    STARTED = "started"
+    SESSION_ACQUIRED = "session_acquired"
+    QUERY_EXECUTED = "query_executed"
+    ADAPTED = "adapted"
+    DELIVERED = "delivered"
+    VIEW_MODEL_UPDATED = "view_model_updated"
+
+
+@dataclass(slots=True)
+class TaskTimeline:
+    """
+    fields:
+        task_class: name of the task class
+        task_id: id of the task
+        marks: perf_counter value for every reached stage
+        outcome: "ok", "error" or "cancelled"
+    methods:
+        mark: remember the moment task reached the stage
+        duration: seconds between two stages
+        to_json: timeline as JSON serializable dict, stages are in
+            milliseconds since creation
+    """
+    task_class: str
+    task_id: str
+    marks: Dict[TaskStage, float] = field(default_factory=dict)
+    outcome: str = "ok"
+
+    def __contains__(self, stage: TaskStage) -> bool:
+        return stage in self.marks
+
+    def mark(self, stage: TaskStage) -> None:
+        self.marks[stage] = perf_counter()
+
+    def duration(
+        self,
+        start: TaskStage = TaskStage.CREATED,
+        end: Optional[TaskStage] = None
+    ) -> Optional[float]:
+        """
+        :param start: first stage
+        :param end: last stage, None for the last reached one
+        :return: seconds or None if one of stages was not reached
+        """
+        if end is None:
+            end = max(self.marks, key=self.marks.get, default=None)
+        if start not in self.marks or end not in self.marks:
+            return None
+        return self.marks[end] - self.marks[start]
+
+    def to_json(self) -> dict:
+        created = self.marks.get(TaskStage.CREATED, 0.0)
+        return {
+            "task": self.task_class,
+            "id": self.task_id,
+            "outcome": self.outcome,
+            "stages": {
+                stage.value: round((moment - created) * 1000, 3)
+                for stage, moment in self.marks.items()
+            },
+        }
+
+
+class MetricsSink(ABC):
+    """
+    Receiver of timelines of finished tasks,
+    record may be called from any thread
+
+    sink should implement the following methods:
+        record: store or send the timeline
+    """
+
+    @abstractmethod
+    def record(self, timeline: TaskTimeline) -> None: ...
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Keeps last max_samples timelines for every task class, percentiles
+    are calculated over them, so they reflect recent behaviour
+
+    methods:
+        task_classes: names of task classes that were recorded
+        timelines: recorded timelines of the task class
+        percentile: duration between stages at the percentile
+        percentiles: several percentiles at once
+        export_json_lines: write timelines as JSON lines
+        clear: forget everything
+    """
+    def __init__(self, max_samples: int = 1024):
+        self.__max_samples = max_samples
+        self.__lock = Lock()
+        self.__timelines: Dict[str, Deque[TaskTimeline]] = {}
+
+    def record(self, timeline: TaskTimeline) -> None:
+        with self.__lock:
+            timelines = self.__timelines.get(timeline.task_class)
+            if timelines is None:
+                timelines = self.__timelines[timeline.task_class] = deque(maxlen=self.__max_samples)
+            timelines.append(timeline)
+
+    def task_classes(self) -> List[str]:
+        with self.__lock:
+            return list(self.__timelines)
+
+    def timelines(self, task_class: str) -> List[TaskTimeline]:
+        with self.__lock:
+            return list(self.__timelines.get(task_class, ()))
+
+    def percentile(
+        self,
+        task_class: str,
+        q: float,
+        start: TaskStage = TaskStage.CREATED,
+        end: Optional[TaskStage] = None
+    ) -> Optional[float]:
+        """
+        :param task_class: name of the task class, e.g. "PSObtainSongList"
+        :param q: percentile, 0 - 100
+        :param start: first stage
+        :param end: last stage, None for the last reached one
+        :return: seconds or None if there are no successful timelines
+        """
+        return self.percentiles(task_class, (q,), start, end).get(q)
+
+    def percentiles(
+        self,
+        task_class: str,
+        qs: Iterable[float] = (50, 90, 99),
+        start: TaskStage = TaskStage.CREATED,
+        end: Optional[TaskStage] = None
+    ) -> Dict[float, float]:
+        durations = sorted(
+            duration
+            for timeline in self.timelines(task_class)
+            if timeline.outcome == "ok"
+            and (duration := timeline.duration(start, end)) is not None
+        )
+        if not durations:
+            return {}
+        # nearest rank
+        return {
+            q: durations[max(0, ceil(q / 100 * len(durations)) - 1)]
+            for q in qs
+        }
+
+    def export_json_lines(self, stream: TextIO) -> int:
+        """
+        :param stream: text stream to write to
+        :return: number of written lines
+        """
+        with self.__lock:
+            timelines = [timeline for each in self.__timelines.values() for timeline in each]
+        for timeline in timelines:
+            stream.write(json.dumps(timeline.to_json()))
+            stream.write("\n")
+        return len(timelines)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__timelines.clear()
+
+
+_sink: MetricsSink = InMemoryMetricsSink()
+
+
+def get_sink() -> MetricsSink:
+    return _sink
+
+
+def set_sink(sink: MetricsSink) -> None:
+    global _sink
+    _sink = sink
@@ -0,0 +1,200 @@
+"""
+Scheduler that decides which of the queued tasks starts next,
+used by executors
+
+classes:
+    TaskLane - lanes tasks are queued in
+    LaneLimits - concurrency limit and aging of a lane
+    LaneStats - snapshot of lane queue and wait times
+    LaneScheduler - queues of tasks per lane
+items:
+    DEFAULT_AGING - seconds after which background task is started
+        before interactive ones
+"""
+from collections import deque
+from dataclasses import dataclass, replace
+from enum import Enum
+from threading import Lock
+from time import perf_counter
+from typing import Deque, Dict, Generic, Optional, Tuple, TypeVar
+
+Item = TypeVar("Item")
+
+DEFAULT_AGING = 0.5
+
+
+class TaskLane(Enum):
+    """
+    INTERACTIVE - requests the user waits for: details, lists
+    BACKGROUND - speculative and maintenance work: prefetch, refreshes
+    """
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+@dataclass(slots=True, frozen=True)
+class LaneLimits:
+    """
+    fields:
+        max_concurrency: maximum number of tasks of the lane running
+            simultaneously, None for no limit besides executor one
+        aging: seconds after which queued task of the lane is started before
+            tasks of lanes with higher priority, None to never age
+    """
+    max_concurrency: Optional[int] = None
+    aging: Optional[float] = None
+
+
+@dataclass(slots=True)
+class LaneStats:
+    """
+    fields:
+        queued: tasks waiting to be started
+        running: tasks started and not finished
+        started: tasks started since creation of the scheduler
+        aged: tasks started before tasks of higher priority lanes
+            because of waiting for too long
+        wait_total: seconds started tasks waited in the queue
+        wait_max: longest wait of a started task
+    properties:
+        wait_mean: average wait of a started task
+    """
+    queued: int = 0
+    running: int = 0
+    started: int = 0
+    aged: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    @property
+    def wait_mean(self) -> float:
+        return self.wait_total / self.started if self.started else 0.0
+
+
+class LaneScheduler(Generic[Item]):
+    """
+    Thread-safe queues of items per lane. Lanes are ordered by priority
+    (order of TaskLane), the next item is taken from the first lane that
+    has queued items and free capacity, unless an item of a lower priority
+    lane has waited longer than its lane aging, then the oldest of such
+    items is taken. So interactive tasks start first, but background ones
+    are not starved by a constant stream of interactive tasks.
+
+    properties:
+        max_concurrency: maximum number of running items of all lanes
+        running: number of running items of all lanes
+    methods:
+        push: queue an item
+        pop: take the next item to start, or None if nothing can start
+        done: mark item of the lane as finished
+        promote: move queued item to another lane
+        stats: snapshot of lanes stats
+    """
+    def __init__(
+        self,
+        max_concurrency: int,
+        lanes: Optional[Dict[TaskLane, LaneLimits]] = None
+    ):
+        if lanes is None:
+            lanes = {
+                TaskLane.INTERACTIVE: LaneLimits(),
+                TaskLane.BACKGROUND: LaneLimits(
+                    max_concurrency=max(1, max_concurrency // 4),
+                    aging=DEFAULT_AGING
+                ),
+            }
+        self.max_concurrency = max_concurrency
+        self.__lock = Lock()
+        self.__limits = {lane: lanes.get(lane, LaneLimits()) for lane in TaskLane}
+        self.__queues: Dict[TaskLane, Deque[Tuple[Item, float]]] = {
+            lane: deque() for lane in TaskLane
+        }
+        self.__stats = {lane: LaneStats() for lane in TaskLane}
+        self.__running = 0
+
+    @property
+    def running(self) -> int:
+        return self.__running
+
+    def push(self, item: Item, lane: TaskLane = TaskLane.INTERACTIVE) -> None:
+        with self.__lock:
+            self.__queues[lane].append((item, perf_counter()))
+            self.__stats[lane].queued += 1
+
+    def pop(self) -> Optional[Tuple[Item, TaskLane]]:
+        """
+        Takes the next item and counts it as running
+        :return: item and its lane or None
+        """
+        with self.__lock:
+            if self.__running >= self.max_concurrency:
+                return None
+            now = perf_counter()
+            ready = [
+                lane for lane in TaskLane
+                if self.__queues[lane] and not self.__full(lane)
+            ]
+            if not ready:
+                return None
+            aged = [
+                lane for lane in ready[1:]
+                if self.__limits[lane].aging is not None
+                and now - self.__queues[lane][0][1] >= self.__limits[lane].aging
+            ]
+            if aged:
+                lane = min(aged, key=lambda lane: self.__queues[lane][0][1])
+            else:
+                lane = ready[0]
+            item, queued_at = self.__queues[lane].popleft()
+            wait = now - queued_at
+            stats = self.__stats[lane]
+            stats.queued -= 1
+            stats.running += 1
+            stats.started += 1
+            stats.aged += bool(aged)
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            self.__running += 1
+            return item, lane
+
+    def promote(self, item: Item, lane: TaskLane) -> bool:
+        """
+        Moves queued item to another lane, item keeps its place by the
+        moment it was queued
+        :return: False if item is not queued in another lane
+        """
+        with self.__lock:
+            for source in TaskLane:
+                if source == lane:
+                    continue
+                queue = self.__queues[source]
+                position = next(
+                    (i for i, (queued, _) in enumerate(queue) if queued is item), None
+                )
+                if position is None:
+                    continue
+                _, queued_at = queue[position]
+                del queue[position]
+                self.__stats[source].queued -= 1
+                target = self.__queues[lane]
+                position = next(
+                    (i for i, (_, other_at) in enumerate(target) if other_at > queued_at),
+                    len(target)
+                )
+                target.insert(position, (item, queued_at))
+                self.__stats[lane].queued += 1
+                return True
+            return False
+
+    def done(self, lane: TaskLane) -> None:
+        with self.__lock:
+            self.__stats[lane].running -= 1
+            self.__running -= 1
+
+    def stats(self) -> Dict[TaskLane, LaneStats]:
+        with self.__lock:
+            return {lane: replace(stats) for lane, stats in self.__stats.items()}
+
+    def __full(self, lane: TaskLane) -> bool:
+        limit = self.__limits[lane].max_concurrency
+        return limit is not None and self.__stats[lane].running >= limit
@@ -0,0 +1,136 @@
+"""
+Benchmark of song list query strategies.
+Creates a temporary library and measures average latency of obtaining
+pages with every SongListStrategy, then compares hydration of page rows:
+ORM entities with song_list_to_transport vs plain Core tuples with
+song_rows_to_transport
+
+usage: python -m tests.bench_song_list [songs] [repeats]
+"""
+import os
+import sys
+import tempfile
+from random import Random
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from model.alchemy.install import sqlite_engine, install
+from model.alchemy.tables import Song, SongFile, Artist, Tag, Genre, song_tags, song_genres
+from model.transport_items.db import DBSortingDirection
+from model.transport_items.db.lists import SongsListFilters, SongsListSorting
+from services.song.tasks.list import PSObtainSongList, SongListStrategy
+from services.song.tasks.queries import SongListQueryBuilder
+from services.adapters.db_to_trans_lists import song_list_to_transport, song_rows_to_transport
+
+
+def library(file_name: str, songs: int, seed: int = 12):
+    """
+    Fills database with songs, each song gets up to 3 tags and 3 genres
+    """
+    rnd = Random(seed)
+    engine = sqlite_engine(file_name, "bulk_load")
+    install(engine)
+    with Session(engine) as session:
+        session.execute(insert(Artist), [{"name": f"artist {i}"} for i in range(500)])
+        session.execute(insert(Tag), [{"name": f"tag {i}"} for i in range(100)])
+        session.execute(insert(Genre), [{"name": f"genre {i}"} for i in range(100)])
+        session.execute(insert(SongFile), [
+            {"duration": rnd.randint(380, 620)} for _ in range(songs)
+        ])
+        session.execute(insert(Song), [
+            {
+                "name": f"song {rnd.randint(0, songs)}",
+                "liked": rnd.random() < 0.2,
+                "file_id": i + 1,
+                "artist_id": rnd.randint(1, 500)
+            }
+            for i in range(songs)
+        ])
+        session.execute(insert(song_tags), [
+            {"song_id": i + 1, "tag_id": tag}
+            for i in range(songs)
+            for tag in rnd.sample(range(1, 101), rnd.randint(0, 3))
+        ])
+        session.execute(insert(song_genres), [
+            {"song_id": i + 1, "genre_id": genre}
+            for i in range(songs)
+            for genre in rnd.sample(range(1, 101), rnd.randint(0, 3))
+        ])
+        session.commit()
+    engine.dispose()
+
+
+def measure(action: Callable[[], None], repeats: int) -> float:
+    """
+    :return: average time of the action, milliseconds
+    """
+    started = perf_counter()
+    for _ in range(repeats):
+        action()
+    return (perf_counter() - started) / repeats * 1000
+
+
+def hydration(session: Session, page_size: int, repeats: int):
+    """
+    Measures fetching and adapting rows of a page, page ids are known
+    """
+    filters = SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=None)
+    sortings = SongsListSorting(name=None, duration=None)
+    builder = SongListQueryBuilder(filters, sortings)
+    song_ids = session.execute(builder.page_ids(0, page_size)).scalars().all()
+
+    def orm():
+        rows = session.execute(builder.entities().where(Song.id.in_(song_ids))).all()
+        song_list_to_transport([tuple(row) for row in rows], 0, page_size, 0, filters, sortings)
+        # identity map is dropped as it would be with a new session per task
+        session.expunge_all()
+
+    def core():
+        rows = session.connection().execute(builder.rows().where(Song.id.in_(song_ids))).all()
+        song_rows_to_transport(rows, 0, page_size, 0, filters, sortings)
+
+    for name, action in (("orm", orm), ("core", core)):
+        elapsed = measure(action, repeats)
+        print(f"hydration {name:<10} {page_size:>5} songs {elapsed:8.2f} ms")
+
+
+def main(songs: int = 20_000, repeats: int = 20):
+    folder = tempfile.mkdtemp()
+    file_name = os.path.join(folder, "bench.db")
+    library(file_name, songs)
+    engine = sqlite_engine(file_name, "readonly")
+
+    cases = {
+        "all, by name": (
+            SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=None),
+            SongsListSorting(name=DBSortingDirection.ASC, duration=None)
+        ),
+        "tag, by duration": (
+            SongsListFilters(tag_id=7, genre_id=None, artist_id=None, liked=None),
+            SongsListSorting(name=None, duration=DBSortingDirection.DESC)
+        ),
+        "liked + genre": (
+            SongsListFilters(tag_id=None, genre_id=3, artist_id=None, liked=True),
+            SongsListSorting(name=None, duration=None)
+        ),
+    }
+    with Session(engine) as session:
+        for case, (filters, sortings) in cases.items():
+            for strategy in SongListStrategy:
+                for page in (0, 50):
+                    task = PSObtainSongList(
+                        "bench", None, page, 50, filters, sortings,
+                        strategy=strategy
+                    )
+                    elapsed = measure(lambda: task.query(session), repeats)
+                    print(f"{case:<20} {strategy.value:<10} page {page:<4} {elapsed:8.2f} ms")
+        for page_size in (50, 1000):
+            hydration(session, page_size, repeats)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,101 @@
+"""
+Benchmark of song view models.
+Measures memory and time of creating song models with indexers:
+PSSongModel (QObject per model) vs CompactSongModel (__slots__ object,
+one notifier per indexer), then time of refreshing a page where
+every model is changed, with change notifications delivered
+
+usage: python -m tests.bench_view_models [songs] [page_size]
+"""
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from PySide6.QtCore import QCoreApplication
+
+from indexers import AbstractIndexer
+from indexers.song import SongsIndexer, CompactSongsIndexer
+from model.transport_items.db.basic import (
+    SongDetailsTransport, ArtistTransport, SongFileTransport
+)
+from model.view_models import PSModelChangeCoalescer
+
+
+def songs(count: int, liked: bool = False) -> List[SongDetailsTransport]:
+    artists = [ArtistTransport(id=i, name=f"artist {i}") for i in range(100)]
+    return [
+        SongDetailsTransport(
+            id=i, name=f"song {i}", liked=liked,
+            artist=artists[i % 100],
+            file=SongFileTransport(id=i, duration=100 + i % 300),
+            tags=[], genres=[]
+        )
+        for i in range(count)
+    ]
+
+
+def creation(make_indexer: Callable[[], AbstractIndexer], items: List[SongDetailsTransport]) -> Tuple[float, int, list]:
+    """
+    Models are created twice: time is measured without tracing,
+    memory is measured with tracemalloc, which sees only Python allocations,
+    so memory of QObjects on the C++ side is not included
+    :return: milliseconds, bytes allocated by models, indexer and its models
+    """
+    indexer = make_indexer()
+    started = perf_counter()
+    models = indexer.add_many(items).objects
+    elapsed = (perf_counter() - started) * 1000
+    del indexer, models
+
+    indexer = make_indexer()
+    tracemalloc.start()
+    models = indexer.add_many(items).objects
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, allocated, [indexer, models]
+
+
+def refresh(indexer: AbstractIndexer, page: List[SongDetailsTransport], notifications: list) -> float:
+    """
+    :return: milliseconds of updating the page and delivering notifications
+    """
+    started = perf_counter()
+    indexer.add_many(page)
+    while not notifications:
+        QCoreApplication.processEvents()
+    return (perf_counter() - started) * 1000
+
+
+def main(count: int = 100_000, page_size: int = 200):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    items = songs(count)
+    page = songs(page_size, liked=True)
+
+    results = {}
+    for name, make_indexer in (
+        ("PSSongModel", lambda: SongsIndexer(PSModelChangeCoalescer())),
+        ("CompactSongModel", CompactSongsIndexer),
+    ):
+        elapsed, allocated, kept = creation(make_indexer, items)
+        results[name] = kept
+        print(
+            f"create {name:<18} {count:>7} songs {elapsed:10.1f} ms "
+            f"{allocated / 1024 / 1024:8.1f} MiB {allocated / count:8.0f} B/song"
+        )
+
+    indexer, models = results["PSSongModel"]
+    notifications = []
+    indexer.coalescer.models_changed.connect(notifications.append)
+    elapsed = refresh(indexer, page, notifications)
+    print(f"refresh {'PSSongModel':<17} {page_size:>7} songs {elapsed:10.2f} ms")
+
+    indexer, models = results["CompactSongModel"]
+    notifications = []
+    indexer.notifier.changed.connect(notifications.append)
+    elapsed = refresh(indexer, page, notifications)
+    print(f"refresh {'CompactSongModel':<17} {page_size:>7} songs {elapsed:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,7 @@
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+
+@pytest.fixture(scope="session")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
@@ -0,0 +1,34 @@
+"""
+Helpers shared by tests
+
+Functions:
+    wait_until: spin Qt event loop until condition is met
+    transport: song transport item with default related entities
+"""
+import time
+
+from PySide6.QtCore import QCoreApplication
+
+from model.transport_items.db.basic import (
+    SongDetailsTransport, ArtistTransport, SongFileTransport
+)
+
+
+def wait_until(condition, timeout=5.0):
+    """
+    Spins Qt event loop, so queued results are delivered
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        QCoreApplication.processEvents()
+        time.sleep(0.001)
+
+
+def transport(id, name="song", liked=False):
+    return SongDetailsTransport(
+        id=id, name=name, liked=liked,
+        artist=ArtistTransport(id=1, name="artist"),
+        file=SongFileTransport(id=id, duration=100),
+        tags=[], genres=[]
+    )
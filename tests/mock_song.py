@@ -166,11 +166,13 @@ def db_genres(session: Session):
     ]
 
 
-def mock_songs(n: int):
+def mock_songs(n: int, profile: str = "bulk_load"):
     """
     Mocks n songs and adds them to the database
+    :param n: number of songs in the database after mocking
+    :param profile: name of the engine profile to use
     """
-    engine = sqlite_engine("../db.db")
+    engine = sqlite_engine("../db.db", profile)
     Session = sessionmaker(bind=engine)
     session = Session()
     genres = db_genres(session)
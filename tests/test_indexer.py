@@ -1,4 +1,8 @@
+from dataclasses import replace
+
 from indexers import AbstractIndexer
+from indexers.song import SongsIndexer
+from tests.helpers import transport
 
 
 class MockValue:
@@ -69,5 +73,54 @@ def main():
     assert z is y["o"]
 
 
+def test_recently_used_objects_are_retained():
+    i = SimpleDictIndexer(retain=2)
+    for id in "123":
+        i.add({"id": id, "value": id})
+    assert i.retained_count == 2
+    assert i.get("1") is None
+    # reading makes an object recently used
+    kept = i["2"]
+    i.add({"id": "4", "value": "4"})
+    assert i.get("3") is None
+    assert i.add({"id": "2", "value": "new"}) is kept
+    assert kept.value == "new"
+    del kept
+    i.release()
+    assert i.get("2") is None
+
+
+def test_retained_bytes_are_limited():
+    i = SimpleDictIndexer(retain_bytes=2000)
+    for id in range(20):
+        i.add({"id": str(id), "value": "x" * 100})
+    assert 0 < i.retained_bytes <= 2000
+    assert i.get("0") is None
+    assert i.get("19") is not None
+    assert i.retained_count < 20
+
+
+def test_add_many_updates_only_changed_models():
+    i = SongsIndexer()
+    page = [transport(id) for id in range(5)]
+    added = i.add_many(page)
+    assert (added.created, added.updated, added.unchanged) == (5, 0, 0)
+    models = added.objects
+    updates = []
+    for model in models:
+        model.updated.connect(lambda model=model: updates.append(model.id))
+
+    again = i.add_many(page)
+    assert again.objects == models
+    assert (again.created, again.updated, again.unchanged) == (0, 0, 5)
+    assert updates == []
+
+    page[3] = replace(page[3], name="renamed", liked=True)
+    changed = i.add_many(page + [transport(5)])
+    assert (changed.created, changed.updated, changed.unchanged) == (1, 1, 4)
+    assert updates == [3]
+    assert (models[3].name, models[3].liked) == ("renamed", True)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+import model.alchemy.install as install_module
+from model.alchemy.install import (
+    sqlite_engine, install, migrate, schema_version, SCHEMA_VERSION
+)
+from model.alchemy.tables import Base, Song, SongFile, Artist
+
+INDEXES = {
+    "ix_songs_artist_id", "ix_songs_file_id", "ix_songs_name",
+    "ix_song_tags_tag_id", "ix_song_genres_genre_id", "ix_song_files_duration"
+}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlite_engine(tmp_path / "db.db")
+    yield engine
+    engine.dispose()
+
+
+def indexes(engine):
+    inspector = inspect(engine)
+    return {
+        index["name"]
+        for table in inspector.get_table_names()
+        for index in inspector.get_indexes(table)
+    }
+
+
+def version(engine):
+    with engine.connect() as connection:
+        return schema_version(connection)
+
+
+def test_fresh_database_is_installed(engine):
+    assert install(engine) == SCHEMA_VERSION
+    assert "songs" in inspect(engine).get_table_names()
+    assert INDEXES <= indexes(engine)
+    assert version(engine) == SCHEMA_VERSION
+
+
+def test_old_database_is_migrated(engine):
+    # tables of the code before migrations, without indexes
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for name in INDEXES:
+            connection.exec_driver_sql(f"DROP INDEX {name}")
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+    with Session(engine) as session:
+        song = Song(name="kept")
+        song.file = SongFile(duration=100)
+        song.artist = Artist(name="artist")
+        session.add(song)
+        session.commit()
+
+    assert migrate(engine) == SCHEMA_VERSION
+    assert INDEXES <= indexes(engine)
+    assert version(engine) == SCHEMA_VERSION
+    with Session(engine) as session:
+        assert [song.name for song in session.query(Song)] == ["kept"]
+
+
+def test_migrated_database_is_left_as_is(engine, monkeypatch):
+    install(engine)
+
+    def fail(connection):
+        pytest.fail("migration applied twice")
+
+    monkeypatch.setattr(install_module, "MIGRATIONS", [fail] * SCHEMA_VERSION)
+    assert migrate(engine) == SCHEMA_VERSION
+
+
+def test_failed_migration_is_rolled_back(engine, monkeypatch):
+    install(engine)
+
+    def broken(connection):
+        connection.exec_driver_sql("CREATE INDEX ix_songs_liked ON songs (liked)")
+        raise RuntimeError("broken migration")
+
+    migrations = install_module.MIGRATIONS + [broken]
+    monkeypatch.setattr(install_module, "MIGRATIONS", migrations)
+    monkeypatch.setattr(install_module, "SCHEMA_VERSION", len(migrations))
+    with pytest.raises(RuntimeError):
+        migrate(engine)
+    # index created by the migration is rolled back along with the version
+    assert "ix_songs_liked" not in indexes(engine)
+    assert version(engine) == SCHEMA_VERSION
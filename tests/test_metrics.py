@@ -0,0 +1,57 @@
+import io
+import json
+
+import pytest
+
+from tasks.metrics import TaskStage, TaskTimeline, InMemoryMetricsSink
+
+
+def timeline(task_class, id, durations, outcome="ok"):
+    result = TaskTimeline(task_class, id, outcome=outcome)
+    result.marks[TaskStage.CREATED] = 10.0
+    moment = 10.0
+    for stage, duration in zip(list(TaskStage)[1:], durations):
+        moment += duration
+        result.marks[stage] = moment
+    return result
+
+
+def test_timeline_durations():
+    item = timeline("Task", "1", [0.5, 1.0, 0.25])
+    assert item.duration() == 1.75
+    assert item.duration(TaskStage.STARTED, TaskStage.SESSION_ACQUIRED) == 0.25
+    assert item.duration(TaskStage.STARTED, TaskStage.ADAPTED) is None
+    assert TaskStage.STARTED in item and TaskStage.ADAPTED not in item
+
+
+def test_percentiles_per_task_class():
+    sink = InMemoryMetricsSink(max_samples=100)
+    for i in range(1, 201):
+        sink.record(timeline("List", str(i), [0.0, i / 1000]))
+    sink.record(timeline("List", "failed", [0.0, 10.0], outcome="error"))
+    sink.record(timeline("Song", "1", [0.0, 0.5]))
+
+    assert sorted(sink.task_classes()) == ["List", "Song"]
+    assert len(sink.timelines("List")) == 100
+    # only the last 100 samples are kept: 0.102 ... 0.2 and the failed one,
+    # which is not counted
+    assert sink.percentiles("List", (50, 99)) == {
+        50: pytest.approx(0.151), 99: pytest.approx(0.2)
+    }
+    assert sink.percentile("List", 50, TaskStage.CREATED, TaskStage.SCHEDULED) == 0.0
+    assert sink.percentile("Song", 99) == 0.5
+    assert sink.percentile("Missing", 50) is None
+
+
+def test_json_lines_export():
+    sink = InMemoryMetricsSink()
+    sink.record(timeline("List", "1", [0.001, 0.002]))
+    sink.record(timeline("Song", "2", [0.001], outcome="cancelled"))
+    stream = io.StringIO()
+    assert sink.export_json_lines(stream) == 2
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0] == {
+        "task": "List", "id": "1", "outcome": "ok",
+        "stages": {"created": 0.0, "scheduled": 1.0, "started": 3.0},
+    }
+    assert lines[1]["outcome"] == "cancelled"
@@ -0,0 +1,94 @@
+import time
+import threading
+
+from PySide6.QtCore import QCoreApplication
+
+from tasks import PSTask
+from tasks.executor import PSTaskExecutor
+from tasks.scheduler import TaskLane, LaneLimits, LaneScheduler
+
+INTERACTIVE, BACKGROUND = TaskLane.INTERACTIVE, TaskLane.BACKGROUND
+
+
+def drain(scheduler):
+    started = []
+    while (scheduled := scheduler.pop()) is not None:
+        started.append(scheduled)
+    return started
+
+
+def test_interactive_lane_goes_first():
+    scheduler = LaneScheduler(1)
+    scheduler.push("b1", BACKGROUND)
+    scheduler.push("i1")
+    scheduler.push("i2")
+    order = []
+    for _ in range(3):
+        item, lane = scheduler.pop()
+        assert scheduler.pop() is None
+        order.append(item)
+        scheduler.done(lane)
+    assert order == ["i1", "i2", "b1"]
+
+
+def test_lane_limits():
+    scheduler = LaneScheduler(4, {BACKGROUND: LaneLimits(max_concurrency=1)})
+    for i in range(3):
+        scheduler.push(f"b{i}", BACKGROUND)
+    assert [item for item, _ in drain(scheduler)] == ["b0"]
+    scheduler.push("i0")
+    scheduler.push("i1")
+    assert [item for item, _ in drain(scheduler)] == ["i0", "i1"]
+    scheduler.done(BACKGROUND)
+    assert [item for item, _ in drain(scheduler)] == ["b1"]
+    stats = scheduler.stats()
+    assert (stats[BACKGROUND].queued, stats[BACKGROUND].running, stats[BACKGROUND].started) == (1, 1, 2)
+    assert (stats[INTERACTIVE].queued, stats[INTERACTIVE].running) == (0, 2)
+    assert scheduler.running == 3
+
+
+def test_aged_background_task_is_not_starved():
+    scheduler = LaneScheduler(1, {BACKGROUND: LaneLimits(aging=0.02)})
+    scheduler.push("b0", BACKGROUND)
+    scheduler.push("i0")
+    item, lane = scheduler.pop()
+    assert item == "i0"
+    time.sleep(0.03)
+    scheduler.push("i1")
+    scheduler.done(lane)
+    item, lane = scheduler.pop()
+    assert item == "b0"
+    stats = scheduler.stats()[BACKGROUND]
+    assert stats.aged == 1
+    assert stats.wait_max >= 0.02
+    assert stats.wait_mean == stats.wait_total
+
+
+class Recording(PSTask):
+    def __init__(self, id, log, gate=None):
+        super().__init__(id)
+        self.log = log
+        self.gate = gate
+
+    def run(self):
+        if self.gate is not None:
+            self.gate.wait()
+        self.log.append(self.id)
+
+
+def test_executor_starts_queued_interactive_tasks_first():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    log = []
+    gate = threading.Event()
+    executor = PSTaskExecutor(max_concurrency=1)
+    executor.submit(Recording("first", log, gate))
+    for i in range(3):
+        executor.submit(Recording(f"background {i}", log), BACKGROUND)
+    executor.submit(Recording("interactive", log))
+    stats = executor.lane_stats
+    assert (stats[INTERACTIVE].running, stats[INTERACTIVE].queued, stats[BACKGROUND].queued) == (1, 1, 3)
+    gate.set()
+    assert executor.wait_for_done(5000)
+    assert log == ["first", "interactive", "background 0", "background 1", "background 2"]
+    app.processEvents()
+    assert executor.active_count == 0
@@ -0,0 +1,122 @@
+import time
+from threading import Barrier, Event, Thread
+
+import pytest
+from sqlalchemy.orm import Session
+
+from model.alchemy.install import sqlite_engine, install
+from model.alchemy.session import PooledSessionProvider, ThreadAffineSessionProvider
+from model.alchemy.tables import Artist
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    file_name = tmp_path / "db.db"
+    engine = sqlite_engine(file_name)
+    install(engine)
+    engine.dispose()
+    return file_name
+
+
+@pytest.fixture(params=[PooledSessionProvider, ThreadAffineSessionProvider])
+def provider(request, db_file):
+    provider = request.param(db_file, pool_size=2, max_overflow=0)
+    yield provider
+    provider.dispose()
+
+
+def artists(provider):
+    with Session(provider.engine) as session:
+        return sorted(artist.name for artist in session.query(Artist))
+
+
+def test_session_is_committed_and_returned_to_pool(provider):
+    with provider() as session:
+        session.add(Artist(name="committed"))
+        assert provider.stats.checked_out == 1
+    assert provider.stats.checked_out == 0
+    assert artists(provider) == ["committed"]
+
+
+def test_error_is_rolled_back_and_raised(provider):
+    with pytest.raises(RuntimeError):
+        with provider() as session:
+            session.add(Artist(name="rolled back"))
+            session.flush()
+            raise RuntimeError("failed task")
+    assert provider.stats.checked_out == 0
+    assert artists(provider) == []
+
+
+def test_threads_get_separate_sessions(provider):
+    # both tasks hold their sessions at once, one of them fails
+    # and is rolled back before the other one commits
+    barrier = Barrier(2, timeout=5)
+    failed = Event()
+    sessions = {}
+    errors = []
+
+    def write():
+        with provider() as session:
+            sessions["written"] = session
+            session.add(Artist(name="written"))
+            barrier.wait()
+            assert failed.wait(5)
+
+    def fail():
+        try:
+            with provider() as session:
+                sessions["failed"] = session
+                session.add(Artist(name="failed"))
+                barrier.wait()
+                raise RuntimeError("failed task")
+        except RuntimeError as e:
+            errors.append(e)
+        finally:
+            failed.set()
+
+    threads = [Thread(target=write), Thread(target=fail)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sessions["written"] is not sessions["failed"]
+    assert len(errors) == 1
+    assert artists(provider) == ["written"]
+    assert provider.stats.checked_out == 0
+
+
+@pytest.mark.parametrize("provider_class", [PooledSessionProvider, ThreadAffineSessionProvider])
+def test_exhausted_pool_waits_are_counted(db_file, provider_class):
+    provider = provider_class(db_file, pool_size=1, max_overflow=0)
+    held = Event()
+    release = Event()
+
+    def hold():
+        with provider():
+            held.set()
+            release.wait(5)
+
+    def wait():
+        with provider() as session:
+            session.add(Artist(name="waited"))
+
+    try:
+        holder = Thread(target=hold)
+        holder.start()
+        assert held.wait(5)
+        waiter = Thread(target=wait)
+        waiter.start()
+        time.sleep(0.1)
+        # second checkout waits for the only connection
+        assert provider.stats.waits == 0
+        release.set()
+        holder.join()
+        waiter.join()
+        stats = provider.stats
+        assert (stats.size, stats.checked_out, stats.overflow) == (1, 0, 0)
+        assert (stats.connects, stats.checkouts, stats.waits) == (1, 2, 1)
+        assert stats.wait_time > 0.05
+    finally:
+        release.set()
+        provider.dispose()
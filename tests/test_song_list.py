@@ -0,0 +1,332 @@
+import asyncio
+from random import Random
+from itertools import product
+
+import pytest
+from PySide6.QtCore import Signal
+from sqlalchemy.sql import select
+from sqlalchemy.orm import Session
+
+from model.alchemy.install import sqlite_engine, install
+from model.alchemy.tables import Song, SongFile, Artist, Tag, Genre
+from model.transport_items.db import DBSortingDirection
+from model.transport_items.db.lists import SongsListFilters, SongsListSorting
+from model.alchemy.async_session import AsyncSessionProvider
+from services.song.tasks.list import PSObtainSongList, SongListStrategy
+from services.song.tasks.aio import PSAsyncObtainSongList
+from tasks.db.aio import PSAsyncDBTask
+from services.song.cache import SongCountCache, SongPageCache
+from services.song.tasks.queries import SongListQueryBuilder
+
+FILTERS = [
+    SongsListFilters(tag_id=tag_id, genre_id=genre_id, artist_id=artist_id, liked=liked)
+    for tag_id, genre_id, artist_id, liked in product(
+        [None, 1, 4], [None, 2, 5], [None, 3], [None, True, False]
+    )
+]
+SORTINGS = [
+    SongsListSorting(name=name, duration=duration)
+    for name, duration in product([None, *DBSortingDirection], repeat=2)
+]
+
+
+def library(file_name):
+    """
+    Small library with repeating names and durations (to check ties),
+    songs without tags or genres
+    """
+    rnd = Random(12)
+    engine = sqlite_engine(file_name, "bulk_load")
+    install(engine)
+    with Session(engine) as session:
+        artists = [Artist(name=f"artist {i}") for i in range(4)]
+        tags = [Tag(name=f"tag {i}") for i in range(5)]
+        genres = [Genre(name=f"genre {i}") for i in range(5)]
+        for i in range(60):
+            song = Song(name=f"song {rnd.randint(0, 15)}", liked=i % 3 == 0)
+            song.file = SongFile(duration=rnd.randint(100, 110))
+            song.artist = rnd.choice(artists)
+            song.tags = rnd.sample(tags, rnd.randint(0, 3))
+            song.genres = rnd.sample(genres, rnd.randint(0, 3))
+            session.add(song)
+        session.commit()
+    return engine
+
+
+@pytest.fixture(scope="module")
+def session(tmp_path_factory):
+    """
+    Library shared by tests that only read it
+    """
+    engine = library(tmp_path_factory.mktemp("db") / "db.db")
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def writable_session(tmp_path):
+    """
+    Own copy of the library for tests that change it
+    """
+    engine = library(tmp_path / "db.db")
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def obtain(session, page, page_size, filters, sortings, after=None):
+    task = PSObtainSongList("test", None, page, page_size, filters, sortings, after)
+    return task.query(session)
+
+
+def normalized(items):
+    """
+    Tags and genres of a song are not ordered
+    """
+    return [
+        (item.id, item.name, item.liked, item.artist, item.file,
+         sorted(tag.id for tag in item.tags), sorted(genre.id for genre in item.genres))
+        for item in items
+    ]
+
+
+def no_filters():
+    return SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=None)
+
+
+@pytest.mark.parametrize("sortings", SORTINGS)
+def test_keyset_pages_match_offset_pages(session, sortings):
+    filters = no_filters()
+    page_size = 7
+    after = None
+    page = 0
+    while True:
+        by_offset = obtain(session, page, page_size, filters, sortings)
+        by_cursor = obtain(session, page, page_size, filters, sortings, after)
+        assert [item.id for item in by_cursor.items] == [item.id for item in by_offset.items]
+        assert by_cursor.size == 60
+        if by_cursor.after is None:
+            break
+        after = by_cursor.after
+        page += 1
+    assert page == 60 // page_size
+
+
+def test_malformed_cursor(session):
+    with pytest.raises(ValueError):
+        obtain(session, 0, 5, no_filters(), SORTINGS[0], "not a cursor")
+
+
+def test_count_cache_invalidated_by_dimension(writable_session):
+    cache = SongCountCache()
+    cache.watch(writable_session)
+    try:
+        everything = no_filters()
+        liked = SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=True)
+        for filters in (everything, liked):
+            task = PSObtainSongList("test", None, 0, 5, filters, SORTINGS[0], None, cache)
+            assert task.query(writable_session).size == task.count(writable_session)[0]
+        assert cache.get(everything) == (60, False)
+        liked_count = cache.get(liked)[0]
+
+        song = writable_session.get(Song, 1)
+        song.liked = not song.liked
+        writable_session.commit()
+        assert cache.get(everything) == (60, False)
+        assert cache.get(liked) is None
+
+        task = PSObtainSongList("test", None, 0, 5, liked, SORTINGS[0], None, cache)
+        # song 1 was liked
+        assert task.query(writable_session).size == liked_count - 1
+    finally:
+        cache.unwatch(writable_session)
+
+
+def test_page_cache_invalidated_by_writes(writable_session):
+    cache = SongPageCache()
+    cache.watch(writable_session)
+    liked = SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=True)
+    by_name = SongsListSorting(name=DBSortingDirection.ASC, duration=None)
+    keys = [
+        (0, 5, no_filters(), SORTINGS[0], None),
+        (0, 5, liked, SORTINGS[0], None),
+        (0, 5, no_filters(), by_name, None),
+    ]
+    try:
+        for key in keys:
+            cache.set(key, obtain(writable_session, *key))
+        assert cache.get(keys[0]).items[0].id == 1
+        assert cache.get((1, 5, no_filters(), SORTINGS[0], None)) is None
+        assert cache.hit_rate == 0.5
+        assert cache.memory > 0
+
+        song = writable_session.get(Song, 60)
+        song.liked = not song.liked
+        writable_session.commit()
+        assert [cache.contains(key) for key in keys] == [True, False, True]
+
+        song.name = "renamed"
+        writable_session.commit()
+        assert [cache.contains(key) for key in keys] == [True, False, False]
+
+        generation = cache.generation
+        writable_session.get(Song, 1).liked = not writable_session.get(Song, 1).liked
+        writable_session.rollback()
+        assert cache.contains(keys[0])
+        cache.invalidate_song(1)
+        assert not cache.contains(keys[0])
+        # page read before the invalidation is not stored
+        cache.set(keys[0], obtain(writable_session, *keys[0]), generation)
+        assert len(cache) == 0
+    finally:
+        cache.unwatch(writable_session)
+
+
+def test_page_cache_ttl(session):
+    now = [0.0]
+    cache = SongPageCache(max_size=2, ttl=0.05, clock=lambda: now[0])
+    keys = [(page, 5, no_filters(), SORTINGS[0], None) for page in range(3)]
+    for key in keys:
+        cache.set(key, obtain(session, *key))
+    assert [cache.contains(key) for key in keys] == [False, True, True]
+    now[0] = 0.05
+    assert cache.contains(keys[2])
+    now[0] = 0.06
+    assert cache.get(keys[2]) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+@pytest.mark.parametrize("strategy", list(SongListStrategy))
+def test_count_limit(session, strategy):
+    cache = SongCountCache()
+    task = PSObtainSongList(
+        "test", None, 0, 5, no_filters(), SORTINGS[0], None, cache, 10, strategy
+    )
+    result = task.query(session)
+    assert (result.size, result.size_estimated) == (10, True)
+    assert cache.get(no_filters()) == (10, True)
+    task = PSObtainSongList(
+        "test", None, 0, 5, no_filters(), SORTINGS[0], count_limit=60, strategy=strategy
+    )
+    result = task.query(session)
+    assert (result.size, result.size_estimated) == (60, False)
+
+
+@pytest.mark.parametrize("sortings", SORTINGS)
+@pytest.mark.parametrize("cached", [False, True])
+@pytest.mark.parametrize("strategy", [
+    SongListStrategy.FUSED, SongListStrategy.JSON, SongListStrategy.CORE
+])
+def test_strategies_match_separate(session, sortings, cached, strategy):
+    filters = SongsListFilters(tag_id=2, genre_id=None, artist_id=None, liked=None)
+    cache = SongCountCache()
+    after = None
+    for page in range(6):
+        separate = PSObtainSongList("test", None, page, 4, filters, sortings, after)
+        fused = PSObtainSongList(
+            "test", None, page, 4, filters, sortings, after,
+            cache if cached else None, strategy=strategy
+        )
+        expected, result = separate.query(session), fused.query(session)
+        assert normalized(result.items) == normalized(expected.items)
+        assert (result.size, result.after) == (expected.size, expected.after)
+        after = expected.after
+
+
+def fan_out_ids(session, filters, sortings):
+    """
+    Reference query: every relation is joined, duplicates are removed with DISTINCT
+    """
+    builder = SongListQueryBuilder(filters, sortings)
+    query = select(Song.id).distinct().\
+        select_from(Song).\
+        outerjoin(Song.artist).\
+        outerjoin(Song.file).\
+        outerjoin(Song.tags).\
+        outerjoin(Song.genres)
+    if filters.artist_id is not None:
+        query = query.where(Song.artist_id == filters.artist_id)
+    if filters.genre_id is not None:
+        query = query.where(Genre.id == filters.genre_id)
+    if filters.tag_id is not None:
+        query = query.where(Tag.id == filters.tag_id)
+    if filters.liked is not None:
+        query = query.where(Song.liked == filters.liked)
+    return session.execute(query.order_by(*builder.order_by())).scalars().all()
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_pruned_queries_match_fan_out_joins(session, filters):
+    for sortings in SORTINGS:
+        builder = SongListQueryBuilder(filters, sortings)
+        expected = fan_out_ids(session, filters, sortings)
+        ids = session.execute(builder.page_ids(0, 100)).scalars().all()
+        assert ids == expected
+        assert session.execute(builder.count()).scalar() == len(expected)
+        assert session.execute(builder.count(limit=2)).scalar() == min(len(expected), 3)
+
+
+def test_joins_follow_filters_and_sortings():
+    plain = SongListQueryBuilder(no_filters(), SORTINGS[0])
+    assert str(plain.page_ids(0, 10)).count("JOIN") == 0
+
+    filtered = SongListQueryBuilder(
+        SongsListFilters(tag_id=1, genre_id=2, artist_id=3, liked=True),
+        SongsListSorting(name=None, duration=DBSortingDirection.ASC)
+    )
+    statement = str(filtered.page_ids(0, 10))
+    assert statement.count("JOIN") == 1
+    assert statement.count("EXISTS") == 2
+    assert "DISTINCT" not in statement
+
+
+@pytest.mark.parametrize("strategy", list(SongListStrategy))
+def test_async_task_matches_sync(session, strategy):
+    filters = SongsListFilters(tag_id=None, genre_id=2, artist_id=None, liked=None)
+    expected = obtain(session, 1, 6, filters, SORTINGS[-1])
+    results = []
+
+    async def run():
+        provider = AsyncSessionProvider(session.get_bind().url.database, profile="readonly")
+        task = PSAsyncObtainSongList(
+            "test", provider, 1, 6, filters, SORTINGS[-1], strategy=strategy
+        )
+        task.song_list_obtained.connect(results.append)
+        task.error_occurred.connect(results.append)
+        await task.run_async()
+        await provider.dispose()
+
+    asyncio.run(run())
+    assert len(results) == 1
+    assert normalized(results[0].items) == normalized(expected.items)
+    assert results[0].size == expected.size
+
+
+class AsyncWrite(PSAsyncDBTask):
+    """
+    Writes with read only provider, it fails on commit
+    """
+    done = Signal()
+
+    def success(self):
+        return self.done
+
+    async def query(self, session):
+        session.add(Artist(name="written"))
+
+
+def test_async_failed_commit_reaches_error_signal(session):
+    results = []
+
+    async def run():
+        provider = AsyncSessionProvider(session.get_bind().url.database, profile="readonly")
+        task = AsyncWrite("test", provider)
+        task.done.connect(lambda: results.append("done"))
+        task.error_occurred.connect(results.append)
+        await task.run_async()
+        await provider.dispose()
+
+    asyncio.run(run())
+    assert len(results) == 1
+    assert isinstance(results[0], Exception)
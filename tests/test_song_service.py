@@ -0,0 +1,581 @@
+import time
+from random import Random
+
+import pytest
+from PySide6.QtCore import Qt, Signal
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import text
+
+from model.alchemy.install import sqlite_engine, install
+from model.alchemy.session import ThreadAffineSessionProvider
+from model.alchemy.tables import Song, SongFile, Artist, Tag, Genre
+from model.transport_items.db.lists import SongsListFilters, SongsListSorting
+from indexers.song import SongsIndexer
+from model.view_models.song import PSSongModel
+from services.song import PSSongService
+from services.song.tasks.list import PSObtainSongList
+from services.song.write import PSSongWriteService
+from tasks import PSTaskCancelled
+from tasks.db import PSDBTask
+from tasks.executor import PSTaskExecutor
+from tasks.scheduler import TaskLane
+from tasks.metrics import TaskStage, InMemoryMetricsSink, get_sink, set_sink
+from tests.helpers import wait_until
+
+
+@pytest.fixture(scope="module")
+def db_file(tmp_path_factory):
+    rnd = Random(7)
+    file_name = tmp_path_factory.mktemp("db") / "db.db"
+    engine = sqlite_engine(file_name, "bulk_load")
+    install(engine)
+    with Session(engine) as session:
+        artists = [Artist(name=f"artist {i}") for i in range(3)]
+        tags = [Tag(name=f"tag {i}") for i in range(4)]
+        genres = [Genre(name=f"genre {i}") for i in range(4)]
+        for i in range(40):
+            song = Song(name=f"song {i}", liked=i % 2 == 0)
+            song.file = SongFile(duration=rnd.randint(100, 200))
+            song.artist = rnd.choice(artists)
+            song.tags = rnd.sample(tags, rnd.randint(0, 2))
+            song.genres = rnd.sample(genres, rnd.randint(0, 2))
+            session.add(song)
+        session.commit()
+    engine.dispose()
+    return file_name
+
+
+@pytest.fixture
+def service(app, db_file):
+    provider = ThreadAffineSessionProvider(db_file)
+    service = PSSongService(provider, SongsIndexer())
+    yield service
+    service.executor.wait_for_done(5000)
+    wait_until(lambda: service.executor.active_count == 0)
+    service.dispose()
+    provider.dispose()
+
+
+def no_filters():
+    return SongsListFilters(tag_id=None, genre_id=None, artist_id=None, liked=None)
+
+
+def test_duplicate_song_requests_share_task(service):
+    results = []
+    for _ in range(5):
+        service.get_by_id(3, results.append, pytest.fail)
+    wait_until(lambda: service.in_flight_count == 1)
+    service.get_by_id(3, results.append, pytest.fail)
+    assert service.executor.active_count == 1
+
+    wait_until(lambda: len(results) == 6)
+    assert service.in_flight_count == 0
+    assert len({id(model) for model in results}) == 1
+
+
+def test_song_requests_are_batched(service):
+    results = {}
+    handles = {
+        service.get_by_id(id, lambda model, id=id: results.__setitem__(id, model), pytest.fail)
+        for id in (8, 1, 8, 30)
+    }
+    assert len(handles) == 4
+    assert service.in_flight_count == 0
+    wait_until(lambda: service.in_flight_count == 3)
+    assert service.executor.active_count == 1
+
+    missing = []
+    service.get_by_id(1, lambda model: results.__setitem__("again", model), pytest.fail)
+    service.get_by_id(10_000, pytest.fail, missing.append)
+    wait_until(lambda: len(results) == 4 and missing)
+    assert results[1] is results["again"]
+    assert isinstance(missing[0], IndexError)
+    assert [results[id].duration for id in (8, 1, 30)] == [
+        model.duration for model in fetch_many(service, [8, 1, 30])
+    ]
+
+
+def fetch_many(service, ids):
+    result = []
+    service.get_by_ids(ids, result.extend, pytest.fail)
+    wait_until(lambda: result)
+    return result
+
+
+def test_get_by_ids_keeps_order(service):
+    models = fetch_many(service, [12, 5, 10_000, 12, 7])
+    assert len(models) == 3
+    assert models[0] is service.indexer[12]
+    assert models[1] is service.indexer[5]
+    assert models[2] is service.indexer[7]
+
+
+def test_duplicate_list_requests_share_task(service):
+    results, others = [], []
+    sortings = SongsListSorting(name=None, duration=None)
+    for _ in range(3):
+        service.get_list(0, 10, no_filters(), sortings, lambda *r: results.append(r), pytest.fail)
+    service.get_list(1, 10, no_filters(), sortings, lambda *r: others.append(r), pytest.fail)
+    assert service.executor.active_count == 2
+
+    wait_until(lambda: len(results) == 3 and len(others) == 1)
+    (models, transport), *rest = results
+    assert all(m == models and t is transport for m, t in rest)
+    assert others[0][1] is not transport
+
+
+def test_request_after_delivery_runs_new_task(service):
+    results = []
+    service.get_by_id(5, results.append, pytest.fail)
+    wait_until(lambda: len(results) == 1)
+    service.get_by_id(5, results.append, pytest.fail)
+    wait_until(lambda: service.in_flight_count == 1)
+    wait_until(lambda: len(results) == 2)
+    assert results[0] is results[1]
+
+
+def test_errors_reach_every_caller(service):
+    errors = []
+    for _ in range(3):
+        service.get_by_id(10_000, pytest.fail, errors.append)
+    wait_until(lambda: len(errors) == 3)
+    assert len({id(error) for error in errors}) == 1
+
+
+def test_cancelled_request_is_dropped(service):
+    results = []
+    task_id = service.get_by_id(6, results.append, results.append)
+    assert service.cancel(task_id)
+    assert not service.cancel(task_id)
+    service.get_by_id(7, results.append, results.append)
+    wait_until(lambda: len(results) == 1)
+    wait_until(lambda: service.executor.active_count == 0)
+    assert service.in_flight_count == 0
+    assert isinstance(results[0], PSSongModel)
+
+
+def test_cancel_keeps_other_songs_of_batch(service):
+    results = []
+    handles = [service.get_by_id(id, results.append, pytest.fail) for id in (17, 18, 19)]
+    # before the batch is submitted
+    assert service.cancel(handles[0])
+    wait_until(lambda: service.in_flight_count == 2)
+    # after it is submitted
+    assert service.cancel(handles[1])
+    wait_until(lambda: results)
+    wait_until(lambda: service.executor.active_count == 0)
+    assert [model.id for model in results] == [19]
+    assert service.in_flight_count == 0
+
+
+def test_superseded_list_is_dropped(service):
+    results = []
+    sortings = SongsListSorting(name=None, duration=None)
+    for page in range(4):
+        service.get_list(
+            page, 5, no_filters(), sortings,
+            lambda models, transport: results.append(transport), results.append,
+            supersede=True
+        )
+    same = service.get_list(
+        3, 5, no_filters(), sortings,
+        lambda models, transport: results.append(transport), pytest.fail,
+        supersede=True
+    )
+    other = service.get_list(
+        0, 5, no_filters(), sortings, lambda *r: None, pytest.fail
+    )
+    wait_until(lambda: service.executor.active_count == 0 and service.in_flight_count == 0)
+    assert len(results) == 1
+    assert same != other
+
+
+def test_cancel_keeps_other_callers_of_shared_task(service):
+    sortings = SongsListSorting(name=None, duration=None)
+    first, second, errors = [], [], []
+    service.get_list(0, 5, no_filters(), sortings, lambda *r: first.append(0), errors.append, supersede=True)
+    service.get_list(0, 5, no_filters(), sortings, lambda *r: second.append(0), errors.append)
+    # superseding caller moves on, the other one still waits for page 0
+    service.get_list(1, 5, no_filters(), sortings, lambda *r: first.append(1), errors.append, supersede=True)
+    wait_until(lambda: second and first)
+    wait_until(lambda: service.executor.active_count == 0)
+    assert (first, second, errors) == ([1], [0], [])
+
+
+def test_cancelled_task_fails_its_callers(service):
+    errors = []
+    handles = [service.get_by_ids([1, 2], pytest.fail, errors.append) for _ in range(2)]
+    assert handles[0] != handles[1]
+    assert service.cancel_task(service.running(("songs", (1, 2))).id)
+    assert len(errors) == 2
+    assert all(isinstance(error, PSTaskCancelled) for error in errors)
+    assert not service.cancel(handles[0])
+    wait_until(lambda: service.executor.active_count == 0)
+
+
+class Endless(PSDBTask):
+    """
+    Query that runs until it is interrupted
+    """
+    done = Signal(int)
+
+    def success(self):
+        return self.done
+
+    def query(self, session):
+        return session.execute(text(
+            "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+            "SELECT count(*) FROM c"
+        )).scalar()
+
+
+def test_cancel_interrupts_running_query(service):
+    results = []
+    task = Endless("endless", service.session_provider)
+    task.done.connect(results.append)
+    task.error_occurred.connect(results.append)
+    executor = PSTaskExecutor(max_concurrency=1)
+    executor.submit(task)
+    time.sleep(0.1)
+    started = time.monotonic()
+    task.cancel()
+    assert executor.wait_for_done(2000)
+    assert time.monotonic() - started < 1
+    wait_until(lambda: executor.active_count == 0)
+    assert results == []
+
+
+class Orphan(PSDBTask):
+    """
+    Adds song without file, it fails on commit
+    """
+    done = Signal()
+
+    def success(self):
+        return self.done
+
+    def query(self, session):
+        session.add(Song(name="orphan", artist_id=1))
+
+
+def test_failed_commit_reaches_error_signal(service):
+    results = []
+    task = Orphan("orphan", service.session_provider)
+    task.done.connect(lambda: results.append("done"))
+    task.error_occurred.connect(results.append)
+    task.run()
+    assert len(results) == 1
+    assert isinstance(results[0], Exception)
+
+
+def test_adjacent_pages_are_prefetched(app, db_file):
+    provider = ThreadAffineSessionProvider(db_file)
+    service = PSSongService(provider, SongsIndexer(), prefetch_depth=1)
+    sortings = SongsListSorting(name=None, duration=None)
+    pages = {}
+
+    def get(page, after=None):
+        task_id = service.get_list(
+            page, 6, no_filters(), sortings,
+            lambda models, transport: pages.__setitem__(page, transport), pytest.fail,
+            after
+        )
+        wait_until(lambda: page in pages)
+        wait_until(lambda: service.executor.active_count == 0)
+        return task_id
+
+    try:
+        assert get(3) is not None
+        assert (service.page_cache.hits, service.page_cache.misses) == (0, 1)
+        # obtained page is cached along with prefetched ones
+        assert len(service.page_cache) == 3
+        assert get(4) is None
+        assert get(2) is None
+        assert get(5) is None
+        assert (service.page_cache.hits, service.page_cache.misses) == (3, 1)
+        assert [item.id for item in pages[4].items] == list(range(25, 31))
+
+        # pages by cursor are prefetched only forward
+        assert get(5, pages[4].after) is not None
+        assert get(6, pages[5].after) is None
+        assert (service.page_cache.hits, service.page_cache.misses) == (4, 2)
+    finally:
+        service.dispose()
+        provider.dispose()
+
+
+def test_prefetched_page_is_not_queried_again(app, db_file):
+    provider = ThreadAffineSessionProvider(db_file)
+    executor = PSTaskExecutor(max_concurrency=1)
+    service = PSSongService(provider, SongsIndexer(), executor, prefetch_depth=1)
+    sortings = SongsListSorting(name=None, duration=None)
+    pages = {}
+    active = []
+
+    def get(page):
+        service.get_list(
+            page, 6, no_filters(), sortings,
+            lambda models, transport: obtained(page, transport), pytest.fail
+        )
+
+    def obtained(page, transport):
+        pages[page] = transport
+        if page == 3:
+            # pages 2 and 4 are prefetched at the moment, page 4 is not started
+            active.append(executor.active_count)
+            get(4)
+            active.append(executor.active_count)
+
+    try:
+        get(3)
+        wait_until(lambda: 4 in pages)
+        wait_until(lambda: executor.active_count == 0)
+        # no task was submitted for page 4
+        assert active[0] == active[1]
+        assert [item.id for item in pages[4].items] == list(range(25, 31))
+        stats = executor.lane_stats
+        # prefetch of page 4 was moved to the interactive lane
+        assert stats[TaskLane.INTERACTIVE].started == 2
+        assert stats[TaskLane.BACKGROUND].started == 2
+    finally:
+        service.dispose()
+        provider.dispose()
+
+
+def test_task_timelines_are_recorded(service):
+    sink, default = InMemoryMetricsSink(), get_sink()
+    set_sink(sink)
+    try:
+        results = []
+        sortings = SongsListSorting(name=None, duration=None)
+        service.get_list(2, 5, no_filters(), sortings, lambda *r: results.append(r), pytest.fail)
+        service.get_by_id(2, results.append, pytest.fail)
+        wait_until(lambda: len(results) == 2 and service.executor.active_count == 0)
+    finally:
+        set_sink(default)
+    assert sorted(sink.task_classes()) == ["PSObtainSongList", "PSObtainSongs"]
+    timeline, = sink.timelines("PSObtainSongList")
+    assert list(timeline.marks) == list(TaskStage)
+    assert sorted(timeline.marks.values()) == list(timeline.marks.values())
+    assert sink.percentile("PSObtainSongList", 99) == timeline.duration()
+
+
+def test_list_is_streamed_by_chunks(service):
+    sortings = SongsListSorting(name=None, duration=None)
+    page = []
+    service.get_list(0, 50, no_filters(), sortings, lambda models, transport: page.extend(models), pytest.fail)
+    wait_until(lambda: page)
+
+    events = []
+    service.stream_list(
+        0, 50, no_filters(), sortings,
+        lambda models: events.append(models),
+        lambda transport: events.append(transport),
+        pytest.fail,
+        chunk_size=7
+    )
+    wait_until(lambda: events and not isinstance(events[-1], list))
+    *chunks, transport = events
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7, 7, 7, 5]
+    assert [model for chunk in chunks for model in chunk] == page
+    assert (transport.items, transport.size, transport.after) == ([], 40, None)
+
+
+def test_stream_waits_for_consumer(service):
+    sortings = SongsListSorting(name=None, duration=None)
+    chunks = []
+    task = PSObtainSongList(
+        "stream", service.session_provider, 0, 40, no_filters(), sortings,
+        chunk_size=5, max_pending_chunks=2
+    )
+    task.chunk_obtained.connect(chunks.append, Qt.ConnectionType.DirectConnection)
+    executor = PSTaskExecutor(max_concurrency=1)
+    executor.submit(task)
+    time.sleep(0.2)
+    assert len(chunks) == 2
+    task.chunk_consumed()
+    wait_until(lambda: len(chunks) == 3)
+    task.cancel()
+    assert executor.wait_for_done(2000)
+    assert len(chunks) == 3
+
+
+def test_dispose_stops_blocked_stream(app, db_file):
+    provider = ThreadAffineSessionProvider(db_file)
+    service = PSSongService(provider, SongsIndexer())
+    sortings = SongsListSorting(name=None, duration=None)
+    chunks = []
+    try:
+        service.stream_list(
+            0, 40, no_filters(), sortings,
+            chunks.append, pytest.fail, pytest.fail, chunk_size=2
+        )
+        # chunks are not consumed, events are not processed
+        time.sleep(0.2)
+        started = time.monotonic()
+        service.dispose()
+        assert service.executor.wait_for_done(2000)
+        assert time.monotonic() - started < 0.5
+        assert service.in_flight_count == 0
+        wait_until(lambda: service.executor.active_count == 0)
+        assert chunks == []
+    finally:
+        service.dispose()
+        provider.dispose()
+
+
+def test_page_is_cached_until_its_song_is_written(service, writer):
+    sortings = SongsListSorting(name=None, duration=None)
+    pages = []
+
+    def get(page):
+        count = len(pages)
+        task_id = service.get_list(
+            page, 5, no_filters(), sortings,
+            lambda models, transport: pages.append(models), pytest.fail
+        )
+        wait_until(lambda: len(pages) > count)
+        return task_id
+
+    assert get(0) is not None
+    assert get(1) is not None
+    assert get(0) is None
+    assert pages[2] == pages[0]
+
+    writer.toggle_liked(pages[0][0].id)
+    writer.flush()
+    wait_until(lambda: not writer.flushing)
+    assert get(0) is not None
+    assert get(1) is None
+    assert service.page_cache.hit_rate == 0.4
+
+
+def test_caches_track_writes_of_own_provider(app, db_file):
+    provider = ThreadAffineSessionProvider(db_file)
+    service = PSSongService(provider, SongsIndexer())
+    other = PSSongService(ThreadAffineSessionProvider(db_file), SongsIndexer())
+    everything = no_filters()
+
+    def write(session_provider):
+        with session_provider() as session:
+            song = session.get(Song, 1)
+            song.liked = not song.liked
+
+    try:
+        for cache in (service.count_cache, other.count_cache):
+            cache.set(everything, 40)
+        generation = service.count_cache.generation
+        write(provider)
+        assert service.count_cache.generation == generation + 1
+        assert other.count_cache.generation == 0
+
+        service.dispose()
+        # toggled back
+        write(provider)
+        assert service.count_cache.generation == generation + 1
+    finally:
+        service.dispose()
+        other.dispose()
+        provider.dispose()
+        other.session_provider.dispose()
+
+
+@pytest.fixture
+def writer(service):
+    writer = PSSongWriteService(
+        service.session_provider, service.indexer, service.executor,
+        flush_interval=20, max_batch=3
+    )
+    service.writer = writer
+    yield writer
+    writer.flush()
+    wait_until(lambda: not writer.flushing and writer.executor.active_count == 0)
+
+
+def liked_in_db(service, *ids):
+    with service.session_provider() as session:
+        return [session.get(Song, id).liked for id in ids]
+
+
+def song(service, id):
+    result = []
+    service.get_by_id(id, result.append, pytest.fail)
+    wait_until(lambda: result)
+    return result[0]
+
+
+def test_repeated_toggles_cost_nothing(service, writer):
+    model = song(service, 11)
+    liked = model.liked
+    updates = []
+    model.updated.connect(lambda: updates.append(model.liked))
+    for _ in range(4):
+        writer.toggle_liked(11)
+    assert updates == [not liked, liked] * 2
+    assert writer.pending_count == 0
+    writer.flush()
+    assert not writer.flushing
+
+
+def test_changes_are_written_in_batches(service, writer):
+    models = [song(service, id) for id in (13, 14)]
+    before = liked_in_db(service, 13, 14)
+    name = models[1].name
+    flushed = []
+    writer.flushed.connect(flushed.append)
+    writer.toggle_liked(13)
+    writer.toggle_liked(14)
+    writer.toggle_liked(14)
+    writer.update(14, name="renamed")
+    assert [model.liked for model in models] == [not before[0], before[1]]
+    assert models[1].name == "renamed"
+    assert writer.pending_count == 2
+
+    # song obtained before the write keeps the changed values
+    assert song(service, 13) is models[0]
+    assert models[0].liked is not before[0]
+
+    wait_until(lambda: flushed)
+    assert sorted(flushed[0]) == [13, 14]
+    assert liked_in_db(service, 13, 14) == [not before[0], before[1]]
+    writer.set_liked(13, before[0])
+    writer.update(14, name=name)
+    writer.set_liked(15, True)
+    # max_batch songs are written at once
+    assert writer.flushing
+    wait_until(lambda: len(flushed) == 2)
+    assert liked_in_db(service, 13, 15) == [before[0], True]
+    # batches share the executor of reads in the background lane
+    assert writer.executor is service.executor
+    assert service.executor.lane_stats[TaskLane.BACKGROUND].started == 2
+
+
+def test_changes_queued_during_batch_are_drained(service, writer):
+    models = [song(service, id) for id in (16, 17)]
+    before = liked_in_db(service, 16, 17)
+    writer.toggle_liked(16)
+    writer.flush()
+    assert writer.flushing
+    # flush does nothing while the batch is written
+    writer.toggle_liked(17)
+    writer.flush()
+    assert writer.pending_count == 1
+    assert writer.drain()
+    assert (writer.flushing, writer.pending_count) == (False, 0)
+    assert liked_in_db(service, 16, 17) == [not before[0], not before[1]]
+    assert [model.liked for model in models] == [not before[0], not before[1]]
+
+
+def test_failed_batch_is_reverted(service, writer):
+    model = song(service, 16)
+    liked, name = model.liked, model.name
+    failures = []
+    writer.flush_failed.connect(failures.append)
+    writer.toggle_liked(16)
+    writer.update(16, name=None)
+    writer.flush()
+    wait_until(lambda: failures)
+    assert (model.liked, model.name) == (liked, name)
+    assert liked_in_db(service, 16) == [liked]
+    with pytest.raises(ValueError):
+        writer.update(16, duration=10)
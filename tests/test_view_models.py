@@ -0,0 +1,101 @@
+import pytest
+
+from indexers.song import SongsIndexer, CompactSongsIndexer
+from model.view_models import PSViewModel, ViewModelField, PSModelChangeCoalescer
+from model.view_models.compact import CompactViewModel, CompactField, PSCompactModelAdapter
+from tests.helpers import transport, wait_until
+
+
+class Item(PSViewModel):
+    name = ViewModelField()
+    value = ViewModelField()
+
+    def __init__(self, name, value):
+        super().__init__()
+        with self.update(silent=True):
+            self.name = name
+            self.value = value
+
+
+def test_equal_values_are_not_notified():
+    item = Item("a", [1])
+    updates = []
+    item.updated.connect(lambda: updates.append(item.dirty_fields))
+    assert item.dirty_fields == frozenset()
+
+    item.name = "a"
+    item.value = [1]
+    with item.update():
+        item.name = "a"
+    assert updates == []
+
+    with item.update():
+        item.name = "b"
+        item.value = [1]
+    item.value = [2]
+    assert updates == [{"name"}, {"name", "value"}]
+    item.clear_dirty()
+    assert item.dirty_fields == frozenset()
+
+
+def test_changes_are_coalesced_per_tick(app):
+    coalescer = PSModelChangeCoalescer()
+    indexer = SongsIndexer(coalescer)
+    models = indexer.add_many([transport(id) for id in range(200)]).objects
+    batches = []
+    coalescer.models_changed.connect(
+        lambda models: batches.append([(model.id, model.dirty_fields) for model in models])
+    )
+    # creation is silent
+    assert coalescer.pending_count == 0
+
+    indexer.add_many([transport(id, liked=id % 2 == 0) for id in range(200)])
+    models[7].name = "renamed"
+    models[6].name = "renamed"
+    assert coalescer.pending_count == 101
+    wait_until(lambda: batches)
+    assert len(batches) == 1
+    assert len(batches[0]) == 101
+    assert batches[0][3] == (6, {"liked", "name"})
+    assert batches[0][-1] == (7, {"name"})
+    assert models[7].dirty_fields == frozenset()
+
+    models[1].name = "other"
+    coalescer.flush()
+    assert batches[1] == [(1, {"name"})]
+
+
+def test_compact_models_share_notifier(app):
+    indexer = CompactSongsIndexer()
+    models = indexer.add_many([transport(id) for id in range(10)]).objects
+    assert not hasattr(models[0], "__dict__")
+    batches = []
+    indexer.notifier.changed.connect(batches.append)
+    adapter = PSCompactModelAdapter(models[4])
+    updates = []
+    adapter.updated.connect(lambda: updates.append(adapter.name))
+
+    indexer.add_many([transport(id, liked=id > 5) for id in range(10)])
+    indexer.add(transport(3, name="renamed"))
+    models[2].liked = False
+    assert indexer.notifier.pending_count == 5
+    wait_until(lambda: batches)
+    assert batches == [[6, 7, 8, 9, 3]]
+    assert updates == []
+
+    indexer.add(transport(4, name="renamed"))
+    wait_until(lambda: len(batches) == 2)
+    assert updates == ["renamed"]
+    assert adapter.liked is False
+
+    # models are not kept by the indexer or the notifier
+    del models, adapter
+    assert indexer.get(4) is None
+
+
+def test_compact_field_needs_slot():
+    # python before 3.12 wraps errors of __set_name__ in RuntimeError
+    with pytest.raises((TypeError, RuntimeError)):
+        class NoSlot(CompactViewModel):
+            __slots__ = ()
+            name = CompactField()
@@ -0,0 +1,39 @@
+"""
+Module contains helpers for opaque pagination cursors
+functions:
+    encode_cursor - packs list of sort key values into a url-safe string
+    decode_cursor - unpacks string made by encode_cursor
+"""
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import List, Any
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Packs sort key values of the last item of a page into a string
+    that is passed back to get the next page
+
+    :param values: json serializable sort key values
+    :return: cursor string
+    """
+    return urlsafe_b64encode(
+        json.dumps(values, separators=(",", ":")).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Unpacks cursor made by encode_cursor
+
+    :param cursor: cursor string
+    :return: sort key values
+    :raises ValueError: cursor is malformed
+    """
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Malformed cursor `{cursor}`") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Malformed cursor `{cursor}`")
+    return values
@@ -0,0 +1,37 @@
+"""
+Module contains helpers to estimate memory taken by objects
+functions:
+    approximate_size - bytes taken by an object and everything it refers to
+"""
+import sys
+from dataclasses import fields, is_dataclass
+from typing import Any
+
+
+def approximate_size(obj: Any) -> int:
+    """
+    Rough number of bytes taken by an object along with the containers,
+    dataclass fields and strings it refers to. Object referenced several
+    times is counted once. Meant for transport items, other objects are
+    counted without their attributes
+
+    :param obj: object to measure
+    :return: number of bytes
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif is_dataclass(obj) and not isinstance(obj, type):
+            stack.extend(getattr(obj, field.name) for field in fields(obj))
+    return size